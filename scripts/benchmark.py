@@ -0,0 +1,15 @@
+"""Accuracy vs throughput benchmark over tests/testdata/annotated_imgs, e.g. to pick the fastest settings that keep the
+same accuracy, or check that changing the defaults doesn't make OCR less accurate:
+
+    python scripts/benchmark.py --batch-sizes 1 5 10 --threads 1 4 --output benchmark.md --max-cer 0.02
+
+See python scripts/benchmark.py --help for all options. Not to be run inside Anki.
+"""
+import logging
+
+from anki_ocr.benchmark import main
+
+if __name__ == "__main__":
+    logging_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    logging.basicConfig(format=logging_format, level=logging.INFO)
+    raise SystemExit(main())
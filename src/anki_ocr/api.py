@@ -1,21 +1,51 @@
+import json
 from copy import deepcopy
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import Any, Dict, Iterator, List, Optional
 
 from anki.collection import Collection
 from anki.notes import Note, NoteId
+from anki.utils import ids2str
 from bs4 import BeautifulSoup
 
-from anki_ocr.utils import create_logger
+from anki_ocr.notetypes import NotetypeRegistry
+from anki_ocr.targeting import TargetingRules
+from anki_ocr.utils import batch, create_logger
 
 VENDOR_DIR = Path(__file__).parent / "_vendor"
 logger = create_logger(__name__)
 
+# Notes loaded and parsed at a time by NotesQuery, which bounds the memory used by a run however many notes it has
+NOTES_CHUNK_SIZE = 500
+# Where OCR text is stored, see OCRNote.add_imgdata_to_note()
+TEXT_OUTPUT_LOCATIONS = ["tooltip", "new_field", "existing_field", "sidecar"]
+OCR_FIELD_NAME = "OCR"
+# Added to img tags given OCR text in their title attr by the tooltip text output location
+OCR_MARKER_ATTR = "data-ocr"
+
 
 # TODO potentially use https://github.com/pydanny/cached-property ?
 
 
+@dataclass
+class OCRWord:
+    text: str
+    conf: float  # Tesseract confidence, 0 - 100
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+@dataclass
+class OCRPage:
+    """OCR result for a single image"""
+
+    text: str
+    words: Optional[List[OCRWord]] = None  # Only available from TSV output
+
+
 @dataclass
 class OCRImage:
     name: str  # E.g. Coronary_arteries
@@ -24,6 +54,7 @@ class OCRImage:
     field_name: str
     media_dir: str  # media dir of collection
     text: Optional[str] = None  # Where OCR'd text will be stored
+    words: Optional[List[OCRWord]] = None  # Word boxes, if requested with TSV output
 
     @property
     def img_pth(self) -> Path:
@@ -36,36 +67,49 @@ class OCRField:
     field_text: str
     media_dir: str
     note_id: int
+    targeting: Optional[TargetingRules] = None  # Images excluded by these rules aren't parsed into images
     allowed_img_formats = [".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".jfif", ".pnm"]
 
     def __post_init__(self):
+        self.skipped_images: List[str] = []  # Srcs of images that can't be OCR'd, e.g. missing from the media dir
+        self.excluded_images: List[str] = []  # Srcs of images excluded by the targeting rules
         self.images = self.parse_images()
 
     def parse_images(self) -> List[OCRImage]:
+        if self.targeting is not None and not self.targeting.matches_field(self.field_name):
+            return []
         soup = BeautifulSoup(self.field_text, "html.parser")
         images = []
         for img in soup.find_all("img"):
+            src = img.get("src")
+            if not isinstance(src, str):
+                logger.warning(f'Could not find img["src"] for img={img}')
+                continue
             img_pth = None
             try:
-                img_pth = Path(img["src"])
+                img_pth = Path(src)
                 full_pth = Path(self.media_dir, img_pth)
                 if full_pth.exists() is False:
                     logger.warning(
                         f"For note id {self.note_id}, image path '{img_pth.absolute()}' does not exist in media dir"
                     )
+                    self.skipped_images.append(src)
                     continue
             except OSError:
                 logger.warning(f"For note id {self.note_id}, image path {img_pth} is invalid")
-                continue
-            except KeyError:
-                logger.warning(f'Could not find img["src"] for img={img}')
+                self.skipped_images.append(src)
                 continue
 
             if img_pth.suffix in self.allowed_img_formats:
+                reason = self.targeting.exclusion_reason(full_pth) if self.targeting is not None else None
+                if reason is not None:
+                    logger.debug(f"For note id {self.note_id}, not OCRing {img_pth} as {reason}")
+                    self.excluded_images.append(src)
+                    continue
                 images.append(
                     OCRImage(
                         name=img_pth.stem,
-                        src=img.attrs["src"],
+                        src=src,
                         media_dir=self.media_dir,
                         note_id=self.note_id,
                         field_name=self.field_name,
@@ -73,6 +117,7 @@ class OCRField:
                 )
             else:
                 logger.warning(f"For note id {self.note_id}, ignoring unsupported image: {img_pth}")
+                self.skipped_images.append(src)
 
         return images
 
@@ -81,7 +126,14 @@ class OCRField:
         for ocr_img in self.images:
             html_tags = soup.find_all(name="img", attrs={"src": ocr_img.src})
             for html_tag in html_tags:
-                html_tag.attrs["title"] = ocr_img.text
+                html_tag.attrs["title"] = ocr_img.text or ""
+                # Tells the addon's titles apart from any the user wrote, so only these are removed
+                html_tag.attrs[OCR_MARKER_ATTR] = ""
+                if ocr_img.words is not None:
+                    # Allows highlighting words on hover, as [[text, left, top, width, height], ...]
+                    html_tag.attrs["data-ocr-words"] = json.dumps(
+                        [[w.text, w.left, w.top, w.width, w.height] for w in ocr_img.words], separators=(",", ":")
+                    )
 
         self.field_text = str(soup)
 
@@ -92,6 +144,8 @@ class OCRField:
             for html_tag in html_tags:
                 if html_tag.attrs.get("title") is not None:
                     del html_tag.attrs["title"]
+                html_tag.attrs.pop("data-ocr-words", None)
+                html_tag.attrs.pop(OCR_MARKER_ATTR, None)
             del ocr_image.text
         self.field_text = str(soup)
 
@@ -100,50 +154,63 @@ class OCRField:
 class OCRNote:
     note_id: NoteId
     col: Collection
-    field_images: Optional[List[OCRField]] = None
+    field_images: List[OCRField] = field(default_factory=list)
+    registry: Optional[NotetypeRegistry] = None  # Shared by all notes in a NotesQuery
+    targeting: Optional[TargetingRules] = None
+    mid: int = 0  # Notetype id, kept up to date when the addon changes it
+    changed: bool = False  # Whether add_imgdata_to_note() changed the note
 
     @property
     def note(self) -> Note:
         return self.col.get_note(self.note_id)
 
     def __post_init__(self):
+        if self.registry is None:
+            self.registry = NotetypeRegistry(self.col)
         self.field_images = self._get_field_images()
 
-    def _get_field_images(self) -> List[OCRField]:
+    def _get_field_images(self, note: Optional[Note] = None) -> List[OCRField]:
+        note = note or self.note
+        self.mid = note.mid
         images = []
-        for field_name, field_text in self.note.items():
+        for field_name, field_text in note.items():
             images.append(
                 OCRField(
-                    field_name=field_name, field_text=field_text, media_dir=self.col.media.dir(), note_id=self.note_id
+                    field_name=field_name,
+                    field_text=field_text,
+                    media_dir=self.col.media.dir(),
+                    note_id=self.note_id,
+                    targeting=self.targeting,
                 )
             )
 
         return images
 
+    @property
+    def is_processed(self) -> bool:
+        """True once every image in the note has been OCR'd, False e.g. if the run stopped at its time limit"""
+        return all(image.text is not None for field in self.field_images for image in field.images)
+
     @property
     def has_OCR_field(self) -> bool:
-        note_type = self.note.note_type()
-        return note_type["name"].endswith("_OCR") if note_type is not None else False
+        assert self.registry is not None
+        return self.registry.is_ocr_model(self.mid)
 
     def convert_note_to_OCR(self) -> None:
         # TODO Change this to process multiple note IDs at once - using col.models.change_notetype
-        orig_model = self.note.note_type()
-        if orig_model is None:
-            raise ValueError(f"Note id {self.note_id} does not have a note type")
-
+        assert self.registry is not None
         if self.has_OCR_field:
             logger.info("Note is already an OCR-type, no need to convert")
             return
 
-        ocr_model_name = orig_model["name"] + "_OCR"
-        if ocr_model_name in self.col.models.all_names_and_ids():
-            logger.debug(f"Model already exists, using '{ocr_model_name}'")
-            ocr_model = self.col.models.by_name(ocr_model_name)
+        orig_model = self.registry.model(self.mid)
+        ocr_mid = self.registry.ocr_model_id_for(self.mid)
+        if ocr_mid is not None:
+            logger.debug(f"Model already exists, using '{self.registry.name(ocr_mid)}'")
         else:
-            logger.info(f"Creating new model named '{ocr_model_name}'")
-            ocr_model = self.create_OCR_notemodel(orig_model)
-            self.add_model_to_db(ocr_model=ocr_model)
-        assert ocr_model is not None
+            logger.info(f"Creating new model named '{orig_model['name']}_OCR'")
+            ocr_mid = self.add_model_to_db(self.create_OCR_notemodel(orig_model))
+        ocr_model = self.registry.model(ocr_mid)
 
         field_mapping = {i: i for i in range(len(orig_model["flds"]))}
         card_mapping = {i: i for i in range(len(self.note.cards()))}
@@ -154,37 +221,29 @@ class OCRNote:
             fmap=field_mapping,  # type: ignore[arg-type]
             cmap=card_mapping,  # type: ignore[arg-type]
         )
-        self.col.models.save(ocr_model)
-        self.col.models.flush()
+        self.mid = ocr_mid
 
     def remove_OCR_text(self):
+        assert self.registry is not None
         note = self.note
         if self.has_OCR_field:
             print("Removing OCR Field from note")
-            ocr_model = note.note_type()
-            if ocr_model is None:
-                raise ValueError(f"Note id {self.note_id} does not have a note type")
-            ocr_model_name = ocr_model["name"]
-            orig_model_name = ocr_model_name.replace("_OCR", "")
-
-            if orig_model_name in self.col.models.all_names_and_ids():
-                logger.debug(f"Original Model already exists, using '{orig_model_name}'")
-                orig_model = self.col.models.by_name(orig_model_name)
+            ocr_model = self.registry.model(self.mid)
+            orig_mid = self.registry.orig_model_id_for(self.mid)
+            if orig_mid is not None:
+                logger.debug(f"Original Model already exists, using '{self.registry.name(orig_mid)}'")
             else:
-                logger.info(f"Creating new (original) model named '{orig_model_name}'")
-                orig_model = self.create_orig_notemodel(note.note_type())
-                self.add_model_to_db(ocr_model=orig_model)
+                logger.info(f"Creating new (original) model named '{ocr_model['name'][: -len('_OCR')]}'")
+                orig_mid = self.add_model_to_db(self.create_orig_notemodel(ocr_model))
+            orig_model = self.registry.model(orig_mid)
 
-            field_mapping = {i: i for i in range(len(orig_model["flds"]))}
-            card_mapping = {i: i for i in range(len(note.cards()))}
+            field_mapping: Dict[int, Optional[int]] = {i: i for i in range(len(orig_model["flds"]))}
+            card_mapping: Dict[int, Optional[int]] = {i: i for i in range(len(note.cards()))}
             self.col.models.change(
                 ocr_model, nids=[note.id], newModel=orig_model, fmap=field_mapping, cmap=card_mapping
             )
-            self.col.models.save(m=orig_model)
-            self.col.models.flush()
             note = self.note
-            note.flush()
-            self.field_images = self._get_field_images()
+            self.field_images = self._get_field_images(note)
 
         for field_img in self.field_images:
             print("Removing OCR text from title attr")
@@ -222,13 +281,37 @@ class OCRNote:
         orig_model["tmpls"][0]["name"] = orig_model["tmpls"][0]["name"].replace("_OCR", "")
         return orig_model
 
-    def add_model_to_db(self, ocr_model: Dict):
-        self.col.models.add(ocr_model)
-        self.col.models.save()
-        self.col.models.flush()
+    def add_model_to_db(self, ocr_model: Dict) -> int:
+        """:returns: Id of the new notetype"""
+        assert self.registry is not None
+        return self.registry.add(ocr_model)
 
-    def add_imgdata_to_note(self, method="tooltip"):
+    def ocr_field_text(self) -> str:
+        """:returns: The OCR text of every image, as stored in the OCR field with the new_field method"""
+        text = ""
+        for field_img in self.field_images:
+            for ocr_img in field_img.images:
+                if ocr_img.text != "":
+                    text += f"Image: {ocr_img.name}\n{'-' * 20}\n{ocr_img.text}".replace("\n", "<br/>")
+        return text
+
+    def add_imgdata_to_note(self, method="tooltip", save: bool = True, field_name: str = OCR_FIELD_NAME) -> Note:
+        """Stores the OCR text in the note, with one of TEXT_OUTPUT_LOCATIONS:
+
+        - "tooltip": In the title of each image
+        - "new_field": In an OCR field, added by changing the note to an _OCR copy of its notetype. This changes the
+          collection's schema, so the next sync has to upload the whole collection
+        - "existing_field": In the note's field_name field, as with new_field. Notes without one are left as they are
+        - "sidecar": Not in the note at all, only in the search index next to the collection (see OCR._write_back())
+
+        Sets changed to whether the note differs from before, which it doesn't when run again with the same OCR text.
+        Unchanged notes aren't saved, so their modification time stays the same and they aren't uploaded by the next
+        sync.
+
+        :param save: If False, the note is returned without being saved, so many notes can be saved in one transaction
+        """
         note = self.note
+        original_mid, original_fields = note.mid, list(note.fields)
         if method == "tooltip":
             for field_img in self.field_images:
                 field_img.insert_ocr_text()
@@ -238,31 +321,102 @@ class OCRNote:
             if self.has_OCR_field is False:
                 self.convert_note_to_OCR()
                 note = self.note
-            note["OCR"] = ""
-            for field_img in self.field_images:
-                for ocr_img in field_img.images:
-                    if ocr_img.text != "":
-                        note["OCR"] += f"Image: {ocr_img.name}\n{'-' * 20}\n{ocr_img.text}".replace("\n", "<br/>")
-        else:
-            raise ValueError(f"method {method} not valid. Only 'new_field' and 'tooltip' (default) are allowed.")
-        note.flush()
-        self.col.save()
+            note[OCR_FIELD_NAME] = self.ocr_field_text()
+
+        elif method == "existing_field":
+            if field_name in note:
+                note[field_name] = self.ocr_field_text()
+            else:
+                logger.warning(f"Note {self.note_id} has no '{field_name}' field to store its OCR text in, skipping")
+
+        elif method != "sidecar":
+            raise ValueError(f"method {method} not valid. Only {TEXT_OUTPUT_LOCATIONS} are allowed.")
+        self.changed = note.mid != original_mid or note.fields != original_fields
+        if save and self.changed:
+            note.flush()
+            self.col.save()
+        return note
 
 
 @dataclass
 class NotesQuery:
-    """Represents a collection of Notes from a query of the Collection db"""
+    """Represents a collection of Notes from a query of the Collection db.
+
+    Notes without any images, or of notetypes excluded by the targeting rules, are dropped up front by a single SQL
+    query, without loading them. The rest are only loaded and parsed as they are iterated over, chunk_size notes at a
+    time, so a large selection isn't all held in memory at once. Iterating again loads the notes again, unless they've
+    been loaded all at once with notes.
+    """
 
     col: Collection
     note_ids: List[NoteId]
-    notes: List[OCRNote] = None
-    notes_to_process: List[OCRNote] = None
+    chunk_size: int = NOTES_CHUNK_SIZE
+    targeting: Optional[TargetingRules] = None  # Which images to OCR, every image if None
+    # Notes with all their images OCR'd, in the order they were processed
+    processed_note_ids: List[NoteId] = field(default_factory=list)
+    # Those of the processed notes which were changed and saved, the rest already had the same OCR text
+    changed_note_ids: List[NoteId] = field(default_factory=list)
 
     def __post_init__(self):
-        self.notes = [OCRNote(note_id=nid, col=self.col) for nid in self.note_ids]
+        # Notetypes are loaded once for the whole query, rather than per note
+        self.registry = NotetypeRegistry(self.col)
+        self.image_note_ids = self._with_images(self.note_ids)
+        self._notes: Optional[List[OCRNote]] = None
+
+    def _with_images(self, note_ids: List[NoteId]) -> List[NoteId]:
+        """:returns: The note ids whose fields contain an image, and whose notetype is targeted, in the given order"""
+        if not note_ids:
+            return []
+        notetype_sql = ""
+        if self.targeting is not None and self.targeting.filters_notetypes:
+            mids = [
+                mid
+                for mid in self.registry.names()
+                if self.targeting.matches_notetype(self.registry.orig_name(mid) or "")
+            ]
+            notetype_sql = f" and mid in {ids2str(mids)}"
+        assert self.col.db is not None
+        with_images = set(
+            self.col.db.list(
+                f"select id from notes where id in {ids2str(note_ids)} and flds like ?{notetype_sql}", "%<img%"
+            )
+        )
+        skipped = len(note_ids) - len(with_images)
+        if skipped:
+            logger.debug(f"Skipping {skipped} notes without images, or of notetypes that aren't targeted")
+        return [nid for nid in note_ids if nid in with_images]
+
+    @property
+    def num_skipped(self) -> int:
+        """The number of notes dropped up front, for having no images or being of a notetype that isn't targeted"""
+        return len(self.note_ids) - len(self.image_note_ids)
+
+    def chunks(self) -> Iterator[List[OCRNote]]:
+        """Loads the notes with images, yielding up to chunk_size notes at a time. With targeting rules, notes with no
+        targeted images are left out, so chunks may be smaller or empty
+        """
+        if self._notes is not None:
+            yield from (list(chunk) for chunk in batch(self._notes, self.chunk_size))
+            return
+        for chunk_ids in batch(self.image_note_ids, self.chunk_size):
+            notes = [
+                OCRNote(note_id=nid, col=self.col, registry=self.registry, targeting=self.targeting)
+                for nid in chunk_ids
+            ]
+            if self.targeting is not None:
+                notes = [note for note in notes if any(field.images for field in note.field_images)]
+            yield notes
+
+    @property
+    def notes(self) -> List[OCRNote]:
+        """Every note with images, all loaded at once and kept, so only use this for small queries"""
+        if self._notes is None:
+            self._notes = [note for chunk in self.chunks() for note in chunk]
+        return self._notes
 
     def __len__(self):
-        return len(self.notes)
+        return len(self.image_note_ids)
 
-    def __iter__(self):
-        return self.notes.__iter__()
+    def __iter__(self) -> Iterator[OCRNote]:
+        for chunk in self.chunks():
+            yield from chunk
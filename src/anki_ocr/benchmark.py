@@ -0,0 +1,274 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import TESTDATA_DIR
+from .engines import ENGINES, batch_requests
+from .governor import PeakRSSSampler
+from .ocr import OCR
+from .postprocess import TextCleaner
+from .progress_reporter import ProgressReporter
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+ANNOTATED_IMGS_DIR = TESTDATA_DIR / "annotated_imgs"
+CONFIG_PTH = Path(__file__).parent / "config.json"
+IMAGE_SUFFIXES = [".png", ".jpg", ".jpeg", ".tif", ".tiff"]
+# Text cleaner settings to compare, by name
+CLEANERS: Dict[str, TextCleaner] = {
+    "default": TextCleaner(),
+    "minimal": TextCleaner(normalize_unicode=False, collapse_colons=False),
+    "aggressive": TextCleaner(join_hyphenated_words=True, collapse_whitespace=True),
+}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings, the number of single character insertions, deletions and
+    substitutions to turn a into b
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def char_error_rate(hypothesis: str, reference: str) -> float:
+    """Character error rate (CER) of OCR text against the expected text, 0 for a perfect match. Can be over 1 when the
+    OCR text is much longer than the expected text.
+    """
+    return edit_distance(hypothesis, reference) / max(1, len(reference))
+
+
+@dataclass(frozen=True)
+class BenchmarkSetting:
+    """One combination of OCR settings to benchmark"""
+
+    engine: str = "tesseract"
+    output_format: str = "txt"
+    batch_size: int = 1  # 1 to OCR images one at a time
+    num_threads: int = 1
+    cleaner: str = "default"  # Name in CLEANERS
+
+    @classmethod
+    def from_config(cls, config: dict) -> "BenchmarkSetting":
+        """The addon's defaults (or a user's settings), as set in config.json"""
+        config_cleaner = TextCleaner.from_config(config)
+        cleaner = next((name for name, cleaner in CLEANERS.items() if cleaner == config_cleaner), "default")
+        return cls(
+            engine=config["ocr_engine"],
+            output_format=config["output_format"],
+            batch_size=config["batch_size"] if config["use_batching"] else 1,
+            num_threads=config["num_threads"] if config["use_multithreading"] else 1,
+            cleaner=cleaner,
+        )
+
+    @property
+    def name(self) -> str:
+        return (
+            f"{self.engine} {self.output_format} batch={self.batch_size} threads={self.num_threads} "
+            f"cleaner={self.cleaner}"
+        )
+
+
+@dataclass
+class BenchmarkResult:
+    setting: BenchmarkSetting
+    num_images: int
+    secs: float
+    cer: float  # Over all images, total edits / total expected characters
+    peak_rss_mb: Optional[float]  # Of this process and its tesseract processes together, None if it can't be measured
+    pareto: bool = False  # No other setting is at least as good on every measure and better on one
+    is_default: bool = False
+
+    @property
+    def images_per_sec(self) -> float:
+        return self.num_images / self.secs if self.secs > 0 else float("inf")
+
+    def dominates(self, other: "BenchmarkResult") -> bool:
+        rss, other_rss = self.peak_rss_mb or 0, other.peak_rss_mb or 0
+        at_least_as_good = self.cer <= other.cer and self.images_per_sec >= other.images_per_sec and rss <= other_rss
+        better = self.cer < other.cer or self.images_per_sec > other.images_per_sec or rss < other_rss
+        return at_least_as_good and better
+
+
+def load_annotated_images(img_dir: Path = ANNOTATED_IMGS_DIR) -> List[Tuple[Path, str]]:
+    """:returns: List of (image path, expected text). Images and their .txt annotations are paired in sorted order,
+    as in TestOCR, as their names don't always match
+    """
+    img_pths = sorted(p.absolute() for p in img_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    annot_pths = sorted(p for p in img_dir.iterdir() if p.suffix == ".txt")
+    if len(img_pths) != len(annot_pths):
+        raise ValueError(f"{img_dir} has {len(img_pths)} images but {len(annot_pths)} annotations")
+    return [(img_pth, annot_pth.read_text(encoding="utf-8")) for img_pth, annot_pth in zip(img_pths, annot_pths)]
+
+
+def run_setting(
+    setting: BenchmarkSetting,
+    samples: List[Tuple[Path, str]],
+    *,
+    languages: Optional[List[str]] = None,
+    tesseract_exec_pth: Optional[str] = None,
+    repeat: int = 1,
+) -> BenchmarkResult:
+    """OCRs every sample image repeat times with the given settings, timing only the OCR itself
+
+    :param repeat: Times to OCR each image, more gives more stable throughput on a small set of images
+    """
+    ocr = OCR(
+        col=None,
+        languages=languages,
+        tesseract_exec_pth=tesseract_exec_pth,
+        engine=setting.engine,
+        num_threads=setting.num_threads,
+        use_multithreading=True,
+        batch_size=setting.batch_size,
+        use_batching=setting.batch_size > 1,
+        output_format=setting.output_format,
+        text_cleaner=CLEANERS[setting.cleaner],
+    )
+    ocr.reporter = ProgressReporter()  # No progress bars, they would be mixed in with the benchmark's output
+    expected = {str(img_pth): text.strip() for img_pth, text in samples}
+    img_pths = [str(img_pth) for img_pth, _ in samples] * repeat
+    requests = batch_requests(img_pths, setting.batch_size if ocr.use_batching else 1)
+
+    with PeakRSSSampler() as sampler:
+        start = time.perf_counter()
+        results = ocr._run_engine(requests)
+        secs = time.perf_counter() - start
+
+    edits = 0
+    expected_chars = 0
+    for request in requests:
+        pages = ocr._split_pages(results[request.key])
+        for i, img_pth in enumerate(request.images):
+            text = ocr.text_cleaner.clean(pages[i].text).strip() if i < len(pages) else ""
+            edits += edit_distance(text, expected[img_pth])
+            expected_chars += len(expected[img_pth])
+    return BenchmarkResult(
+        setting=setting,
+        num_images=len(img_pths),
+        secs=secs,
+        cer=edits / max(1, expected_chars),
+        peak_rss_mb=sampler.peak_rss_mb,
+    )
+
+
+def settings_grid(
+    engines: Sequence[str] = ("tesseract",),
+    output_formats: Sequence[str] = ("txt",),
+    batch_sizes: Sequence[int] = (1,),
+    threads: Sequence[int] = (1,),
+    cleaners: Sequence[str] = ("default",),
+) -> List[BenchmarkSetting]:
+    """:returns: Every combination of the given settings"""
+    return [
+        BenchmarkSetting(engine=e, output_format=f, batch_size=b, num_threads=t, cleaner=c)
+        for e, f, b, t, c in itertools.product(engines, output_formats, batch_sizes, threads, cleaners)
+    ]
+
+
+def mark_pareto(results: List[BenchmarkResult]) -> List[BenchmarkResult]:
+    """Marks the results on the Pareto front of error rate, throughput and memory use"""
+    for result in results:
+        result.pareto = not any(other.dominates(result) for other in results if other is not result)
+    return results
+
+
+def format_table(results: List[BenchmarkResult]) -> str:
+    """:returns: Markdown table of results, most accurate first, with the Pareto optimal settings marked with *"""
+    lines = [
+        "| Setting | CER | Images/s | Peak RSS (MB) | Pareto |",
+        "| --- | ---: | ---: | ---: | :---: |",
+    ]
+    for result in sorted(results, key=lambda r: (r.cer, -r.images_per_sec)):
+        name = f"{result.setting.name} (defaults)" if result.is_default else result.setting.name
+        rss = f"{result.peak_rss_mb:.0f}" if result.peak_rss_mb is not None else "-"
+        pareto = "*" if result.pareto else ""
+        lines.append(f"| {name} | {result.cer:.2%} | {result.images_per_sec:.2f} | {rss} | {pareto} |")
+    return "\n".join(lines) + "\n"
+
+
+def run_benchmark(
+    settings: List[BenchmarkSetting],
+    samples: List[Tuple[Path, str]],
+    *,
+    default_setting: Optional[BenchmarkSetting] = None,
+    **kwargs,
+) -> List[BenchmarkResult]:
+    """Benchmarks every setting, plus the default setting if it isn't one of them
+
+    :param kwargs: Passed to run_setting()
+    """
+    settings = list(dict.fromkeys(settings))
+    if default_setting is not None and default_setting not in settings:
+        settings.append(default_setting)
+    results = []
+    for i, setting in enumerate(settings, 1):
+        logger.info(f"Benchmarking {i}/{len(settings)}: {setting.name}")
+        result = run_setting(setting, samples, **kwargs)
+        result.is_default = setting == default_setting
+        results.append(result)
+    return mark_pareto(results)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks OCR accuracy (character error rate) against throughput and memory use, for every "
+        "combination of the given settings, over a folder of images with .txt annotations of their expected text.",
+    )
+    parser.add_argument("--images", type=Path, default=ANNOTATED_IMGS_DIR, help="Folder of annotated images")
+    parser.add_argument("--engines", nargs="+", default=["tesseract"], choices=sorted(ENGINES))
+    parser.add_argument("--output-formats", nargs="+", default=["txt"], choices=["txt", "tsv"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--cleaners", nargs="+", default=["default"], choices=sorted(CLEANERS))
+    parser.add_argument("--languages", nargs="+", default=["eng"])
+    parser.add_argument("--repeat", type=int, default=5, help="Times to OCR each image")
+    parser.add_argument("--tesseract", help="Path to the tesseract executable, found automatically by default")
+    parser.add_argument("--output", type=Path, help="Also write the table to this markdown file")
+    parser.add_argument(
+        "--max-cer",
+        type=float,
+        help="Exit with an error if the addon's default settings have a higher character error rate than this, "
+        "e.g. 0.02 for 2%%",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    default_setting = BenchmarkSetting.from_config(json.loads(CONFIG_PTH.read_text(encoding="utf-8")))
+    settings = settings_grid(args.engines, args.output_formats, args.batch_sizes, args.threads, args.cleaners)
+    results = run_benchmark(
+        settings,
+        load_annotated_images(args.images),
+        default_setting=default_setting,
+        languages=args.languages,
+        tesseract_exec_pth=args.tesseract,
+        repeat=args.repeat,
+    )
+    table = format_table(results)
+    print(table)
+    if args.output is not None:
+        args.output.write_text(table, encoding="utf-8")
+
+    default_result = next(r for r in results if r.is_default)
+    if args.max_cer is not None and default_result.cer > args.max_cer:
+        print(f"The default settings have a CER of {default_result.cer:.2%}, over the maximum of {args.max_cer:.2%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from os import PathLike
+from typing import Any, Dict, List, Optional, Union
+
+from bs4 import BeautifulSoup
+
+from .api import OCR_FIELD_NAME, OCRImage, OCRNote, OCRWord
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+BUNDLE_FORMAT = "anki_ocr_bundle"
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = ".ocr.json.gz"
+# Text in the OCR field of new_field notes, see OCRNote.add_imgdata_to_note()
+OCR_FIELD_IMAGE_RE = re.compile(r"Image: (.*?)<br/>-{20}<br/>(.*?)(?=Image: .*?<br/>-{20}<br/>|$)", re.DOTALL)
+
+
+def media_hash(img_pth: Union[str, PathLike], chunk_size: int = 1 << 16) -> str:
+    """SHA-1 of the contents of a media file, so results can be matched across collections whatever the file is named"""
+    sha1 = hashlib.sha1()
+    with open(img_pth, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def data_hash(data: Union[bytes, bytearray, memoryview]) -> str:
+    """The same as media_hash() of a file with these contents"""
+    return hashlib.sha1(data).hexdigest()
+
+
+@dataclass
+class BundleEntry:
+    text: str
+    # Word boxes as [[text, left, top, width, height], ...], the same as the data-ocr-words attribute
+    words: Optional[List[List[Any]]] = None
+
+    @classmethod
+    def from_image(cls, image: OCRImage) -> "BundleEntry":
+        return cls.from_page(image.text or "", image.words)
+
+    @classmethod
+    def from_page(cls, text: str, words: Optional[List[OCRWord]] = None) -> "BundleEntry":
+        if words is None:
+            return cls(text=text)
+        return cls(text=text, words=[[w.text, w.left, w.top, w.width, w.height] for w in words])
+
+    def apply(self, image: OCRImage):
+        image.text = self.text
+        image.words = None
+        if self.words is not None:
+            # Confidences aren't kept in notes, so aren't known for exported words
+            image.words = [
+                OCRWord(text=text, conf=-1, left=left, top=top, width=width, height=height)
+                for text, left, top, width, height in self.words
+            ]
+
+
+@dataclass
+class OCRBundle:
+    """Portable OCR results, keyed by the hash of each image's contents, for OCRing a shared deck once and importing
+    the results on other machines without running tesseract.
+
+    The fingerprint records the engine and settings used, as results are only interchangeable between the same ones.
+    Saved as gzipped JSON.
+    """
+
+    fingerprint: Dict[str, Any]
+    results: Dict[str, BundleEntry] = field(default_factory=dict)  # Media hash -> OCR result
+
+    def __len__(self):
+        return len(self.results)
+
+    def add(self, image: OCRImage):
+        self.results[media_hash(image.img_pth)] = BundleEntry.from_image(image)
+
+    def get(self, image: OCRImage) -> Optional[BundleEntry]:
+        try:
+            return self.results.get(media_hash(image.img_pth))
+        except OSError as e:
+            logger.warning(f"Could not read {image.img_pth}: {e}")
+            return None
+
+    def fingerprint_differences(self, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+        """:returns: Dict of setting -> (bundle value, given value), for every setting that differs"""
+        keys = self.fingerprint.keys() | fingerprint.keys()
+        return {
+            key: (self.fingerprint.get(key), fingerprint.get(key))
+            for key in sorted(keys)
+            if self.fingerprint.get(key) != fingerprint.get(key)
+        }
+
+    def save(self, path: Union[str, PathLike]):
+        data = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "fingerprint": self.fingerprint,
+            "results": {
+                key: {"text": entry.text, "words": entry.words} if entry.words is not None else {"text": entry.text}
+                for key, entry in self.results.items()
+            },
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: Union[str, PathLike]) -> "OCRBundle":
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, EOFError, ValueError) as e:
+            raise ValueError(f"{path} is not an OCR bundle: {e}") from e
+        if not isinstance(data, dict) or data.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{path} is not an OCR bundle")
+        if data.get("version", 0) > BUNDLE_VERSION:
+            raise ValueError(f"{path} was made by a newer version of AnkiOCR, please update the addon")
+        results = {key: BundleEntry(text=r["text"], words=r.get("words")) for key, r in data["results"].items()}
+        return cls(fingerprint=data["fingerprint"], results=results)
+
+
+def read_ocr_results(
+    note: OCRNote, field_name: str = OCR_FIELD_NAME, sidecar_texts: Optional[Dict[str, str]] = None
+) -> List[OCRImage]:
+    """Reads the OCR text already stored in a note back into its images, from either the image titles (tooltip), the
+    OCR field (new_field and existing_field) or the search index (sidecar)
+
+    :param sidecar_texts: Dict of image src -> OCR text of the note's images in the search index
+    :returns: The images of the note which have OCR text
+    """
+    images = []
+    anki_note = note.note
+    ocr_field = anki_note[field_name] if field_name in anki_note else ""
+    field_texts = {name: text.replace("<br/>", "\n") for name, text in OCR_FIELD_IMAGE_RE.findall(ocr_field)}
+    for field_img in note.field_images:
+        soup = BeautifulSoup(field_img.field_text, "html.parser")
+        for image in field_img.images:
+            tag = soup.find(name="img", attrs={"src": image.src})
+            title = tag.get("title") if tag is not None else None
+            if tag is not None and isinstance(title, str):
+                entry = BundleEntry(text=title)
+                words = tag.get("data-ocr-words")
+                if isinstance(words, str):
+                    entry.words = json.loads(words)
+                entry.apply(image)
+            elif image.name in field_texts:
+                image.text = field_texts[image.name]
+            elif sidecar_texts and image.src in sidecar_texts:
+                image.text = sidecar_texts[image.src]
+            else:
+                continue
+            images.append(image)
+    return images
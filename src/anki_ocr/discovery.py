@@ -0,0 +1,137 @@
+import hashlib
+import os
+import platform
+import shutil
+import subprocess
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import pytesseract
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+MODULE_DIR = Path(__file__).parent
+DEPS_DIR = MODULE_DIR / "deps"
+TESSDATA_DIR = DEPS_DIR / "tessdata"
+
+# Installs discovered in this process, keyed by the user override path (None when auto-detected)
+_INSTALLS: Dict[Optional[str], "TesseractInstall"] = {}
+
+
+@dataclass
+class TesseractInstall:
+    """A discovered tesseract installation, which can be cached in the addon config between Anki sessions"""
+
+    exec_path: str
+    version: str
+    tessdata_dir: str
+    languages: List[str] = field(default_factory=list)
+    stamp: str = ""  # Changes whenever the executable, tessdata, addon version or PATH changes
+
+    def is_valid(self) -> bool:
+        return self.stamp != "" and self.stamp == install_stamp(self.exec_path, self.tessdata_dir)
+
+    def to_config(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_config(cls, data: Optional[Dict]) -> Optional["TesseractInstall"]:
+        if not data:
+            return None
+        try:
+            return cls(**data)
+        except TypeError:
+            logger.warning(f"Ignoring invalid cached tesseract install: {data}")
+            return None
+
+
+def install_stamp(exec_path: str, tessdata_dir: str) -> str:
+    """Validity stamp of an installation, or an empty string if the executable no longer exists"""
+    from . import __version__
+
+    try:
+        exec_stat = os.stat(exec_path)
+        tessdata_mtime = os.stat(tessdata_dir).st_mtime_ns
+    except OSError:
+        return ""
+    parts = [
+        __version__,
+        platform.system(),
+        os.environ.get("PATH", ""),
+        str(exec_stat.st_size),
+        str(exec_stat.st_mtime_ns),
+        str(tessdata_mtime),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def path_to_tesseract() -> str:
+    platform_name = platform.system()  # E.g. 'Windows'
+
+    exec_data = {
+        "Windows": str(Path(DEPS_DIR, "win", "tesseract", "tesseract.exe")),
+        "Darwin": str(Path(DEPS_DIR, "mac", "tesseract", "4.1.1", "bin", "tesseract")),
+    }
+    if platform_name == "Linux":
+        tess_path = shutil.which("tesseract") or "tesseract"
+    else:
+        tess_path = exec_data[platform_name]
+
+    if not Path(tess_path).exists():
+        raise FileNotFoundError(f"Could not find tesseract executable at {tess_path}")
+    return tess_path
+
+
+def set_tesseract_exe_permission(tess_pth: str):
+    if platform.system() == "Darwin":
+        logger.info(f"Setting +x permission to {tess_pth}")
+        subprocess.run(["chmod", "+x", tess_pth], check=False)
+
+
+def discover_tesseract(tesseract_exec_pth: Optional[str] = None) -> TesseractInstall:
+    """Finds the tesseract executable, and queries its version and installed languages. Slow, as it runs tesseract."""
+    exec_path = tesseract_exec_pth or path_to_tesseract()
+    if tesseract_exec_pth is None:
+        set_tesseract_exe_permission(exec_path)
+
+    pytesseract.tesseract_cmd = exec_path
+    tessdata_dir = str(TESSDATA_DIR.absolute())
+    # Bypass pytesseract's run_once, as the executable may have changed since it was first called
+    version = pytesseract.get_tesseract_version.__wrapped__()
+    languages = pytesseract.get_languages.__wrapped__(config=f'--tessdata-dir "{tessdata_dir}"')
+    logger.info(f"Found tesseract {version} at {exec_path}, with languages {languages}")
+    return TesseractInstall(
+        exec_path=exec_path,
+        version=str(version).strip(),
+        tessdata_dir=tessdata_dir,
+        languages=languages,
+        stamp=install_stamp(exec_path, tessdata_dir),
+    )
+
+
+def find_tesseract(
+    tesseract_exec_pth: Optional[str] = None, cached: Optional[TesseractInstall] = None
+) -> TesseractInstall:
+    """Returns the tesseract installation, only running discover_tesseract() once per process.
+
+    :param tesseract_exec_pth: User override of the tesseract executable path, else it is auto-detected
+    :param cached: Installation cached from a previous session, used as-is if it is still valid
+    """
+    install = _INSTALLS.get(tesseract_exec_pth)
+    if install is None:
+        override_matches = tesseract_exec_pth is None or (cached and cached.exec_path == tesseract_exec_pth)
+        if cached is not None and override_matches and cached.is_valid():
+            logger.debug(f"Using cached tesseract install at {cached.exec_path}")
+            install = cached
+        else:
+            install = discover_tesseract(tesseract_exec_pth)
+        _INSTALLS[tesseract_exec_pth] = install
+
+    pytesseract.tesseract_cmd = install.exec_path
+    return install
+
+
+def clear_cache():
+    _INSTALLS.clear()
@@ -0,0 +1,221 @@
+import queue
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Protocol, Sequence
+
+from .discovery import TesseractInstall, find_tesseract
+from .governor import ResourceGovernor
+from .pytesseract import ImageData
+from .runner import OUTPUT_FORMATS, TesseractRunner
+from .utils import batch, create_logger
+
+logger = create_logger(__name__)
+
+# Called as (key, raw_output) as each request finishes. Raising inside the callback cancels the rest of the requests
+RequestCallback = Callable[[str, str], None]
+
+
+@dataclass(frozen=True)
+class EngineCapabilities:
+    """What an engine can do, and what it costs, so OCR can plan the work to suit it"""
+
+    supports_batching: bool  # Can OCR several images in one request more cheaply than one at a time
+    max_concurrency: int = 0  # Most requests that can run at once, 0 for one per core
+    warmup_secs: float = 0  # Fixed cost of each request, e.g. starting a process and loading models
+    output_formats: FrozenSet[str] = frozenset({"txt"})
+
+
+@dataclass
+class OCRRequest:
+    """One or more images to OCR together, with results keyed by key"""
+
+    key: str
+    images: List[str]
+    lang: Optional[str] = None  # Languages for this request, if not the default for the run
+    # Contents of the request's only image, which is OCR'd from memory rather than read from disk. images then just
+    # holds its name
+    data: Optional[ImageData] = None
+
+
+class OCRResult(NamedTuple):
+    key: str
+    output: str  # Tesseract compatible output, with the pages of batched images separated by PAGE_SEPARATOR
+
+
+def batch_requests(img_pths: List[str], batch_size: int) -> List[OCRRequest]:
+    """:returns: A request per batch of up to batch_size images, or a request per image if batch_size is 1"""
+    if batch_size > 1:
+        return [OCRRequest(key=f"batch_{i}", images=list(imgs)) for i, imgs in enumerate(batch(img_pths, batch_size))]
+    return [OCRRequest(key=f"image_{i}", images=[img]) for i, img in enumerate(img_pths)]
+
+
+class OCREngine(Protocol):
+    """Interface for OCR engines, implemented by TesseractCLIEngine.
+
+    Engines are created by name with create_engine(), from the engines registered with register_engine(). Outputs are
+    in tesseract's formats ("txt", "tsv", "osd"), so the rest of the addon (scheduling, parsing and writing OCR text
+    back to notes) works the same for every engine.
+    """
+
+    name: str
+    capabilities: EngineCapabilities
+
+    @property
+    def version(self) -> str:
+        """Recorded with OCR results, as they're only interchangeable between the same engine and version"""
+        ...
+
+    def ocr_many(
+        self,
+        requests: Sequence[OCRRequest],
+        *,
+        lang: str,
+        output_format: str = "txt",
+        on_result: Optional[RequestCallback] = None,
+    ) -> Iterator[OCRResult]:
+        """OCRs every request, yielding results as they become available, in any order. Requests with data are
+        OCR'd from memory
+
+        :param lang: Default languages, in tesseract's format (e.g. "eng+deu"), for requests without their own
+        """
+        ...
+
+    def cancel(self):
+        """Cancels a running ocr_many() call. Safe to call from any thread."""
+        ...
+
+
+class TesseractCLIEngine:
+    """Runs a tesseract process per request, concurrently with asyncio. Batches are passed to tesseract as a text file
+    listing the image paths, which tesseract OCRs one after the other with its models loaded once.
+
+    The processes are run from their own thread, so each result is yielded as soon as its process exits, while the rest
+    are still running.
+    """
+
+    name = "tesseract"
+    capabilities = EngineCapabilities(
+        supports_batching=True,
+        warmup_secs=0.2,  # Process start up and loading traineddata, roughly for eng
+        output_formats=frozenset(OUTPUT_FORMATS),
+    )
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        timeout: float = 0,
+        nice: int = 0,
+        governor: Optional[ResourceGovernor] = None,
+        config: str = "",
+        tesseract_exec_pth: Optional[str] = None,
+        **_kwargs,
+    ):
+        """
+        :param config: Extra tesseract command line arguments, e.g. --tessdata-dir
+        :param tesseract_exec_pth: User override of the tesseract executable path, else it is auto-detected
+        """
+        self.config = config
+        self.tesseract_exec_pth = tesseract_exec_pth
+        self.runner = TesseractRunner(max_concurrency=max_concurrency, timeout=timeout, nice=nice, governor=governor)
+
+    @property
+    def install(self) -> TesseractInstall:
+        return find_tesseract(self.tesseract_exec_pth)
+
+    @property
+    def version(self) -> str:
+        return self.install.version
+
+    def ocr_many(
+        self,
+        requests: Sequence[OCRRequest],
+        *,
+        lang: str,
+        output_format: str = "txt",
+        on_result: Optional[RequestCallback] = None,
+    ) -> Iterator[OCRResult]:
+        with tempfile.TemporaryDirectory() as list_dir:
+            keys: Dict[str, str] = {}  # Tesseract input -> request key
+            langs: Dict[str, str] = {}
+            image_data: Dict[str, ImageData] = {}
+            for i, request in enumerate(requests):
+                input_pth = request.images[0]
+                if request.data is not None:
+                    input_pth = f"image_data_{i}"
+                    image_data[input_pth] = request.data
+                # An image used by several requests can't be passed directly more than once, as results are keyed by
+                # input
+                elif len(request.images) > 1 or input_pth in keys:
+                    input_pth = str(Path(list_dir, f"batch_imgs_{i}.txt"))
+                    Path(input_pth).write_text("\n".join(request.images))
+                keys[input_pth] = request.key
+                if request.lang is not None:
+                    langs[input_pth] = request.lang
+
+            # Results as each process exits, then None once the run has ended
+            finished: "queue.Queue[Optional[OCRResult]]" = queue.Queue()
+            errors: List[BaseException] = []
+
+            def runner_callback(input_pth: str, output: str, _completed: int, _total: int):
+                finished.put(OCRResult(keys[input_pth], output))
+
+            def run():
+                try:
+                    self.runner.run(
+                        list(keys),
+                        lang=lang,
+                        config=self.config,
+                        output_format=output_format,
+                        langs=langs,
+                        on_result=runner_callback,
+                        image_data=image_data,
+                    )
+                except BaseException as e:
+                    errors.append(e)
+                finally:
+                    finished.put(None)
+
+            thread = threading.Thread(target=run, name="anki_ocr_runner", daemon=True)
+            thread.start()
+            ended = False
+            try:
+                while (result := finished.get()) is not None:
+                    # Called in the caller's thread rather than the runner's, so it can update the UI
+                    if on_result is not None:
+                        on_result(*result)
+                    yield result
+                ended = True
+            finally:
+                if not ended:  # The callback raised, or the caller stopped early, so the rest are cancelled
+                    self.runner.cancel()
+                thread.join()
+                if not ended:
+                    self.runner.reset()
+        if errors:
+            raise errors[0]
+
+    def cancel(self):
+        self.runner.cancel()
+
+
+ENGINES: Dict[str, Callable[..., OCREngine]] = {}
+
+
+def register_engine(name: str, factory: Callable[..., OCREngine]):
+    """Makes an engine available by name, for the ocr_engine config option
+
+    :param factory: Called with keyword arguments max_concurrency, timeout, nice, governor, config (tesseract's
+        command line arguments) and tesseract_exec_pth, and should ignore any it doesn't use
+    """
+    ENGINES[name] = factory
+
+
+def create_engine(name: str, **kwargs) -> OCREngine:
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine '{name}', available engines are {sorted(ENGINES)}")
+    return ENGINES[name](**kwargs)
+
+
+register_engine(TesseractCLIEngine.name, TesseractCLIEngine)
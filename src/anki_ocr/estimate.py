@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Set
+
+from .api import OCRNote
+from .bundle import read_ocr_results
+from .image_info import image_size
+from .progress_reporter import format_duration
+from .scheduler import SizeFunc, image_pixels
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+# Pixels OCR'd per second by each worker before any run has been timed, roughly tesseract with eng on a laptop core
+DEFAULT_PIXELS_PER_SEC = 500_000
+# Weight of the latest run in the stored throughput, so it follows changes (e.g. a new machine) without jumping around
+THROUGHPUT_SMOOTHING = 0.3
+# Runs shorter than this are mostly start up time, so aren't used to update the stored throughput
+MIN_TIMED_SECS = 5
+
+
+@dataclass
+class Throughput:
+    """Pixels OCR'd per second by each worker, measured from previous runs and stored in the addon config"""
+
+    pixels_per_sec: float = DEFAULT_PIXELS_PER_SEC
+    runs: int = 0  # Number of runs measured, 0 if pixels_per_sec is just the default guess
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], engine: str) -> "Throughput":
+        data = (config.get("ocr_throughput") or {}).get(engine)
+        if not data:
+            return cls()
+        try:
+            return cls(pixels_per_sec=float(data["pixels_per_sec"]), runs=int(data["runs"]))
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Ignoring invalid stored throughput: {data}")
+            return cls()
+
+    def to_config(self, config: Dict[str, Any], engine: str):
+        config["ocr_throughput"] = dict(config.get("ocr_throughput") or {})
+        config["ocr_throughput"][engine] = {"pixels_per_sec": round(self.pixels_per_sec), "runs": self.runs}
+
+    def record(self, pixels: int, secs: float, workers: int):
+        """Updates the throughput from a finished run"""
+        if secs < MIN_TIMED_SECS or pixels <= 0:
+            return
+        rate = pixels / secs / max(1, workers)
+        if self.runs == 0:
+            self.pixels_per_sec = rate
+        else:
+            self.pixels_per_sec = THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * self.pixels_per_sec
+        self.runs += 1
+
+
+@dataclass
+class CostEstimate:
+    """What an OCR run will do and roughly how long it will take, from a planning pass over the notes which only reads
+    image headers
+    """
+
+    num_notes: int
+    unique_images: int
+    already_ocred: int  # Unique images with OCR text in their note already, which will be OCR'd again
+    shared_images: int  # Images in more than one of the notes
+    skipped_images: int  # Missing from the media folder, or not a supported format
+    pixels: int  # Total pixels of the images the run will OCR
+    throughput: Throughput
+
+    @property
+    def new_images(self) -> int:
+        return self.unique_images - self.already_ocred
+
+    def secs(self, workers: int) -> float:
+        return self.pixels / (self.throughput.pixels_per_sec * max(1, workers))
+
+    def summary(self, workers: int) -> str:
+        """E.g. "~1,240 new images, ~14 min on 8 workers" """
+        images = f"~{self.new_images:,} new images"
+        if self.already_ocred:
+            images += f" and {self.already_ocred:,} already OCR'd"
+        workers_text = f"{workers} worker" if workers == 1 else f"{workers} workers"
+        summary = f"{images}, ~{format_duration(self.secs(workers))} on {workers_text}"
+        if self.throughput.runs == 0:
+            summary += " (a rough guess until the first run has been timed)"
+        return summary
+
+    @property
+    def details(self) -> str:
+        details = [f"{self.unique_images:,} images in {self.num_notes:,} notes, {self.pixels / 1e6:,.0f} megapixels"]
+        if self.shared_images:
+            details.append(f"{self.shared_images:,} images are in more than one note")
+        if self.skipped_images:
+            details.append(f"{self.skipped_images:,} images will be skipped, as they are missing or not supported")
+        return "\n".join(details)
+
+
+def estimate_run(
+    notes: Iterable[OCRNote],
+    throughput: Throughput,
+    use_batching: bool = True,
+    size_func: SizeFunc = image_size,
+) -> CostEstimate:
+    """Plans an OCR run without running it, reading only the size of each image from its header
+
+    :param use_batching: Batched runs OCR an image once for each note it is in, unbatched runs only once
+    """
+    num_notes = 0
+    references: Dict[str, int] = {}  # Image path -> number of times it is in the notes
+    ocred: Set[str] = set()
+    skipped = 0
+    for note in notes:
+        num_notes += 1
+        for field in note.field_images:
+            skipped += len(field.skipped_images)
+            for image in field.images:
+                path = str(image.img_pth)
+                references[path] = references.get(path, 0) + 1
+        ocred.update(str(image.img_pth) for image in read_ocr_results(note))
+
+    pixels = 0
+    for path, count in references.items():
+        pixels += image_pixels(path, size_func) * (count if use_batching else 1)
+    return CostEstimate(
+        num_notes=num_notes,
+        unique_images=len(references),
+        already_ocred=len(ocred & references.keys()),
+        shared_images=sum(1 for count in references.values() if count > 1),
+        skipped_images=skipped,
+        pixels=pixels,
+        throughput=throughput,
+    )
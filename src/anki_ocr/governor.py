@@ -0,0 +1,225 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from .utils import create_logger
+
+try:
+    import psutil  # Not bundled with Anki, but used to measure memory off Linux if it's installed
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+logger = create_logger(__name__)
+
+# Resident memory assumed for a tesseract process before any have been measured, typical for a page with eng
+DEFAULT_TESSERACT_RSS_MB = 150
+# How often PeakRSSSampler measures memory use
+RSS_SAMPLE_SECS = 0.05
+
+
+@dataclass
+class ResourceBudget:
+    """Limits for a single OCR run, each 0 for no limit"""
+
+    max_cores: int = 0
+    max_memory_mb: int = 0  # Total resident memory of all running tesseract processes
+    deadline_secs: float = 0  # Wall time from the start of the run, after which no new tesseract processes are started
+
+
+def can_measure_processes() -> bool:
+    """:returns: Whether the memory of each running process can be read, from /proc on Linux or with psutil"""
+    return os.path.isdir("/proc/self") or psutil is not None
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """Reads the resident memory of a process from /proc, or with psutil if that's installed
+
+    :returns: None if it can't be read, e.g. the process has exited, or this isn't Linux and psutil isn't installed
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 1024**2
+        except psutil.Error:
+            pass
+    return None
+
+
+def finished_children_peak_rss_mb() -> Optional[float]:
+    """:returns: Resident memory of the largest child process that has exited (e.g. tesseract), or None on Windows or
+    if none have. Works on macOS, where running processes can't be measured without psutil
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if not max_rss:
+        return None
+    return max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024  # Bytes on macOS, KB elsewhere
+
+
+def load_average() -> Optional[float]:
+    """:returns: The 1 minute load average, or None on Windows"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def child_pids(pid: int) -> List[int]:
+    """:returns: Pids of the direct children of a process, read from /proc or with psutil, so empty if this isn't
+    Linux and psutil isn't installed
+    """
+    pids: List[int] = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        if psutil is not None:
+            try:
+                return [child.pid for child in psutil.Process(pid).children()]
+            except psutil.Error:
+                pass
+        return pids
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name in brackets can contain spaces, the parent pid is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            pids.append(int(entry))
+    return pids
+
+
+class PeakRSSSampler:
+    """Samples the total resident memory of this process and its child processes (tesseract) on a background thread,
+    keeping the peak. Used as a context manager around the code to measure.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECS):
+        self.interval = interval
+        self.peak_rss_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self) -> Optional[float]:
+        pid = os.getpid()
+        own = process_rss_mb(pid)
+        if own is None:
+            return None
+        return own + sum(rss for child in child_pids(pid) if (rss := process_rss_mb(child)) is not None)
+
+    def _run(self):
+        while True:
+            rss = self.sample()
+            if rss is not None and (self.peak_rss_mb is None or rss > self.peak_rss_mb):
+                self.peak_rss_mb = rss
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self) -> "PeakRSSSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class ResourceGovernor:
+    """Decides how many tesseract processes may run at once, within a ResourceBudget.
+
+    Concurrency is scaled down when other programs are using the CPU (from the load average), and to fit the largest
+    tesseract process seen so far within the memory ceiling. The runner asks before starting each process, so
+    concurrency scales back up as soon as the load or memory use drops.
+
+    Where running processes can't be measured (see can_measure_processes()), the largest process is taken from the
+    ones that have finished on macOS, and is only DEFAULT_TESSERACT_RSS_MB on Windows, so the ceiling is an estimate.
+    """
+
+    def __init__(
+        self,
+        budget: ResourceBudget,
+        clock: Callable[[], float] = time.monotonic,
+        rss_func: Callable[[int], Optional[float]] = process_rss_mb,
+        load_func: Callable[[], Optional[float]] = load_average,
+        finished_rss_func: Callable[[], Optional[float]] = finished_children_peak_rss_mb,
+    ):
+        self.budget = budget
+        self.max_cores = budget.max_cores or os.cpu_count() or 1
+        self.clock = clock
+        self.rss_func = rss_func
+        self.load_func = load_func
+        self.finished_rss_func = finished_rss_func
+        self.peak_rss_mb = 0.0
+        self.peak_running = 0
+        self.deadline_reached = False
+        self._started_at: Optional[float] = None
+        self._warned_unmeasured = False
+
+    def start(self):
+        """Starts the clock for the deadline"""
+        self._started_at = self.clock()
+        self.deadline_reached = False
+
+    def deadline_passed(self) -> bool:
+        if self.budget.deadline_secs and self._started_at is not None:
+            if self.clock() - self._started_at >= self.budget.deadline_secs:
+                if not self.deadline_reached:
+                    logger.info(f"Reached the {self.budget.deadline_secs}s time limit, not starting any more OCR")
+                self.deadline_reached = True
+        return self.deadline_reached
+
+    def allowed_workers(self, running_pids: Iterable[int]) -> int:
+        """:param running_pids: Pids of the tesseract processes currently running for this run"""
+        running_pids = list(running_pids)
+        allowed = self.max_cores
+
+        self.peak_running = max(self.peak_running, len(running_pids))
+        load = self.load_func()
+        if load is not None:
+            # Our own processes count towards the load too, only the rest is other programs. The load average lags
+            # behind, so the most processes we've run at once is subtracted rather than the number running right now
+            other_load = max(0.0, load - self.peak_running)
+            allowed = min(allowed, int(os.cpu_count() or 1) - int(other_load))
+
+        if self.budget.max_memory_mb:
+            measured = False
+            for pid in running_pids:
+                rss = self.rss_func(pid)
+                measured = measured or rss is not None
+                if rss is not None and rss > self.peak_rss_mb:
+                    self.peak_rss_mb = rss
+            if running_pids and not measured:
+                self._warn_unmeasured()
+                rss = self.finished_rss_func()
+                if rss is not None and rss > self.peak_rss_mb:
+                    self.peak_rss_mb = rss
+            per_process = self.peak_rss_mb or DEFAULT_TESSERACT_RSS_MB
+            allowed = min(allowed, int(self.budget.max_memory_mb // per_process))
+
+        return max(1, allowed)  # Always make progress, even if over budget
+
+    def _warn_unmeasured(self):
+        if not self._warned_unmeasured:
+            logger.warning(
+                "The memory of running tesseract processes can't be measured on this platform, so the memory limit "
+                "is estimated from finished processes. Install psutil for an exact limit"
+            )
+            self._warned_unmeasured = True
@@ -1,36 +1,304 @@
+import os
 import time
 import traceback
-from math import ceil
-from typing import List
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Union, cast
 
 from aqt import mw
 from aqt.browser import Browser
 from aqt.qt import QAction
+from aqt.qt import QDialog, QDialogButtonBox, QFormLayout, QLabel, QSpinBox, QVBoxLayout
 from aqt.qt import QMenu
-from aqt.utils import showInfo, askUser, showCritical
+from aqt.utils import showInfo, askUser, showCritical, getFile, getSaveFile
 
-from . import pytesseract
-from .ocr import OCR
 from .utils import create_ocr_logger
 
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from anki.cards import Card
+    from anki.collection import Collection
+    from anki.notes import NoteId
+    from aqt.browser import SearchContext
+    from aqt.progress import ProgressManager
+
+    from .api import NotesQuery
+    from .discovery import TesseractInstall
+    from .estimate import CostEstimate
+    from .ocr import OCR
+    from .tuning import TunedSettings
+
+# Note that the OCR engine (ocr, api, pytesseract, bs4 etc.) is only imported when a menu action is first used,
+# so that importing the addon at Anki startup only registers the menu. See tests/test_import_time.py
+
 logger = create_ocr_logger()
+# How often the progress window's cancel button is checked while OCR runs in the background
+CANCEL_POLL_MS = 100
 
 
-def on_run_ocr(browser: Browser):
-    time_start = time.time()
+def get_config() -> Dict:
     assert mw is not None  # keep mypy happy
 
-    selected_nids = list(browser.selected_notes())
     config = mw.addonManager.getConfig(__name__)
     if config is None:
         raise RuntimeError(f"Could not load config name - {__name__}")
+    return config
+
+
+def tesseract_exec_override(config: Dict) -> Optional[str]:
+    return config["tesseract_exec_path"] if config["override_tesseract_exec"] else None
+
+
+def load_tesseract(config: Dict) -> "TesseractInstall":
+    """Finds tesseract, reusing the install cached in the addon config while it is still valid"""
+    from .discovery import TesseractInstall, find_tesseract
+
+    assert mw is not None  # keep mypy happy
+
+    cached = TesseractInstall.from_config(config.get("tesseract_install"))
+    install = find_tesseract(tesseract_exec_override(config), cached=cached)
+    if install != cached:
+        config["tesseract_install"] = install.to_config()
+        mw.addonManager.writeConfig(__name__, config)
+    return install
+
+
+def ocr_from_config(
+    config: Dict,
+    col: "Collection",
+    progress: Optional[Union["ProgressManager", "MainThreadProgress"]] = None,
+    nice: int = 0,
+) -> "OCR":
+    from .ocr import OCR
+    from .postprocess import TextCleaner
+    from .targeting import TargetingRules
+
+    return OCR(
+        col=col,
+        progress=progress,
+        languages=config["languages"],
+        text_output_location=config["text_output_location"],
+        tesseract_exec_pth=tesseract_exec_override(config),
+        batch_size=config["batch_size"],
+        num_threads=config["num_threads"],
+        use_batching=config["use_batching"],
+        use_multithreading=config["use_multithreading"],
+        preserve_interword_spaces=config["preserve_interword_spaces"],
+        timeout=config["tesseract_timeout"],
+        use_search_index=config["use_search_index"],
+        output_format=config["output_format"],
+        min_confidence=config["min_confidence"],
+        store_word_boxes=config["store_word_boxes"],
+        text_cleaner=TextCleaner.from_config(config),
+        route_languages=config["route_languages"],
+        nice=nice,
+        tile_max_pixels=config["tile_max_pixels"],
+        tile_overlap=config["tile_overlap"],
+        large_image_pixels=config["large_image_pixels"],
+        max_memory_mb=config["max_memory_mb"],
+        deadline_secs=config["time_limit_mins"] * 60,
+        engine=config["ocr_engine"],
+        ocr_field_name=config["ocr_field_name"],
+        targeting=TargetingRules.from_config(config),
+    )
+
+
+def tune_for_machine(config: Dict, force: bool = False) -> "TunedSettings":
+    """Sets the batch size and number of workers calibrated for this computer in the config. Calibrates first if it
+    hasn't been yet, or if tesseract or the number of cores has changed since
+
+    :param force: Calibrate again even if the stored results are still current
+    :raises ValueError: If the collection has no images to calibrate with
+    """
+    from .tuning import TunedSettings, calibrate, machine_stamp, sample_images
+
+    assert mw is not None  # keep mypy happy
+
+    install = load_tesseract(config)
+    stamp = machine_stamp(config["ocr_engine"], install.version)
+    tuned = TunedSettings.from_config(config, config["ocr_engine"])
+    if force or tuned is None or not tuned.is_current(stamp):
+
+        def ocr_factory(num_threads: int, batch_size: int) -> "OCR":
+            trial_config = dict(
+                config, num_threads=num_threads, use_multithreading=True, batch_size=batch_size, time_limit_mins=0
+            )
+            trial_config["use_batching"] = batch_size > 1
+            return ocr_from_config(trial_config, col=mw.col, progress=mw.progress)
+
+        mw.progress.start(immediate=True, label="Calibrating OCR speed for this computer...")
+        try:
+            tuned = calibrate(ocr_factory, sample_images(mw.col), stamp, max_memory_mb=config["max_memory_mb"])
+        finally:
+            mw.progress.finish()
+        tuned.to_config(config)
+    tuned.apply(config)
+    mw.addonManager.writeConfig(__name__, config)
+    return tuned
+
+
+def plan_run(config: Dict, note_ids: List["NoteId"]) -> "CostEstimate":
+    """Estimates the cost of running OCR on the notes, from the image headers and the throughput of previous runs"""
+    from .api import NotesQuery
+    from .estimate import Throughput, estimate_run
+    from .targeting import TargetingRules
+
+    assert mw is not None  # keep mypy happy
+
+    mw.progress.start(immediate=True, label="Planning OCR run...")
+    try:
+        return estimate_run(
+            NotesQuery(col=mw.col, note_ids=note_ids, targeting=TargetingRules.from_config(config)),
+            Throughput.from_config(config, config["ocr_engine"]),
+            use_batching=config["use_batching"],
+        )
+    finally:
+        mw.progress.finish()
+
+
+def confirm_run(parent, num_notes: int, config: Dict, estimate: Optional["CostEstimate"] = None) -> bool:
+    """Asks the user to confirm an OCR run, and lets them adjust the run's resource budget. The budget is saved in
+    the config, as the default for the next run
+
+    :param estimate: If given, shows what the run will do and how long it will take with the chosen number of cores
+    :returns: False if the user cancelled
+    """
+    from .governor import can_measure_processes
+
+    dialog = QDialog(parent)
+    dialog.setWindowTitle("AnkiOCR")
+    layout = QVBoxLayout(dialog)
+    layout.addWidget(QLabel(f"Are you sure you wish to run OCR processing on {num_notes} notes?"))
+    summary = QLabel()
+    if estimate is not None:
+        layout.addWidget(summary)
+        layout.addWidget(QLabel(estimate.details))
+
+    form = QFormLayout()
+    cores = QSpinBox()
+    cores.setRange(0, 256)
+    cores.setSpecialValueText("All")
+    cores.setValue(config["num_threads"] if config["use_multithreading"] else 1)
+    form.addRow("CPU cores", cores)
+    memory = QSpinBox()
+    memory.setRange(0, 1024 * 1024)
+    memory.setSingleStep(256)
+    memory.setSpecialValueText("No limit")
+    memory.setSuffix(" MB")
+    memory.setValue(config["max_memory_mb"])
+    if not can_measure_processes():
+        memory.setToolTip(
+            "Tesseract's memory can only be measured once each process has finished on this platform, or not at all "
+            "on Windows, so the limit is an estimate. Install psutil for an exact limit"
+        )
+    form.addRow("Memory limit" if can_measure_processes() else "Memory limit (estimated)", memory)
+    time_limit = QSpinBox()
+    time_limit.setRange(0, 24 * 60)
+    time_limit.setSpecialValueText("No limit")
+    time_limit.setSuffix(" min")
+    time_limit.setValue(config["time_limit_mins"])
+    form.addRow("Time limit", time_limit)
+    layout.addLayout(form)
+
+    def update_summary():
+        if estimate is not None:
+            summary.setText(estimate.summary(cores.value() or os.cpu_count() or 1))
+
+    cores.valueChanged.connect(update_summary)
+    update_summary()
+
+    buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+    buttons.accepted.connect(dialog.accept)
+    buttons.rejected.connect(dialog.reject)
+    layout.addWidget(buttons)
+    if not dialog.exec():
+        return False
+
+    config["use_multithreading"] = cores.value() != 1
+    config["num_threads"] = cores.value()
+    config["max_memory_mb"] = memory.value()
+    config["time_limit_mins"] = time_limit.value()
+    return True
+
+
+def record_throughput(config: Dict, ocr: "OCR"):
+    """Saves how quickly the run OCR'd images, to estimate how long the next run will take"""
+    from .estimate import Throughput
+
+    assert mw is not None  # keep mypy happy
+
+    throughput = Throughput.from_config(config, ocr.engine.name)
+    throughput.record(ocr.ocr_pixels, ocr.ocr_secs, workers=ocr.num_threads)
+    throughput.to_config(config, ocr.engine.name)
+    mw.addonManager.writeConfig(__name__, config)
+
+
+class MainThreadProgress:
+    """Passes progress updates from OCR running in a background thread on to Anki's ProgressManager, which may only be
+    used from the main thread. Cancelling is polled from the main thread instead, see run_cancellable()
+    """
+
+    def __init__(self, progress: "ProgressManager"):
+        self.progress = progress
+
+    def update(self, **kwargs):
+        assert mw is not None  # keep mypy happy
+        mw.taskman.run_on_main(lambda: self.progress.update(**kwargs))
+
+    def want_cancel(self) -> bool:
+        return False
+
+
+def run_cancellable(ocr: "OCR", task: Callable[[], Any], on_done: Callable[["Future"], None], parent=None):
+    """Runs task, which uses ocr, in a background thread so the UI stays responsive. The progress window's cancel button
+    is polled from the main thread, cancelling ocr and killing its tesseract processes as soon as the user confirms
+
+    :param on_done: Called in the main thread with the future of task once it has finished
+    """
+    assert mw is not None  # keep mypy happy
+
+    def poll_cancel():
+        if mw.progress.want_cancel() is not True or ocr.cancelled.is_set():
+            return
+        if mw.progress._win is not None:
+            mw.progress._win.wantCancel = False
+        if askUser("Cancel processing?", parent=parent) is True:
+            ocr.cancel()
+
+    timer = mw.progress.timer(CANCEL_POLL_MS, poll_cancel, repeat=True, requiresCollection=False, parent=parent)
+
+    def finished(future: "Future"):
+        timer.stop()
+        on_done(future)
+
+    mw.taskman.run_in_background(task, on_done=finished)
+
+
+def skipped_message(notes_query: "NotesQuery") -> str:
+    if not notes_query.num_skipped:
+        return ""
+    return (
+        f"{notes_query.num_skipped} of the {len(notes_query.note_ids)} selected notes were skipped, as they have no "
+        f"images or their notetype isn't targeted."
+    )
+
+
+def on_run_ocr(browser: Browser):
+    time_start = time.time()
+    assert mw is not None  # keep mypy happy
+
+    selected_nids = list(browser.selected_notes())
+    config = get_config()
     num_notes = len(selected_nids)
-    num_batches = ceil(num_notes / config["batch_size"])
 
     if num_notes == 0:
         showInfo("No cards selected.")
         return
-    elif askUser(f"Are you sure you wish to run OCR processing on {num_notes} notes?") is False:
+    if config["auto_tune"]:
+        try:
+            tune_for_machine(config)
+        except ValueError as e:
+            logger.warning(f"Could not calibrate, using the batch size and number of workers from the config: {e}")
+    if confirm_run(browser, num_notes, config, estimate=plan_run(config, selected_nids)) is False:
         return
 
     if config.get("tesseract_install_valid") is not True and config.get("text_output_location") == "new_field":
@@ -43,76 +311,97 @@ def on_run_ocr(browser: Browser):
 
     config["tesseract_install_valid"] = True  # Stop the above msg appearing multiple times
     mw.addonManager.writeConfig(__name__, config)
+    load_tesseract(config)
+    if config["text_output_location"] == "new_field":
+        from anki.errors import AbortSchemaModification
+
+        # Anki asks before changing notetypes, which OCR can't do from the background thread, so is asked up front
+        try:
+            mw.col.mod_schema(check=True)
+        except AbortSchemaModification:
+            return
 
     try:
         progress = mw.progress
-        progress.start(immediate=True, min=0, max=num_batches)
-        progress.update(value=0, max=num_batches, label="Starting OCR processing...")
+        # Busy until the progress reporter knows how many images there are to OCR, and sets the maximum to that
+        progress.start(immediate=True, min=0, max=0)
+        progress.update(value=0, max=0, label="Starting OCR processing...")
     except TypeError:  # old version of Qt/Anki
         progress = None
 
-    ocr = OCR(
-        col=mw.col,
-        progress=progress,
-        languages=config["languages"],
-        text_output_location=config["text_output_location"],
-        tesseract_exec_pth=config["tesseract_exec_path"] if config["override_tesseract_exec"] else None,
-        batch_size=config["batch_size"],
-        num_threads=config["num_threads"],
-        use_batching=config["use_batching"],
-        use_multithreading=config["use_multithreading"],
-        preserve_interword_spaces=config["preserve_interword_spaces"],
-    )
-    try:
-        ocr.run_ocr_on_notes(note_ids=selected_nids)
-        if progress:
-            progress.finish()
-        time_taken = time.time() - time_start
-        log_messages = logger.handlers[0].flush()
-        showInfo(
-            f"Processed OCR for {num_notes} notes in {round(time_taken, 1)}s "
-            f"({round(time_taken / num_notes, 1)}s per note)\n"
-            f"{log_messages}"
-        )
+    ocr = ocr_from_config(config, col=mw.col, progress=MainThreadProgress(progress) if progress else None)
+
+    def on_done(future: "Future"):
+        from . import pytesseract
 
-    except pytesseract.TesseractNotFoundError:
         if progress:
             progress.finish()
-        showCritical(
-            text="Could not find a valid Tesseract-OCR installation! \n"
-            "Please visit the addon page in at https://ankiweb.net/shared/info/450181164 for"
-            " install instructions"
-        )
+        try:
+            notes_query = future.result()
+            time_taken = time.time() - time_start
+            log_messages = logger.handlers[0].flush()
+            num_processed = len(notes_query.processed_note_ids)
+            num_changed = len(notes_query.changed_note_ids)
+            record_throughput(config, ocr)
+            if ocr.governor.deadline_reached:
+                log_messages = (
+                    f"Stopped at the {config['time_limit_mins']} minute time limit, run OCR again to process the "
+                    f"rest.\n{log_messages}"
+                )
+            elif ocr.cancelled.is_set():
+                log_messages = f"Cancelled, run OCR again to process the rest.\n{log_messages}"
+            showInfo(
+                f"Processed OCR for {num_processed} of {len(notes_query.image_note_ids)} notes with images in "
+                f"{round(time_taken, 1)}s ({round(time_taken / max(num_processed, 1), 1)}s per note). {num_changed} "
+                f"notes changed, the rest already had the same OCR text so were left as they were. "
+                f"{skipped_message(notes_query)}\n"
+                f"{log_messages}"
+            )
 
-    except (RuntimeError, Exception) as exc:
-        from . import __version__ as anki_ocr_version
-        from anki.buildinfo import version as anki_version
-        import sys
-        import platform
+        except pytesseract.TesseractNotFoundError:
+            showCritical(
+                text="Could not find a valid Tesseract-OCR installation! \n"
+                "Please visit the addon page in at https://ankiweb.net/shared/info/450181164 for"
+                " install instructions"
+            )
 
-        if progress:
-            progress.finish()
-        msg = (
-            f"Error encountered during processing. Debug info: \n"
-            f"Anki Version: {anki_version} , AnkiOCR Version: {anki_ocr_version}\n"
-            f"Platform: {platform.system()} , Python Version: {sys.version}"
-        )
-        log_messages = logger.handlers[0].flush()
-        if len(log_messages) > 0:
-            msg += f"Logging message generated during processing:\n{log_messages}"
-        exception_str: List[str] = traceback.format_exception(etype=type(exc), value=exc, tb=exc.__traceback__)
-        msg += "".join(exception_str)
-        showInfo(msg)
+        except (RuntimeError, Exception) as exc:
+            if ocr.cancelled.is_set():
+                showInfo(
+                    "Cancelled OCR processing. Notes finished before cancelling were saved, run OCR again to process "
+                    f"the rest.\n{logger.handlers[0].flush()}"
+                )
+                return
+            from . import __version__ as anki_ocr_version
+            from anki.buildinfo import version as anki_version
+            import sys
+            import platform
 
-    finally:
-        browser.model.reset()
-        mw.requireReset()
+            msg = (
+                f"Error encountered during processing. Debug info: \n"
+                f"Anki Version: {anki_version} , AnkiOCR Version: {anki_ocr_version}\n"
+                f"Platform: {platform.system()} , Python Version: {sys.version}"
+            )
+            log_messages = logger.handlers[0].flush()
+            if len(log_messages) > 0:
+                msg += f"Logging message generated during processing:\n{log_messages}"
+            exception_str: List[str] = traceback.format_exception(type(exc), exc, exc.__traceback__)
+            msg += "".join(exception_str)
+            showInfo(msg)
+
+        finally:
+            browser.model.reset()
+            mw.requireReset()
+
+    run_cancellable(ocr, lambda: ocr.run_ocr_on_notes(note_ids=selected_nids), on_done, parent=browser)
 
 
 def on_rm_ocr_fields(browser: Browser):
+    from .ocr import OCR
+
     assert mw is not None  # keep mypy happy
 
-    config = mw.addonManager.getConfig(__name__)
+    config = get_config()
     selected_nids = list(browser.selected_notes())
     num_notes = len(selected_nids)
     if num_notes == 0:
@@ -121,15 +410,158 @@ def on_rm_ocr_fields(browser: Browser):
     elif askUser(f"Are you sure you wish to remove the OCR field from {num_notes} notes?") is False:
         return
 
+    load_tesseract(config)
     progress = mw.progress
     progress.start(immediate=True)
-    ocr = OCR(col=mw.col, progress=progress, languages=config["languages"])
-    ocr.remove_ocr_on_notes(note_ids=selected_nids)
+    ocr = OCR(
+        col=mw.col,
+        progress=progress,
+        languages=config["languages"],
+        tesseract_exec_pth=tesseract_exec_override(config),
+        use_search_index=config["use_search_index"],
+        text_output_location=config["text_output_location"],
+        ocr_field_name=config["ocr_field_name"],
+    )
+    num_removed = ocr.remove_ocr_on_notes(note_ids=selected_nids)
     mw.progress.finish()
     browser.model.reset()
     mw.requireReset()
     log_messages = logger.handlers[0].flush()
-    showInfo(f"Removed the OCR field from {num_notes} cards\n" f"{log_messages}")
+    showInfo(f"Removed OCR data from {num_removed} of {num_notes} selected notes\n" f"{log_messages}")
+
+
+def on_export_ocr(browser: Browser):
+    from .bundle import BUNDLE_SUFFIX
+
+    assert mw is not None  # keep mypy happy
+
+    config = get_config()
+    selected_nids = list(browser.selected_notes())
+    if len(selected_nids) == 0:
+        showInfo("No cards selected.")
+        return
+    # The browser is a window rather than a dialog, which Anki's annotation doesn't allow for, but works as a parent
+    path = getSaveFile(
+        cast(QDialog, browser), "Export OCR results", "anki_ocr_bundle", "OCR results", BUNDLE_SUFFIX, "ocr_results"
+    )
+    if not path:
+        return
+
+    load_tesseract(config)
+    ocr = ocr_from_config(config, col=mw.col)
+    mw.progress.start(immediate=True)
+    try:
+        bundle = ocr.export_bundle(selected_nids)
+        bundle.save(path)
+    finally:
+        mw.progress.finish()
+    showInfo(f"Exported OCR results for {len(bundle)} images to {path}")
+
+
+def on_import_ocr(browser: Browser):
+    from .bundle import BUNDLE_SUFFIX, OCRBundle
+
+    assert mw is not None  # keep mypy happy
+
+    config = get_config()
+    selected_nids = list(browser.selected_notes())
+    num_notes = len(selected_nids)
+    if num_notes == 0:
+        showInfo("No cards selected.")
+        return
+    path = getFile(browser, "Import OCR results", None, filter=f"OCR results (*{BUNDLE_SUFFIX})", key="anki_ocr_bundle")
+    if not path:
+        return
+    try:
+        bundle = OCRBundle.load(str(path))
+    except ValueError as e:
+        showCritical(str(e))
+        return
+
+    load_tesseract(config)
+    ocr = ocr_from_config(config, col=mw.col)
+    differences = bundle.fingerprint_differences(ocr.fingerprint)
+    if differences:
+        changes = "\n".join(f"{key}: {theirs} (yours: {ours})" for key, (theirs, ours) in differences.items())
+        if askUser(f"These OCR results were made with different settings:\n{changes}\n\nImport them anyway?") is False:
+            return
+
+    mw.progress.start(immediate=True)
+    try:
+        notes_query = ocr.import_bundle(bundle, selected_nids)
+    finally:
+        mw.progress.finish()
+        browser.model.reset()
+        mw.requireReset()
+    num_imported = len(notes_query.processed_note_ids)
+    num_changed = len(notes_query.changed_note_ids)
+    log_messages = logger.handlers[0].flush()
+    showInfo(
+        f"Imported OCR results for {num_imported} of {len(notes_query.image_note_ids)} selected notes with images, of "
+        f"which {num_changed} changed. Notes with images not in the results are unchanged, and can be OCR'd as usual. "
+        f"{skipped_message(notes_query)}\n{log_messages}"
+    )
+
+
+def on_ocr_package(browser: Browser):
+    from .bundle import BUNDLE_SUFFIX
+    from .media_archive import PACKAGE_SUFFIXES
+
+    assert mw is not None  # keep mypy happy
+
+    config = get_config()
+    suffixes = " ".join(f"*{suffix}" for suffix in PACKAGE_SUFFIXES + [".zip"])
+    path = getFile(browser, "OCR a deck package", None, filter=f"Deck packages ({suffixes})", key="anki_ocr_package")
+    if not path:
+        return
+    name = os.path.splitext(os.path.basename(str(path)))[0]
+    save_path = getSaveFile(
+        cast(QDialog, browser), "Save OCR results", "anki_ocr_bundle", "OCR results", BUNDLE_SUFFIX, name
+    )
+    if not save_path:
+        return
+
+    load_tesseract(config)
+    ocr = ocr_from_config(config, col=mw.col)
+    try:
+        mw.progress.start(immediate=True)
+        try:
+            bundle = ocr.ocr_archive(str(path))
+        finally:
+            mw.progress.finish()
+    except ValueError as e:
+        showCritical(str(e))
+        return
+    bundle.save(save_path)
+    showInfo(
+        f"OCR'd {len(bundle)} images from {path} into {save_path}. Import the deck, then import these results into "
+        f"its notes with Import OCR results\n{logger.handlers[0].flush()}"
+    )
+
+
+def on_calibrate(browser: Browser):
+    assert mw is not None  # keep mypy happy
+
+    config = get_config()
+    question = (
+        "Calibrate OCR for this computer? This times OCR of a sample of your images with different batch sizes and "
+        "numbers of workers, which can take a few minutes."
+    )
+    if askUser(question, parent=browser) is False:
+        return
+    config["auto_tune"] = True  # Calibrates again by itself when tesseract or the computer changes
+    try:
+        tuned = tune_for_machine(config, force=True)
+    except ValueError as e:
+        showInfo(str(e))
+        return
+    trials = "\n".join(
+        f"{t.num_threads} workers, batches of {t.batch_size}: {t.images_per_sec:.1f} images/s" for t in tuned.trials
+    )
+    showInfo(
+        f"Calibrated to {tuned.num_threads} workers with batches of {tuned.batch_size} "
+        f"({tuned.images_per_sec:.1f} images/s).\n\n{trials}\n{logger.handlers[0].flush()}"
+    )
 
 
 def on_menu_setup(browser: Browser):
@@ -145,12 +577,62 @@ def on_menu_setup(browser: Browser):
     act_rm_ocr_fields.triggered.connect(lambda b=browser: on_rm_ocr_fields(browser))
     anki_ocr_menu.addAction(act_rm_ocr_fields)
 
+    anki_ocr_menu.addSeparator()
+    act_export_ocr = QAction(browser, text="Export OCR results of selected notes...")  # type: ignore[call-overload]
+    act_export_ocr.triggered.connect(lambda b=browser: on_export_ocr(browser))
+    anki_ocr_menu.addAction(act_export_ocr)
+
+    act_import_ocr = QAction(browser, text="Import OCR results into selected notes...")  # type: ignore[call-overload]
+    act_import_ocr.triggered.connect(lambda b=browser: on_import_ocr(browser))
+    anki_ocr_menu.addAction(act_import_ocr)
+
+    act_ocr_package = QAction(browser, text="OCR a deck package before importing it...")  # type: ignore[call-overload]
+    act_ocr_package.triggered.connect(lambda b=browser: on_ocr_package(browser))
+    anki_ocr_menu.addAction(act_ocr_package)
+
+    anki_ocr_menu.addSeparator()
+    act_calibrate = QAction(browser, text="Calibrate OCR speed for this computer...")  # type: ignore[call-overload]
+    act_calibrate.triggered.connect(lambda b=browser: on_calibrate(browser))
+    anki_ocr_menu.addAction(act_calibrate)
+
     browser_cards_menu = browser.form.menu_Cards
     browser_cards_menu.addSeparator()
     browser_cards_menu.addMenu(anki_ocr_menu)
 
 
+def on_browser_will_search(context: "SearchContext"):
+    """Answers `ocr:term` searches in the browser from the OCR search index"""
+    if "ocr:" not in context.search.lower() or mw is None or mw.col is None:
+        return
+    from .search_index import OCRSearchIndex
+
+    with OCRSearchIndex.for_collection(mw.col) as search_index:
+        context.search = search_index.rewrite_search(context.search)
+
+
+def on_card_will_show(text: str, card: "Card", _kind: str) -> str:
+    """Shows OCR text stored with the sidecar text output location as image tooltips, without it being in the note"""
+    if "<img" not in text or mw is None or mw.col is None:
+        return text
+    config = mw.addonManager.getConfig(__name__)
+    if config is None or config["text_output_location"] != "sidecar":
+        return text
+    from .search_index import OCRSearchIndex, add_ocr_titles
+
+    with OCRSearchIndex.for_collection(mw.col) as search_index:
+        return add_ocr_titles(text, search_index.texts_for_note(card.nid, media_dir=mw.col.media.dir()))
+
+
 def create_menu():
     from anki.hooks import addHook
+    from aqt import gui_hooks
 
     addHook("browser.setupMenus", on_menu_setup)
+    gui_hooks.browser_will_search.append(on_browser_will_search)
+    gui_hooks.card_will_show.append(on_card_will_show)
+
+    config = mw.addonManager.getConfig(__name__) if mw is not None else None
+    if config is not None and config["background_ocr"]:
+        from .watcher import BackgroundOCR
+
+        BackgroundOCR(mw, config).register()
@@ -0,0 +1,100 @@
+import io
+import struct
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+# JPEG start of frame markers, which hold the image size. C4 (DHT), C8 (JPG) and CC (DAC) aren't frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+TIFF_WIDTH_TAG = 256
+TIFF_HEIGHT_TAG = 257
+
+
+def _jpeg_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":  # Markers can be padded with any number of 0xFF
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # Markers without a length
+            continue
+        (length,) = struct.unpack(">H", f.read(2))
+        if marker in JPEG_SOF_MARKERS:
+            _precision, height, width = struct.unpack(">BHH", f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def _tiff_size(f: BinaryIO, byte_order: bytes) -> Optional[Tuple[int, int]]:
+    endian = "<" if byte_order == b"II" else ">"
+    f.seek(4)
+    (ifd_offset,) = struct.unpack(endian + "I", f.read(4))
+    f.seek(ifd_offset)
+    (num_entries,) = struct.unpack(endian + "H", f.read(2))
+    size = {}
+    for _ in range(num_entries):
+        tag, field_type, _count, value = struct.unpack(endian + "HHI4s", f.read(12))
+        if tag in (TIFF_WIDTH_TAG, TIFF_HEIGHT_TAG):
+            # SHORT (3) values are left aligned in the 4 byte value field, LONG (4) use all of it
+            if field_type == 3:
+                (size[tag],) = struct.unpack(endian + "H", value[:2])
+            else:
+                (size[tag],) = struct.unpack(endian + "I", value)
+    if TIFF_WIDTH_TAG in size and TIFF_HEIGHT_TAG in size:
+        return size[TIFF_WIDTH_TAG], size[TIFF_HEIGHT_TAG]
+    return None
+
+
+def _pnm_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    values: List[bytes] = []
+    while len(values) < 2:
+        line = f.readline()
+        if not line:
+            return None
+        values += line.split(b"#")[0].split()
+    return int(values[0]), int(values[1])
+
+
+def image_size(img_pth: Union[str, Path, bytes, bytearray, memoryview]) -> Optional[Tuple[int, int]]:
+    """Reads the (width, height) of an image from its header, without decoding it
+
+    Supports PNG, JPEG, GIF, BMP, TIFF and PNM.
+
+    :param img_pth: Path to the image, or the contents of the image file
+
+    :returns: None if the format isn't supported, or the header can't be read
+    """
+    source = "image data" if isinstance(img_pth, (bytes, bytearray, memoryview)) else img_pth
+    try:
+        f: BinaryIO
+        if isinstance(img_pth, (bytes, bytearray, memoryview)):
+            f = io.BytesIO(img_pth)
+        else:
+            f = open(img_pth, "rb")
+        with f:
+            header = f.read(26)
+            if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header.startswith(b"\xff\xd8"):
+                return _jpeg_size(f)
+            if header[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", header[6:10])
+            if header.startswith(b"BM"):
+                width, height = struct.unpack("<ii", header[18:26])
+                return width, abs(height)  # Negative height means the rows are stored top down
+            if header[:4] in (b"II*\x00", b"MM\x00*"):
+                return _tiff_size(f, header[:2])
+            if header[:1] == b"P" and header[1:2] in b"123456":
+                return _pnm_size(f)
+    except (OSError, struct.error, ValueError, IndexError) as e:
+        logger.debug(f"Could not read the size of {source}: {e}")
+    return None
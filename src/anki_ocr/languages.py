@@ -0,0 +1,79 @@
+from typing import Dict, List, Optional
+
+from . import pytesseract
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+OSD_LANGUAGE = "osd"  # osd.traineddata, needed for script detection
+# Below this tesseract's script detection is mostly guesswork, so the image is OCR'd with every language
+MIN_SCRIPT_CONFIDENCE = 1.0
+
+# Tesseract OSD script name -> tesseract languages written in that script
+SCRIPT_LANGUAGES: Dict[str, List[str]] = {
+    "Latin": [
+        "afr", "aze", "bos", "cat", "ceb", "ces", "cym", "dan", "deu", "eng", "enm", "epo", "est", "eus", "fil", "fin",
+        "fra", "frm", "gle", "glg", "hrv", "hun", "ind", "isl", "ita", "ita_old", "lat", "lav", "lit", "ltz", "mlt",
+        "msa", "nld", "nor", "oci", "pol", "por", "ron", "slk", "slv", "spa", "spa_old", "sqi", "swa", "swe", "tgl",
+        "tur", "uzb", "vie",
+    ],  # fmt: skip
+    "Cyrillic": ["bel", "bul", "kaz", "kir", "mkd", "mon", "rus", "srp", "tat", "tgk", "ukr"],
+    "Greek": ["ell", "grc"],
+    "Arabic": ["ara", "fas", "pus", "snd", "uig", "urd"],
+    "Hebrew": ["heb", "yid"],
+    "Devanagari": ["hin", "mar", "nep", "san"],
+    "Bengali": ["asm", "ben"],
+    "Tamil": ["tam"],
+    "Telugu": ["tel"],
+    "Kannada": ["kan"],
+    "Malayalam": ["mal"],
+    "Gujarati": ["guj"],
+    "Gurmukhi": ["pan"],
+    "Thai": ["tha"],
+    "Armenian": ["hye"],
+    "Georgian": ["kat", "kat_old"],
+    "Ethiopic": ["amh", "tir"],
+    "Han": ["chi_sim", "chi_tra", "jpn"],
+    "Japanese": ["jpn"],
+    "Katakana": ["jpn"],
+    "Hiragana": ["jpn"],
+    "Hangul": ["kor"],
+}
+
+
+class LanguageRouter:
+    """Picks the languages to OCR each image with, from the script tesseract detects in it.
+
+    Without routing, every image is OCR'd with every configured language, e.g. `-l eng+rus+jpn`, which is several times
+    slower than a single language even when each image only contains one of them.
+    """
+
+    def __init__(self, languages: List[str]):
+        self.languages = languages
+        self._by_script: Dict[str, List[str]] = {
+            script: [lang for lang in languages if lang in script_langs]
+            for script, script_langs in SCRIPT_LANGUAGES.items()
+        }
+        # Languages without a known script can't be routed, so are used for every image
+        scripted = {lang for script_langs in SCRIPT_LANGUAGES.values() for lang in script_langs}
+        self._unscripted = [lang for lang in languages if lang not in scripted]
+
+    @property
+    def is_useful(self) -> bool:
+        """:returns: True if the configured languages span more than one script, otherwise routing can't narrow them"""
+        groups = {tuple(langs) for langs in self._by_script.values() if langs}
+        return len(groups) > 1
+
+    def languages_for_script(self, script: Optional[str]) -> List[str]:
+        matched = self._by_script.get(script or "", [])
+        if not matched:
+            return self.languages
+        return [lang for lang in self.languages if lang in matched or lang in self._unscripted]
+
+    def languages_for_osd(self, osd: str) -> List[str]:
+        """:param osd: Raw output of tesseract --psm 0, empty if detection failed"""
+        detected = pytesseract.osd_to_dict(osd)
+        script, confidence = detected.get("script"), detected.get("script_conf", 0)
+        if confidence < MIN_SCRIPT_CONFIDENCE:
+            return self.languages
+        return self.languages_for_script(script)
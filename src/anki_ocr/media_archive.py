@@ -0,0 +1,82 @@
+import json
+import zipfile
+from os import PathLike
+from pathlib import PurePosixPath
+from typing import Dict, Iterator, List, Tuple, Union
+
+from .api import OCRField
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+# Member of a deck package mapping the numbered media members to their file names, e.g. {"0": "diagram.png"}
+MEDIA_MAP_MEMBER = "media"
+PACKAGE_SUFFIXES = [".apkg", ".colpkg"]
+
+
+def is_image(name: str) -> bool:
+    return PurePosixPath(name).suffix.lower() in OCRField.allowed_img_formats
+
+
+class MediaArchive:
+    """Reads the images in an Anki deck package (.apkg or .colpkg) or a zip of images, one at a time, without
+    extracting the archive.
+
+    Deck packages store each media file as a member named "0", "1", ..., with their file names in the "media"
+    member. Packages exported in Anki's newer format compress these with zstd, which can't be read here, so need to be
+    exported with "Support older Anki versions" checked.
+    """
+
+    def __init__(self, path: Union[str, PathLike]):
+        self.path = path
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"{path} is not a deck package or zip file: {e}") from e
+        try:
+            self.members = self._read_media_map()  # Image file name -> archive member
+        except ValueError:
+            self._zip.close()
+            raise
+        logger.info(f"Found {len(self.members)} images in {path}")
+
+    def _read_media_map(self) -> Dict[str, str]:
+        member_names = self._zip.namelist()
+        if MEDIA_MAP_MEMBER not in member_names:  # A zip of images
+            return {name: name for name in member_names if is_image(name)}
+        try:
+            media_map = json.loads(self._zip.read(MEDIA_MAP_MEMBER).decode("utf-8"))
+        except ValueError:
+            media_map = None
+        if not isinstance(media_map, dict):
+            raise ValueError(
+                f"The media of {self.path} can't be read, export the deck again with "
+                f'"Support older Anki versions" checked'
+            )
+        members = set(member_names)
+        return {name: member for member, name in media_map.items() if is_image(name) and member in members}
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def read(self, name: str) -> bytes:
+        """:returns: The contents of the image, decompressed from the archive into memory"""
+        return self._zip.read(self.members[name])
+
+    def __iter__(self) -> Iterator[Tuple[str, bytes]]:
+        """Yields (file name, contents) of each image, reading only one at a time into memory"""
+        for name in self.members:
+            yield name, self.read(name)
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self) -> "MediaArchive":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
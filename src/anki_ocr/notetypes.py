@@ -0,0 +1,94 @@
+from typing import Any, Dict, Optional
+
+from anki.collection import Collection
+
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+OCR_MODEL_SUFFIX = "_OCR"
+
+
+class NotetypeRegistry:
+    """Names and ids of a collection's notetypes, loaded once and shared by every note in a run, mapping each original
+    notetype to its _OCR copy and back.
+
+    Notetypes are only loaded from the backend on first use, and again after the addon adds a notetype itself with
+    add(). Notetypes changed by anything else during a run aren't seen, so create a registry per run.
+    """
+
+    def __init__(self, col: Collection):
+        self.col = col
+        self._names: Optional[Dict[int, str]] = None
+        self._ids: Dict[str, int] = {}
+        self._models: Dict[int, Dict[str, Any]] = {}
+
+    def _load(self) -> Dict[int, str]:
+        if self._names is None:
+            self._names = {int(nt.id): nt.name for nt in self.col.models.all_names_and_ids()}
+            self._ids = {name: mid for mid, name in self._names.items()}
+        return self._names
+
+    def invalidate(self):
+        self._names = None
+        self._ids = {}
+        self._models = {}
+
+    def names(self) -> Dict[int, str]:
+        """:returns: Dict of notetype id -> name, for every notetype"""
+        return dict(self._load())
+
+    def orig_name(self, mid: int) -> Optional[str]:
+        """:returns: Name of the notetype, without the suffix if it's an _OCR copy"""
+        name = self.name(mid)
+        if name is not None and name.endswith(OCR_MODEL_SUFFIX):
+            return name[: -len(OCR_MODEL_SUFFIX)]
+        return name
+
+    def name(self, mid: int) -> Optional[str]:
+        return self._load().get(mid)
+
+    def id_for_name(self, name: str) -> Optional[int]:
+        self._load()
+        return self._ids.get(name)
+
+    def model(self, mid: int) -> Dict[str, Any]:
+        if mid not in self._models:
+            model = self.col.models.get(mid)  # type: ignore[arg-type]
+            if model is None:
+                raise ValueError(f"Notetype id {mid} does not exist")
+            self._models[mid] = model
+        return self._models[mid]
+
+    def is_ocr_model(self, mid: int) -> bool:
+        name = self.name(mid)
+        return name is not None and name.endswith(OCR_MODEL_SUFFIX)
+
+    def ocr_model_ids(self) -> Dict[int, str]:
+        """:returns: Dict of notetype id -> name, for every _OCR notetype"""
+        return {mid: name for mid, name in self._load().items() if name.endswith(OCR_MODEL_SUFFIX)}
+
+    def ocr_model_id_for(self, mid: int) -> Optional[int]:
+        """:returns: Id of the _OCR copy of notetype mid, or None if it hasn't been created yet"""
+        name = self.name(mid)
+        return self.id_for_name(name + OCR_MODEL_SUFFIX) if name is not None else None
+
+    def orig_model_id_for(self, ocr_mid: int) -> Optional[int]:
+        """:returns: Id of the notetype an _OCR notetype was copied from, or None if it no longer exists"""
+        name = self.name(ocr_mid)
+        if name is None or not name.endswith(OCR_MODEL_SUFFIX):
+            return None
+        return self.id_for_name(name[: -len(OCR_MODEL_SUFFIX)])
+
+    def add(self, model: Dict[str, Any]) -> int:
+        """Adds a new notetype, e.g. a copy of an existing one made by OCRNote.create_OCR_notemodel()
+
+        :returns: Id of the new notetype
+        """
+        model["id"] = 0  # Copies keep the id of their source, which would otherwise overwrite it
+        self.col.models.add(model)
+        self.invalidate()
+        mid = self.id_for_name(model["name"])
+        assert mid is not None
+        self._models[mid] = model
+        return mid
@@ -1,13 +1,14 @@
 import logging
 import os
-import platform
-import re
-import subprocess
 import sys
 import tempfile
+import threading
+import time
+from math import ceil
+from dataclasses import fields as dataclass_fields
 from os import PathLike
 from pathlib import Path
-from typing import Dict, Optional, List, Union, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, List, Set, Union, Tuple
 
 from anki.notes import NoteId
 from aqt.utils import askUser
@@ -17,36 +18,50 @@ try:
 except ImportError:  # Older anki versions
     from anki.storage import Collection
 
-from .api import OCRNote, NotesQuery, OCRImage
-from .utils import batch, run_cmd
-from . import pytesseract
+from .api import OCR_FIELD_NAME, TEXT_OUTPUT_LOCATIONS, OCRNote, NotesQuery, OCRImage, OCRPage
+from .bundle import BundleEntry, OCRBundle, data_hash, read_ocr_results
+from .discovery import MODULE_DIR, TESSDATA_DIR, TesseractInstall, find_tesseract, set_tesseract_exe_permission
+from .engines import OCRRequest, TesseractCLIEngine, create_engine
+from .governor import ResourceBudget, ResourceGovernor
+from .image_info import image_size
+from .languages import OSD_LANGUAGE, LanguageRouter
+from .media_archive import MediaArchive
+from .postprocess import DEFAULT_CLEANER, TextCleaner
+from .removal import BulkOCRRemover
+from .progress_reporter import ProgressReporter
+from .scheduler import image_pixels, plan_jobs
+from .search_index import OCRSearchIndex
+from .targeting import TargetingRules
+from .structured import text_to_pages, tsv_to_pages
+from .tiling import Band, can_tile, stitch_bands, write_bands, write_png_bands
+from .utils import batch
+
+if TYPE_CHECKING:
+    from aqt.progress import ProgressManager
 
-ANKI_ENV = "python" not in Path(sys.executable).stem
+    from .gui import MainThreadProgress
 
-MODULE_DIR = Path(__file__).parent
-DEPS_DIR = MODULE_DIR / "deps"
-TESSDATA_DIR = DEPS_DIR / "tessdata"
+ANKI_ENV = "python" not in Path(sys.executable).stem
 
 if ANKI_ENV is False:
     # Running outside of Anki during development
     sys.path.append(str(MODULE_DIR.absolute()))
     from tqdm import tqdm
 
-    ProgressManager = None
-
 else:
-    from aqt.progress import ProgressManager
-
     tqdm = None
 
 logger = logging.getLogger("anki_ocr")
 
+# Images read from an archive into memory at once by OCR.ocr_archive()
+ARCHIVE_CHUNK_SIZE = 50
+
 
 class OCR:
     def __init__(
         self,
-        col: Collection,
-        progress: Optional["ProgressManager"] = None,
+        col: Optional[Collection],
+        progress: Optional[Union["ProgressManager", "MainThreadProgress"]] = None,
         languages: Optional[List[str]] = None,
         text_output_location="tooltip",
         tesseract_exec_pth: Optional[str] = None,
@@ -55,139 +70,253 @@ class OCR:
         use_batching=True,
         use_multithreading=False,
         preserve_interword_spaces=False,
+        timeout: float = 0,
+        use_search_index: bool = True,
+        output_format: str = "txt",
+        min_confidence: float = 0,
+        store_word_boxes: bool = False,
+        text_cleaner: Optional[TextCleaner] = None,
+        route_languages: bool = False,
+        nice: int = 0,
+        tile_max_pixels: int = 0,
+        tile_overlap: int = 100,
+        large_image_pixels: int = 0,
+        max_memory_mb: int = 0,
+        deadline_secs: float = 0,
+        engine: str = "tesseract",
+        ocr_field_name: str = OCR_FIELD_NAME,
+        targeting: Optional[TargetingRules] = None,
     ):
+        """
+        :param text_output_location: Where OCR text is stored, one of TEXT_OUTPUT_LOCATIONS, see
+            OCRNote.add_imgdata_to_note()
+        :param ocr_field_name: The field OCR text is stored in with the "existing_field" text output location
+        :param targeting: Which notetypes, fields and images to OCR, every image if None
+        """
         self.col = col
         self.progress = progress
+        self.reporter = ProgressReporter(
+            progress, pbar_factory=tqdm, ask_cancel=lambda: askUser("Cancel processing?") is True
+        )
         # ISO 639-2 Code, see https://www.loc.gov/standards/iso639-2/php/code_list.php
         self.languages = languages or ["eng"]
 
-        self.set_tesseract_exe_permission()
-        tesseract_cmd = tesseract_exec_pth or self.path_to_tesseract()
-        pytesseract.tesseract_cmd = tesseract_cmd
-        assert text_output_location in ["tooltip", "new_field"]
+        assert text_output_location in TEXT_OUTPUT_LOCATIONS
         self.text_output_location = text_output_location
+        self.ocr_field_name = ocr_field_name
+        self.targeting = targeting
         self.use_batching = use_batching
         self.use_multithreading = use_multithreading
         if use_multithreading is True:
-            self.num_threads = num_threads if num_threads != 0 else os.cpu_count()
+            self.num_threads = num_threads if num_threads != 0 else (os.cpu_count() or 1)
         else:
             self.num_threads = 1
         self.batch_size = batch_size
         self.preserve_interword_spaces = preserve_interword_spaces
-
-    def _ocr_batch_process(self, batched_txts):
+        # Scales concurrency down to fit within the memory ceiling and CPU load, and stops the run at the deadline
+        self.governor = ResourceGovernor(
+            ResourceBudget(max_cores=self.num_threads, max_memory_mb=max_memory_mb, deadline_secs=deadline_secs)
+        )
+        # See engines.register_engine() for adding engines
+        self.engine = create_engine(
+            engine,
+            max_concurrency=self.num_threads,
+            timeout=timeout,
+            nice=nice,
+            governor=self.governor,
+            config=self._tesseract_config(preserve_interword_spaces=preserve_interword_spaces),
+            tesseract_exec_pth=tesseract_exec_pth,
+        )
+        # Only the tesseract engine needs tesseract installed
+        self.tesseract: Optional[TesseractInstall] = None
+        if isinstance(self.engine, TesseractCLIEngine):
+            self.tesseract = self.engine.install
+            missing_languages = [lang for lang in self.languages if lang not in self.tesseract.languages]
+            if self.tesseract.languages and missing_languages:
+                logger.warning(f"Languages {missing_languages} are not installed in {self.tesseract.tessdata_dir}")
+        capabilities = self.engine.capabilities
+        if capabilities.max_concurrency:
+            self.governor.max_cores = min(self.governor.max_cores, capabilities.max_concurrency)
+        if use_batching and not capabilities.supports_batching:
+            logger.info(f"The {self.engine.name} engine doesn't support batching, OCRing images one at a time")
+            self.use_batching = False
+        self.use_search_index = use_search_index
+        # TSV output includes word confidences and boxes, allowing low confidence junk words to be dropped
+        assert output_format in ["txt", "tsv"]
+        if output_format not in capabilities.output_formats:
+            raise ValueError(f"The {self.engine.name} engine doesn't support the {output_format} output format")
+        self.output_format = output_format
+        self.min_confidence = min_confidence
+        self.store_word_boxes = store_word_boxes
+        self.text_cleaner = text_cleaner or DEFAULT_CLEANER
+        self.language_router = self._language_router(route_languages)
+        # Images larger than this are split into bands, each OCR'd by its own tesseract process. 0 to disable
+        self.tile_max_pixels = tile_max_pixels
+        self.tile_overlap = tile_overlap
+        # With batching, images with at least this many pixels are OCR'd on their own rather than in a batch
+        self.large_image_pixels = large_image_pixels
+        # Pixels OCR'd and seconds spent running the engine, to estimate how long later runs will take
+        self.ocr_pixels = 0
+        self.ocr_secs = 0.0
+        # Set by cancel(), from any thread. Stops the run before its next stage or chunk
+        self.cancelled = threading.Event()
+
+    def _language_router(self, route_languages: bool) -> Optional[LanguageRouter]:
+        if not route_languages:
+            return None
+        router = LanguageRouter(self.languages)
+        if not router.is_useful:
+            logger.debug(f"Languages {self.languages} are all written in the same script, not routing languages")
+            return None
+        if "osd" not in self.engine.capabilities.output_formats:
+            logger.warning(f"The {self.engine.name} engine can't detect scripts, so languages can't be routed")
+            return None
+        if self.tesseract is not None and OSD_LANGUAGE not in self.tesseract.languages:
+            logger.warning(f"{OSD_LANGUAGE}.traineddata is not installed, so languages can't be routed by script")
+            return None
+        return router
+
+    def _ocr_batch_process(self, requests: List[OCRRequest], label: str = "Running OCR") -> Dict[str, str]:
         # Split into batches and send each to a different tesseract process
         # Note that the anki.Collection object cannot be accessed by multiple threads at once,
         # So we need to run the OCR then join the results back into the notes afterwards in the main thread
-        raw_results = {}
-        completed = 0
-
         # Note that there might be multiple images per note, so num_batches != batch_size * num_notes
+        return self._run_engine(requests, label=label)
+
+    def _ocr_unbatched_process(
+        self, image_paths: List[str], input_langs: Optional[Dict[str, str]] = None, label: str = "Running OCR"
+    ):
+        image_paths = list(dict.fromkeys(str(p) for p in image_paths))
+        langs = input_langs or {}
+        return self._run_engine([OCRRequest(key=p, images=[p], lang=langs.get(p)) for p in image_paths], label=label)
 
-        num_batches = len(batched_txts)
-        pbar = tqdm(total=num_batches) if ANKI_ENV is False else None
+    def _run_engine(
+        self,
+        requests: List[OCRRequest],
+        *,
+        output_format: Optional[str] = None,
+        lang: Optional[str] = None,
+        label: str = "Running OCR",
+    ) -> Dict[str, str]:
+        """Runs the OCR engine on every request, with up to num_threads requests running concurrently
+
+        :param lang: Languages for requests without their own, all of self.languages by default
+        :returns: Dict of request key -> raw OCR output
+        """
+        if self.cancelled.is_set():
+            raise RuntimeError("OCR processing cancelled")
+        # (number of images, total pixels) of each request, for progress reporting
+        costs = {
+            r.key: (len(r.images), image_pixels(r.data) if r.data is not None else sum(map(image_pixels, r.images)))
+            for r in requests
+        }
+        self.reporter.start_stage(
+            label,
+            total_items=sum(num_images for num_images, _ in costs.values()),
+            total_cost=sum(pixels for _, pixels in costs.values()),
+        )
 
-        for batched_img_txt in batched_txts:
-            ocr_text = self._ocr_img(
-                batched_img_txt, preserve_interword_spaces=self.preserve_interword_spaces, languages=self.languages
-            )
-            completed += 1
-            raw_results[batched_img_txt] = ocr_text
-            if self.progress is not None:
-                self.progress.update(
-                    value=completed,
-                    max=num_batches,
-                    label=f"Running OCR... ({round(100 * completed / num_batches)} %)",
+        def on_result(key: str, _output: str):
+            self.reporter.advance(*costs[key])
+            self.ocr_pixels += costs[key][1]
+
+        start = time.perf_counter()
+        try:
+            return dict(
+                self.engine.ocr_many(
+                    requests,
+                    lang=lang or "+".join(self.languages),
+                    output_format=output_format or self.output_format,
+                    on_result=on_result,
                 )
-                want_cancel = self.progress.want_cancel()
-                if want_cancel is True:
-                    if askUser("Cancel processing?") is True:
-                        raise RuntimeError("Cancelled single threaded")
-                    else:
-                        self.progress._win.wantCancel = False
-            elif pbar is not None:
-                pbar.update()
-
-        return raw_results
-
-    def _ocr_unbatched_process(self, image_paths: List[str]):
-        raw_results = {}
-        completed = 0
-        pbar = tqdm(total=len(image_paths)) if ANKI_ENV is False else None
-
-        for image_path in image_paths:
-            ocr_text = self._ocr_img(
-                image_path, preserve_interword_spaces=self.preserve_interword_spaces, languages=self.languages
             )
-            completed += 1
-            raw_results[image_path] = ocr_text
-
-            if self.progress is not None:
-                self.progress.update(
-                    value=completed,
-                    max=len(image_paths),
-                    label=f"Running OCR... ({round(100 * completed / len(image_paths))} %)",
-                )
-                want_cancel = self.progress.want_cancel()
-                if want_cancel is True:
-                    if askUser("Cancel processing?") is True:
-                        raise RuntimeError("Cancelled single threaded")
-                    else:
-                        self.progress._win.wantCancel = False
-            elif pbar is not None:
-                pbar.update()
-        return raw_results
+        finally:
+            self.ocr_secs += time.perf_counter() - start
+            self.reporter.close()
 
     @staticmethod
     def clean_ocr_text(ocr_text: str) -> str:
         """
         :param ocr_text: Text output from tesseract
-        :returns: Cleaned text with extraneous newlines, double colon's, and \<'s removed
+        :returns: Cleaned text with extraneous newlines and double colon's removed
         """
-        cleaned_text = "\n".join([line.strip() for line in ocr_text.splitlines() if line.strip() != ""])
-        cleaned_text = re.sub(":+", ":", cleaned_text)
-        return cleaned_text
+        return DEFAULT_CLEANER.clean(ocr_text)
 
     @staticmethod
-    def _process_batched_results(batch_mapping: Dict[str, List[OCRImage]], results: Dict[str, str]) -> List[OCRImage]:
-        split_char = "\u000C"
+    def _process_batched_results(
+        batch_mapping: Dict[str, List[OCRImage]],
+        results: Dict[str, str],
+        split_pages: Callable[[str], List[OCRPage]] = text_to_pages,
+        clean_text: Callable[[str], str] = DEFAULT_CLEANER.clean,
+    ) -> List[OCRImage]:
         ocr_images = []
         for batch_txt, joined_results in results.items():
-            image_results = joined_results.split(split_char)
-            for ocr_image, ocr_text in zip(batch_mapping[batch_txt], image_results):
-                cleaned_text = "\n".join([line.strip() for line in ocr_text.splitlines() if line.strip() != ""])
-                ocr_image.text = cleaned_text
+            for ocr_image, page in zip(batch_mapping[batch_txt], split_pages(joined_results)):
+                ocr_image.text = clean_text(page.text)
+                ocr_image.words = page.words
                 ocr_images.append(ocr_image)
         return ocr_images
 
     @staticmethod
-    def _process_single_results(unbatched_mapped: List[Dict], raw_results: Dict[str, str]) -> List[OCRImage]:
+    def _process_single_results(
+        unbatched_mapped: List[Dict],
+        raw_results: Dict[str, str],
+        split_pages: Callable[[str], List[OCRPage]] = text_to_pages,
+        clean_text: Callable[[str], str] = DEFAULT_CLEANER.clean,
+    ) -> List[OCRImage]:
         ocr_images = []
         for mapped_image in unbatched_mapped:
             ocr_image = mapped_image["image"]
             image_path = mapped_image["path"]
-            ocr_text = raw_results[image_path]
-            cleaned_text = "\n".join([line.strip() for line in ocr_text.splitlines() if line.strip() != ""])
-            ocr_image.text = cleaned_text
+            if image_path not in raw_results:  # Not started before the deadline
+                continue
+            pages = split_pages(raw_results[image_path])
+            page = pages[0] if pages else OCRPage(text="")
+            ocr_image.text = clean_text(page.text)
+            ocr_image.words = page.words
             ocr_images.append(ocr_image)
         return ocr_images
 
+    def _split_pages(self, raw_result: str) -> List[OCRPage]:
+        if self.output_format == "tsv":
+            pages = tsv_to_pages(raw_result, min_confidence=self.min_confidence)
+            if not self.store_word_boxes:
+                for page in pages:
+                    page.words = None
+            return pages
+        return text_to_pages(raw_result)
+
     @classmethod
-    def _gen_batched_txts(
-        cls, notes_to_process: List[OCRNote], batch_size: int
-    ) -> Tuple[List[str], tempfile.TemporaryDirectory, Dict[str, List[OCRImage]]]:
-        batched_txts_dir = tempfile.TemporaryDirectory()  # Need to return so we can cleanup later
-        batched_txts = []
+    def _gen_batched_requests(
+        cls,
+        notes_to_process: List[OCRNote],
+        batch_size: int,
+        image_langs: Optional[Dict[str, str]] = None,
+        exclude_paths: Optional[Set[str]] = None,
+        large_image_pixels: int = 0,
+    ) -> Tuple[List[OCRRequest], Dict[str, List[OCRImage]]]:
+        """Plans the OCR requests, with small images batched together and large images on their own. Requests are
+        returned most expensive first, see plan_jobs()
+
+        :param image_langs: Dict of image path -> languages. If given, each batch only contains images with the same
+            languages, as tesseract uses the same languages for every image in a batch
+        :param exclude_paths: Paths of images that have already been processed, e.g. by tiling
+        :param large_image_pixels: Images with at least this many pixels aren't batched, 0 to batch every image
+        :returns: The requests, and a dict of request key -> images in the request
+        """
+        requests = []
         batch_mapping = {}
         images_to_process = cls._gen_images_to_process(notes_to_process=notes_to_process)
+        if exclude_paths:
+            images_to_process = [i for i in images_to_process if str(i.img_pth) not in exclude_paths]
 
-        for batch_id, batched_imgs in enumerate(batch(images_to_process, batch_size)):
-            batch_txt_pth = Path(batched_txts_dir.name, f"batch_imgs_{batch_id}.txt")
-            batch_txt_pth.write_text("\n".join([str(i.img_pth) for i in batched_imgs]))
-            batched_txts.append(str(batch_txt_pth))
-            batch_mapping[str(batch_txt_pth)] = batched_imgs
+        jobs = plan_jobs(images_to_process, batch_size, large_image_pixels=large_image_pixels, image_langs=image_langs)
+        for batch_id, job in enumerate(jobs):
+            key = f"batch_{batch_id}"
+            requests.append(OCRRequest(key=key, images=[str(i.img_pth) for i in job.images], lang=job.lang))
+            batch_mapping[key] = job.images
 
-        return batched_txts, batched_txts_dir, batch_mapping
+        return requests, batch_mapping
 
     @staticmethod
     def _gen_images_to_process(notes_to_process: List[OCRNote]) -> List[OCRImage]:
@@ -199,58 +328,292 @@ class OCR:
         return images_to_process
 
     @staticmethod
-    def _ocr_img(
-        img_pth: Union[Path, str, PathLike],
-        *,
-        preserve_interword_spaces: bool = False,
-        languages: Optional[List[str]] = None,
-    ) -> str:
-        """Wrapper for pytesseract.image_to_string
+    def _tesseract_config(preserve_interword_spaces: bool = False) -> str:
+        return (
+            f'--tessdata-dir "{TESSDATA_DIR.absolute()}" -c preserve_interword_spaces={int(preserve_interword_spaces)}'
+        )
+
+    def _route_languages(self, images: List[OCRImage]) -> Optional[Dict[str, str]]:
+        """Detects the script of each image, to only OCR it with the configured languages written in that script
 
-        img_pth can be either a pathlike to a single image, or a path to a textfile containing a list of image paths
+        :returns: Dict of image path -> tesseract languages, or None if languages aren't routed
         """
-        tessdata_config = (
-            f'--tessdata-dir "{TESSDATA_DIR.absolute()}" -c preserve_interword_spaces={int(preserve_interword_spaces)}'
+        if self.language_router is None:
+            return None
+        image_paths = list(dict.fromkeys(str(i.img_pth) for i in images))
+        logger.info(f"Detecting the script of {len(image_paths)} images")
+        osd_results = self._run_engine(
+            [OCRRequest(key=p, images=[p]) for p in image_paths],
+            output_format="osd",
+            lang=OSD_LANGUAGE,
+            label="Detecting scripts",
         )
+        image_langs = {
+            path: "+".join(self.language_router.languages_for_osd(osd_results.get(path, ""))) for path in image_paths
+        }
+        counts: Dict[str, int] = {}
+        for langs in image_langs.values():
+            counts[langs] = counts.get(langs, 0) + 1
+        logger.info(f"Images per language: {counts}")
+        return image_langs
 
-        return pytesseract.image_to_string(str(img_pth), lang="+".join(languages or ["eng"]), config=tessdata_config)
+    def _ocr_tiled_images(self, images: List[OCRImage], image_langs: Optional[Dict[str, str]] = None) -> List[OCRImage]:
+        """OCRs images over tile_max_pixels as overlapping bands, which are run concurrently and stitched back together.
+        This caps the memory used by each tesseract process, and lets a single huge image use several cores.
+
+        :returns: The images that were tiled, with their text set
+        """
+        if not self.tile_max_pixels:
+            return []
+        huge_images: Dict[str, List[OCRImage]] = {}
+        sizes: Dict[str, Tuple[int, int]] = {}
+        for image in images:
+            path = str(image.img_pth)
+            size = sizes.get(path) or image_size(path)
+            if size is not None and size[0] * size[1] > self.tile_max_pixels:
+                sizes[path] = size
+                huge_images.setdefault(path, []).append(image)
+        if not huge_images:
+            return []
+
+        logger.info(f"Splitting {len(huge_images)} large images into tiles")
+        with tempfile.TemporaryDirectory() as tiles_dir:
+            bands: Dict[str, List[Band]] = {}
+            for path in huge_images:
+                if can_tile(path):
+                    bands[path] = write_bands(path, tiles_dir, sizes[path], self.tile_max_pixels, self.tile_overlap)
+                else:
+                    png_bands = write_png_bands(path, tiles_dir, self.tile_max_pixels, self.tile_overlap)
+                    if png_bands is not None:
+                        bands[path] = png_bands
+            untileable = [path for path in huge_images if path not in bands]
+            if untileable:
+                logger.warning(
+                    f"{len(untileable)} large images will be OCR'd whole, which can use a lot of memory, as they "
+                    f"can't be split into tiles (only JPEGs and PNGs of scans can be): "
+                    f"{', '.join(Path(path).name for path in untileable)}"
+                )
+                for path in untileable:
+                    del huge_images[path]
+            if not huge_images:
+                return []
+            requests = [
+                OCRRequest(key=band.path, images=[band.path], lang=image_langs[path] if image_langs else None)
+                for path, bs in bands.items()
+                for band in bs
+            ]
+            raw_results = self._run_engine(requests, output_format="tsv", label="Running OCR on tiles")
+
+        tiled_images = []
+        for path, path_images in huge_images.items():
+            if any(band.path not in raw_results for band in bands[path]):  # Not finished before the deadline
+                continue
+            page = stitch_bands(bands[path], raw_results, min_confidence=self.min_confidence)
+            for image in path_images:
+                image.text = self.text_cleaner.clean(page.text)
+                image.words = page.words if self.store_word_boxes else None
+                tiled_images.append(image)
+        return tiled_images
 
     def run_ocr_on_query(self, note_ids: List[NoteId]) -> NotesQuery:
         """Main method for the ocr class. Runs OCR on a sequence of notes returned from a collection query.
 
+        Notes are loaded, OCR'd and saved a chunk at a time (see NotesQuery), so memory use is bounded however many
+        notes there are, and the chunks finished so far are kept if the run is stopped.
+
         :param note_ids: Note id's to process
+        :returns: The query, with the ids of the notes that were OCR'd in processed_note_ids, and of those that were
+            changed in changed_note_ids
         """
-        notes_query = NotesQuery(col=self.col, note_ids=note_ids)
+        assert self.col is not None
+        self.governor.start()
+        notes_query = NotesQuery(col=self.col, note_ids=note_ids, targeting=self.targeting)
         # self.col.modSchema(check=True)
+        num_chunks = ceil(len(notes_query) / notes_query.chunk_size)
+        chunks = notes_query.chunks()
+        for chunk_num in range(1, num_chunks + 1):
+            if self.governor.deadline_passed() or self.cancelled.is_set():
+                break
+            self.reporter.start_stage("Loading notes")
+            notes = next(chunks)
+            label = "Running OCR" if num_chunks == 1 else f"Running OCR, part {chunk_num} of {num_chunks}"
+            ocr_images = self._ocr_notes(notes, label=label)
+            self._write_back(notes_query, notes, ocr_images)
+        return notes_query
+
+    def _ocr_notes(self, notes: List[OCRNote], label: str = "Running OCR") -> List[OCRImage]:
+        """Runs OCR on every image in the notes, setting their text
+
+        :returns: The images that were OCR'd, without any not started before the deadline
+        """
+        images_to_process = self._gen_images_to_process(notes_to_process=notes)
+        image_langs = self._route_languages(images_to_process)
+        tiled_images = self._ocr_tiled_images(images_to_process, image_langs)
+        tiled_paths = {str(i.img_pth) for i in tiled_images}
+
         if self.use_batching:
-            logger.info(f"Processing {len(notes_query)} notes with _ocr_batch_process() ...")
-            batched_txts, batched_txts_dir, batch_mapping = self._gen_batched_txts(
-                notes_to_process=notes_query.notes, batch_size=self.batch_size
+            logger.info(f"Processing {len(notes)} notes with _ocr_batch_process() ...")
+            requests, batch_mapping = self._gen_batched_requests(
+                notes_to_process=notes,
+                batch_size=self.batch_size,
+                image_langs=image_langs,
+                exclude_paths=tiled_paths,
+                large_image_pixels=self.large_image_pixels,
+            )
+            raw_results = self._ocr_batch_process(requests, label=label)
+            self.reporter.start_stage("Parsing results")
+            ocr_images = self._process_batched_results(
+                batch_mapping, raw_results, split_pages=self._split_pages, clean_text=self.text_cleaner.clean
             )
-            raw_results = self._ocr_batch_process(batched_txts=batched_txts)
-            batched_txts_dir.cleanup()
-            ocr_images = self._process_batched_results(batch_mapping, raw_results)
 
         else:
-            logger.info(f"Processing {len(notes_query)} notes with _ocr_unbatched_process() ...")
-            images_to_process = self._gen_images_to_process(notes_to_process=notes_query.notes)
+            logger.info(f"Processing {len(notes)} notes with _ocr_unbatched_process() ...")
+            images_to_process = [i for i in images_to_process if str(i.img_pth) not in tiled_paths]
+            # Largest first, so the workers finish at about the same time
+            images_to_process = [job.images[0] for job in plan_jobs(images_to_process, batch_size=1)]
             image_paths = [str(i.img_pth) for i in images_to_process]
             unbatched_mapped = [{"image": image, "path": path} for image, path in zip(images_to_process, image_paths)]
-            raw_results = self._ocr_unbatched_process(image_paths=image_paths)
-            ocr_images = self._process_single_results(unbatched_mapped, raw_results)
+            raw_results = self._ocr_unbatched_process(image_paths=image_paths, input_langs=image_langs, label=label)
+            self.reporter.start_stage("Parsing results")
+            ocr_images = self._process_single_results(
+                unbatched_mapped, raw_results, split_pages=self._split_pages, clean_text=self.text_cleaner.clean
+            )
+        ocr_images = tiled_images + ocr_images
 
         logger.info(f"Processed {len(ocr_images)} images in total")
+        return ocr_images
 
-        # Post processing
-        for note in notes_query:
-            note.add_imgdata_to_note(method=self.text_output_location)
+    def _write_back(self, notes_query: NotesQuery, notes: List[OCRNote], ocr_images: List[OCRImage]):
+        """Saves the OCR text of the notes, which are a chunk of notes_query"""
+        self.reporter.start_stage("Saving notes")
+        # Post processing, saving all notes in one transaction rather than a commit per note. If the run stopped at
+        # the deadline, only notes with every image OCR'd are saved
+        processed = [note for note in notes if note.is_processed]
+        updated = {
+            note.note_id: note.add_imgdata_to_note(
+                method=self.text_output_location, save=False, field_name=self.ocr_field_name
+            )
+            for note in processed
+        }
+        # Notes which already had the same OCR text aren't saved, so they aren't uploaded by the next sync
+        changed = [note.note_id for note in processed if note.changed]
+        if self.col is not None and changed:
+            self.col.update_notes([updated[nid] for nid in changed])
+
+        indexed: Set[NoteId] = set()
+        if self.uses_search_index and self.col is not None:
+            with OCRSearchIndex.for_collection(self.col) as search_index:
+                indexed = search_index.update(ocr_images)
+        if self.text_output_location == "sidecar":  # Notes are never changed, only their text in the index
+            changed = [note.note_id for note in processed if note.note_id in indexed]
+        notes_query.processed_note_ids.extend(note.note_id for note in processed)
+        notes_query.changed_note_ids.extend(changed)
+        logger.info(f"Saved {len(changed)} of {len(processed)} notes, the rest were unchanged")
 
         if self.col is not None:
             self.col.save()
             self.col.reset()
             logger.info("Databased saved")
+
+    @property
+    def fingerprint(self) -> Dict[str, Any]:
+        """The engine and settings affecting OCR text, OCR bundles are only interchangeable between the same ones"""
+        return {
+            "engine": self.engine.name,
+            "engine_version": self.engine.version,
+            "languages": self.languages,
+            "route_languages": self.language_router is not None,
+            "output_format": self.output_format,
+            "min_confidence": self.min_confidence,
+            "preserve_interword_spaces": self.preserve_interword_spaces,
+            "text_cleaner": {
+                f.name: getattr(self.text_cleaner, f.name) for f in dataclass_fields(self.text_cleaner) if f.init
+            },
+        }
+
+    @property
+    def uses_search_index(self) -> bool:
+        """The sidecar text output location stores OCR text only in the search index, so always uses it"""
+        return self.use_search_index or self.text_output_location == "sidecar"
+
+    def read_ocr_results(self, note: OCRNote, search_index: Optional[OCRSearchIndex] = None) -> List[OCRImage]:
+        """:returns: The images of the note with OCR text, read from wherever text_output_location stores it"""
+        if self.text_output_location == "sidecar":
+            assert search_index is not None and self.col is not None
+            texts = search_index.texts_for_note(note.note_id, media_dir=self.col.media.dir())
+            return read_ocr_results(note, sidecar_texts=texts)
+        return read_ocr_results(note, field_name=self.ocr_field_name)
+
+    def export_bundle(self, note_ids: List[NoteId]) -> OCRBundle:
+        """Collects the OCR text already stored in the notes into a bundle, keyed by the hash of each image"""
+        assert self.col is not None
+        bundle = OCRBundle(fingerprint=self.fingerprint)
+        search_index = OCRSearchIndex.for_collection(self.col) if self.text_output_location == "sidecar" else None
+        try:
+            for note in NotesQuery(col=self.col, note_ids=note_ids):
+                for image in self.read_ocr_results(note, search_index):
+                    bundle.add(image)
+        finally:
+            if search_index is not None:
+                search_index.close()
+        logger.info(f"Exported OCR results for {len(bundle)} images")
+        return bundle
+
+    def import_bundle(self, bundle: OCRBundle, note_ids: List[NoteId]) -> NotesQuery:
+        """Applies the results in a bundle to the notes' images with the same contents, without running tesseract.
+        Notes are only changed if the bundle has results for all of their images.
+        """
+        assert self.col is not None
+        notes_query = NotesQuery(col=self.col, note_ids=note_ids, targeting=self.targeting)
+        num_imported = 0
+        for notes in notes_query.chunks():
+            ocr_images = []
+            for image in self._gen_images_to_process(notes_to_process=notes):
+                entry = bundle.get(image)
+                if entry is not None:
+                    entry.apply(image)
+                    if not self.store_word_boxes:
+                        image.words = None
+                    ocr_images.append(image)
+            num_imported += len(ocr_images)
+            self._write_back(notes_query, notes, ocr_images)
+        logger.info(f"Imported OCR results for {num_imported} images")
         return notes_query
 
+    def cancel(self):
+        """Cancels a running OCR process, killing all running tesseract processes. Safe to call from any thread."""
+        self.cancelled.set()
+        self.engine.cancel()
+
+    def ocr_archive(self, archive_pth: Union[str, PathLike]) -> OCRBundle:
+        """OCRs the images in a deck package (.apkg) or zip of images without extracting it, piping each image straight
+        from the archive to the engine, ARCHIVE_CHUNK_SIZE images at a time. Images are OCR'd with every configured
+        language and aren't tiled.
+
+        :returns: Bundle of the results, keyed by the hash of each image, to import into the deck's notes once it has
+            been imported into the collection
+        """
+        self.governor.start()
+        bundle = OCRBundle(fingerprint=self.fingerprint)
+        with MediaArchive(archive_pth) as archive:
+            num_chunks = ceil(len(archive) / ARCHIVE_CHUNK_SIZE)
+            for chunk_num, names in enumerate(batch(archive.names, ARCHIVE_CHUNK_SIZE), 1):
+                if self.governor.deadline_passed():
+                    break
+                requests: Dict[str, OCRRequest] = {}
+                for name in names:
+                    data = archive.read(name)
+                    key = data_hash(data)
+                    if key not in bundle.results and key not in requests:  # The same image under another name
+                        requests[key] = OCRRequest(key=key, images=[name], data=data)
+                label = "Running OCR" if num_chunks == 1 else f"Running OCR, part {chunk_num} of {num_chunks}"
+                for key, raw_result in self._run_engine(list(requests.values()), label=label).items():
+                    pages = self._split_pages(raw_result)
+                    page = pages[0] if pages else OCRPage(text="")
+                    bundle.results[key] = BundleEntry.from_page(self.text_cleaner.clean(page.text), page.words)
+        logger.info(f"OCR'd {len(bundle)} images from {archive_pth}")
+        return bundle
+
     def run_ocr_on_notes(self, note_ids: List[NoteId]) -> NotesQuery:
         """Main method for the ocr class. Runs OCR on a sequence of notes returned from a collection query.
 
@@ -260,37 +623,26 @@ class OCR:
         notes_query = self.run_ocr_on_query(note_ids=note_ids)
         return notes_query
 
-    def remove_ocr_on_notes(self, note_ids: List[NoteId]):
+    def remove_ocr_on_notes(self, note_ids: List[NoteId]) -> int:
         """Removes the OCR field on a sequence of notes returned from a collection query.
 
         :param note_ids: List of note ids
+        :returns: Number of notes that had OCR data removed
         """
-        # self.col.modSchema(check=True)
-        query_notes = NotesQuery(col=self.col, note_ids=note_ids)
-        for note in query_notes:
-            note.remove_OCR_text()
-        self.col.reset()
-        logger.info("Databased saved")
+        assert self.col is not None
+        ocr_field_name = self.ocr_field_name if self.text_output_location == "existing_field" else None
+        num_removed = BulkOCRRemover(col=self.col, ocr_field_name=ocr_field_name).remove(note_ids)
+        if self.uses_search_index:
+            with OCRSearchIndex.for_collection(self.col) as search_index:
+                num_indexed = search_index.remove_notes(note_ids)
+            if self.text_output_location == "sidecar":
+                num_removed = max(num_removed, num_indexed)
+        return num_removed
 
     @staticmethod
     def path_to_tesseract() -> str:
-        platform_name = platform.system()  # E.g. 'Windows'
-
-        exec_data = {
-            "Windows": str(Path(DEPS_DIR, "win", "tesseract", "tesseract.exe")),
-            "Darwin": str(Path(DEPS_DIR, "mac", "tesseract", "4.1.1", "bin", "tesseract")),
-        }
-        if platform_name == "Linux":
-            tess_path, _ = run_cmd("which tesseract", capture_output=True)
-        else:
-            tess_path = exec_data[platform_name]
-
-        if not Path(tess_path).exists():
-            raise FileNotFoundError(f"Could not find tesseract executable at {tess_path}")
-        return tess_path
+        return find_tesseract().exec_path
 
     def set_tesseract_exe_permission(self):
-        tess_pth = self.path_to_tesseract()
-        if platform.system() == "Darwin":
-            logger.info(f"Setting +x permission to {tess_pth}")
-            subprocess.Popen(["chmod", "+x", tess_pth])
+        if self.tesseract is not None:
+            set_tesseract_exe_permission(self.tesseract.exec_path)
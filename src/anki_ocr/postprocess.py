@@ -0,0 +1,65 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import List, Pattern, Tuple
+
+# Ligatures tesseract sometimes emits for fonts that render them, mapped to their plain letters
+LIGATURES = str.maketrans({"ﬀ": "ff", "ﬁ": "fi", "ﬂ": "fl", "ﬃ": "ffi", "ﬄ": "ffl", "ﬅ": "st", "ﬆ": "st"})
+LIGATURE_RE = re.compile("[ﬀ-ﬆ]")
+
+# A word broken over two lines with a hyphen, e.g. "respira-\ntory"
+HYPHENATION_RE = re.compile(r"(?<=\w)-\n(?=[^\W\d_])")
+WHITESPACE_RUN_RE = re.compile(r"[^\S\n]{2,}|\t")
+COLON_RUN_RE = re.compile(r":{2,}")
+
+
+@dataclass
+class TextCleaner:
+    """Post-processes OCR text from tesseract, with each rule compiled once and applied to the whole text of an image.
+
+    Lines are always stripped and blank lines dropped, stripping each line only once.
+    """
+
+    normalize_unicode: bool = True  # Replace ligatures and compose accented characters (NFC)
+    join_hyphenated_words: bool = False  # Join words hyphenated across a line break
+    collapse_whitespace: bool = False  # Collapse runs of spaces within a line, undoes preserve_interword_spaces
+    collapse_colons: bool = True  # E.g. "::" -> ":"
+    # (substring, pattern, replacement), the pattern is only run when the substring is in the text
+    _rules: List[Tuple[str, Pattern, str]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._rules = []
+        if self.collapse_whitespace:
+            self._rules.append(("", WHITESPACE_RUN_RE, " "))
+        if self.collapse_colons:
+            self._rules.append(("::", COLON_RUN_RE, ":"))
+        if self.join_hyphenated_words:
+            self._rules.append(("-\n", HYPHENATION_RE, ""))
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TextCleaner":
+        return cls(
+            normalize_unicode=config["normalize_unicode"],
+            join_hyphenated_words=config["join_hyphenated_words"],
+            collapse_whitespace=config["collapse_whitespace"],
+            collapse_colons=config["collapse_colons"],
+        )
+
+    def clean(self, ocr_text: str) -> str:
+        """
+        :param ocr_text: Text output from tesseract, for a single image
+        :returns: Cleaned text
+        """
+        if self.normalize_unicode and not ocr_text.isascii():
+            if LIGATURE_RE.search(ocr_text):
+                ocr_text = ocr_text.translate(LIGATURES)
+            if not unicodedata.is_normalized("NFC", ocr_text):
+                ocr_text = unicodedata.normalize("NFC", ocr_text)
+        text = "\n".join([stripped for line in ocr_text.splitlines() if (stripped := line.strip())])
+        for substring, pattern, replacement in self._rules:
+            if substring in text:
+                text = pattern.sub(replacement, text)
+        return text
+
+
+DEFAULT_CLEANER = TextCleaner()
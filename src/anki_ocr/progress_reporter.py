@@ -0,0 +1,143 @@
+import time
+from typing import Callable, Optional
+
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+# At most this many UI updates a second, however quickly images are processed
+UPDATE_INTERVAL_SECS = 0.1
+# Weight of the latest rate in the smoothed rate, lower is smoother but slower to react to a change of pace
+RATE_SMOOTHING = 0.3
+
+
+def format_duration(secs: float) -> str:
+    secs = round(secs)
+    if secs < 60:
+        return f"{secs} s"
+    if secs < 3600:
+        return f"{secs // 60} min {secs % 60} s"
+    return f"{secs // 3600} h {secs % 3600 // 60} min"
+
+
+class ProgressReporter:
+    """Reports progress of an OCR run through its stages (e.g. loading notes, OCR, saving notes), to either Anki's
+    ProgressManager or a tqdm progress bar.
+
+    Updates are rate limited to one per UPDATE_INTERVAL_SECS, so processing many small images isn't slowed down by
+    redrawing the UI after each one. Each item (image) can have a cost, e.g. its number of pixels, so the ETA accounts
+    for large images taking longer than small ones. Rates are smoothed, so the ETA doesn't jump around as results from
+    concurrent processes arrive in bursts.
+    """
+
+    def __init__(
+        self,
+        progress=None,
+        pbar_factory: Optional[Callable] = None,
+        ask_cancel: Optional[Callable[[], bool]] = None,
+        update_interval: float = UPDATE_INTERVAL_SECS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param progress: Anki's ProgressManager
+        :param pbar_factory: Used instead of progress, called as pbar_factory(total=..., desc=...), e.g. tqdm
+        :param ask_cancel: Called when the user asks to cancel, returns True to cancel the run
+        """
+        self.progress = progress
+        self.pbar_factory = pbar_factory
+        self.ask_cancel = ask_cancel
+        self.update_interval = update_interval
+        self.clock = clock
+        self._pbar = None
+        self.stage = ""
+        self.total_items = 0
+        self.total_cost = 0.0
+        self.done_items = 0
+        self.done_cost = 0.0
+        self.items_per_sec: Optional[float] = None
+        self.cost_per_sec: Optional[float] = None
+        self._last_update = 0.0
+        self._last_items = 0
+        self._last_cost = 0.0
+
+    def start_stage(self, stage: str, total_items: int = 0, total_cost: float = 0):
+        """:param total_cost: Total cost of all items, 0 if costs aren't known, which gives each item a cost of 1"""
+        self.close()
+        self.stage = stage
+        self.total_items = total_items
+        self.total_cost = total_cost or total_items
+        self.done_items = 0
+        self.done_cost = 0.0
+        self.items_per_sec = self.cost_per_sec = None
+        self._last_update = self.clock()
+        self._last_items = 0
+        self._last_cost = 0.0
+        logger.debug(f"{stage}, {total_items} items")
+        if self.pbar_factory is not None and total_items:
+            self._pbar = self.pbar_factory(total=total_items, desc=stage)
+        self._show()
+
+    def advance(self, items: int = 1, cost: float = 0):
+        """Records items as done, updating the UI if it hasn't been for update_interval
+
+        :param cost: Cost of the items, 0 to count each as a cost of 1
+        """
+        self.done_items += items
+        self.done_cost += cost or items
+        now = self.clock()
+        if now - self._last_update < self.update_interval and self.done_items < self.total_items:
+            return
+        self._update_rates(now)
+        self._show()
+        self._check_cancel()
+
+    def _update_rates(self, now: float):
+        elapsed = now - self._last_update
+        if elapsed <= 0:
+            return
+        items_rate = (self.done_items - self._last_items) / elapsed
+        cost_rate = (self.done_cost - self._last_cost) / elapsed
+        if self.items_per_sec is None or self.cost_per_sec is None:
+            self.items_per_sec, self.cost_per_sec = items_rate, cost_rate
+        else:
+            self.items_per_sec = RATE_SMOOTHING * items_rate + (1 - RATE_SMOOTHING) * self.items_per_sec
+            self.cost_per_sec = RATE_SMOOTHING * cost_rate + (1 - RATE_SMOOTHING) * self.cost_per_sec
+        self._last_update, self._last_items, self._last_cost = now, self.done_items, self.done_cost
+
+    @property
+    def eta_secs(self) -> Optional[float]:
+        if not self.cost_per_sec:
+            return None
+        return max(0.0, self.total_cost - self.done_cost) / self.cost_per_sec
+
+    @property
+    def label(self) -> str:
+        if not self.total_items:
+            return f"{self.stage}..."
+        label = f"{self.stage}... {self.done_items}/{self.total_items}"
+        if self.items_per_sec is not None:
+            label += f", {self.items_per_sec:.1f} images/s"
+        eta = self.eta_secs
+        if eta is not None and self.done_items < self.total_items:
+            label += f", about {format_duration(eta)} left"
+        return label
+
+    def _show(self):
+        if self.progress is not None:
+            self.progress.update(value=self.done_items, max=self.total_items, label=self.label)
+        elif self._pbar is not None:
+            self._pbar.update(self.done_items - self._pbar.n)
+            if self.eta_secs is not None:
+                self._pbar.set_postfix_str(f"about {format_duration(self.eta_secs)} left", refresh=False)
+
+    def _check_cancel(self):
+        if self.progress is None or self.progress.want_cancel() is not True:
+            return
+        if self.ask_cancel is not None and self.ask_cancel() is True:
+            raise RuntimeError("Cancelled processing")
+        self.progress._win.wantCancel = False
+
+    def close(self):
+        if self._pbar is not None:
+            self._pbar.close()
+            self._pbar = None
@@ -1,11 +1,11 @@
 # Modified pytesseract to work with Anki, see original https://github.com/madmaze/pytesseract
+import asyncio
 import re
 import shlex
 import string
 import subprocess
 import sys
 from contextlib import contextmanager
-from distutils.version import LooseVersion
 from enum import Enum
 from errno import ENOENT
 from functools import wraps
@@ -19,11 +19,19 @@ from os.path import normpath
 from os.path import realpath
 from tempfile import NamedTemporaryFile
 from time import sleep
-from typing import Optional
+from typing import Any, List, Optional, Union
+
+from .version import LooseVersion
 
 # Anki does not come with Pillow, numpy or pandas installed, and I'm not going to attempt to vendorise it!
 tesseract_cmd = "tesseract"
 
+# Images are passed either as a file path, or as the contents of an image file which are piped to tesseract's stdin
+ImageData = Union[bytes, bytearray, memoryview]
+ImageInput = Union[str, ImageData]
+IMAGE_DATA_TYPES = (bytes, bytearray, memoryview)
+STDIN_INPUT = "stdin"  # Tesseract's input filename for reading the image from stdin
+
 DEFAULT_ENCODING = "utf-8"
 LANG_PATTERN = re.compile("^[a-z_]+$")
 RGB_MODE = "RGB"
@@ -39,6 +47,15 @@ SUPPORTED_FORMATS = {
     "WEBP",
 }
 
+OSD_KEYS = {
+    "Page number": ("page_num", int),
+    "Orientation in degrees": ("orientation", int),
+    "Rotate": ("rotate", int),
+    "Orientation confidence": ("orientation_conf", float),
+    "Script": ("script", str),
+    "Script confidence": ("script_conf", float),
+}
+
 
 class Output(Enum):
     BYTES = 0
@@ -92,14 +109,14 @@ def kill(process, code):
 
 
 @contextmanager
-def timeout_manager(proc, seconds=None):
+def timeout_manager(proc, seconds=None, input_data=None):
     try:
         if not seconds:
-            yield proc.communicate()[1]
+            yield proc.communicate(input_data)[1]
             return
 
         try:
-            _, error_string = proc.communicate(timeout=seconds)
+            _, error_string = proc.communicate(input_data, timeout=seconds)
             yield error_string
         except subprocess.TimeoutExpired:
             kill(proc, -1)
@@ -142,8 +159,15 @@ def save(image):
             if isinstance(image, str):
                 yield f.name, realpath(normpath(normcase(image)))
                 return
+            elif isinstance(image, IMAGE_DATA_TYPES):
+                # Piped to stdin by run_tesseract(), rather than written to a temporary file
+                yield f.name, STDIN_INPUT
+                return
             else:
-                raise TypeError("Only file paths are supported as Pillow and Numpy are not installed in Anki!")
+                raise TypeError(
+                    "Only file paths and image file contents are supported as Pillow and Numpy are not installed in "
+                    "Anki!"
+                )
     finally:
         cleanup(f.name)
 
@@ -172,16 +196,8 @@ def subprocess_args(include_stdout=True):
     return kwargs
 
 
-def run_tesseract(
-    input_filename,
-    output_filename_base,
-    extension,
-    lang,
-    config="",
-    nice=0,
-    timeout=0,
-):
-    cmd_args = []
+def tesseract_cmd_args(input_filename, output_filename_base, extension, lang, config="", nice=0):
+    cmd_args: List[str] = []
 
     if not sys.platform.startswith("win32") and nice != 0:
         cmd_args += ("nice", "-n", str(nice))
@@ -197,6 +213,24 @@ def run_tesseract(
     if extension and extension not in {"box", "osd", "tsv", "xml"}:
         cmd_args.append(extension)
 
+    return cmd_args
+
+
+def run_tesseract(
+    input_filename,
+    output_filename_base,
+    extension,
+    lang,
+    config="",
+    nice=0,
+    timeout=0,
+    input_data=None,
+):
+    """
+    :param input_data: Contents of the image file, written to tesseract's stdin when input_filename is STDIN_INPUT
+    """
+    cmd_args = tesseract_cmd_args(input_filename, output_filename_base, extension, lang, config, nice)
+
     try:
         proc = subprocess.Popen(cmd_args, **subprocess_args())
     except OSError as e:
@@ -204,7 +238,7 @@ def run_tesseract(
             raise e
         raise TesseractNotFoundError()
 
-    with timeout_manager(proc, timeout) as error_string:
+    with timeout_manager(proc, timeout, input_data) as error_string:
         if proc.returncode:
             raise TesseractError(proc.returncode, get_errors(error_string))
 
@@ -227,6 +261,7 @@ def run_and_get_output(
             "config": config,
             "nice": nice,
             "timeout": timeout,
+            "input_data": image if isinstance(image, IMAGE_DATA_TYPES) else None,
         }
 
     run_tesseract(**kwargs)
@@ -237,34 +272,132 @@ def run_and_get_output(
         return output_file.read().decode(DEFAULT_ENCODING)
 
 
+async def kill_async(process):
+    try:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    except ProcessLookupError:  # Already exited
+        pass
+
+
+async def run_tesseract_async(
+    input_filename,
+    output_filename_base,
+    extension,
+    lang,
+    config="",
+    nice=0,
+    timeout=0,
+    env=None,
+    processes=None,
+    input_data=None,
+):
+    """Asyncio equivalent of run_tesseract(), the child process is killed on timeout or task cancellation
+
+    :param processes: Optional set, which the child process is added to while it is running
+    :param input_data: Contents of the image file, written to tesseract's stdin when input_filename is STDIN_INPUT
+    """
+    cmd_args = tesseract_cmd_args(input_filename, output_filename_base, extension, lang, config, nice)
+    kwargs = subprocess_args()
+    if env is not None:
+        kwargs["env"] = env
+
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd_args, **kwargs)
+    except OSError as e:
+        if e.errno != ENOENT:
+            raise e
+        raise TesseractNotFoundError()
+
+    if processes is not None:
+        processes.add(proc)
+    try:
+        _, error_string = await asyncio.wait_for(proc.communicate(input_data), timeout or None)
+    except asyncio.TimeoutError:
+        await kill_async(proc)
+        raise RuntimeError("Tesseract process timeout")
+    except asyncio.CancelledError:
+        await kill_async(proc)
+        raise
+    finally:
+        if processes is not None:
+            processes.discard(proc)
+
+    if proc.returncode:
+        raise TesseractError(proc.returncode, get_errors(error_string))
+
+
+async def run_and_get_output_async(
+    image,
+    extension="",
+    lang=None,
+    config="",
+    nice=0,
+    timeout=0,
+    return_bytes=False,
+    env=None,
+    processes=None,
+):
+    with save(image) as (temp_name, input_filename):
+        kwargs = {
+            "input_filename": input_filename,
+            "output_filename_base": temp_name,
+            "extension": extension,
+            "lang": lang,
+            "config": config,
+            "nice": nice,
+            "timeout": timeout,
+            "env": env,
+            "processes": processes,
+            "input_data": image if isinstance(image, IMAGE_DATA_TYPES) else None,
+        }
+
+    try:
+        await run_tesseract_async(**kwargs)
+        filename = kwargs["output_filename_base"] + extsep + extension
+        with open(filename, "rb") as output_file:
+            if return_bytes:
+                return output_file.read()
+            return output_file.read().decode(DEFAULT_ENCODING)
+    finally:
+        cleanup(kwargs["output_filename_base"])
+
+
 def file_to_dict(tsv, cell_delimiter, str_col_idx):
-    result = {}
-    rows = [row.split(cell_delimiter) for row in tsv.strip().split("\n")]
-    if len(rows) < 2:
-        return result
+    """Parses TSV output into a dict of column name -> list of values, in a single pass over the rows.
 
-    header = rows.pop(0)
-    length = len(header)
-    if len(rows[-1]) < length:
-        # Fixes bug that occurs when last text string in TSV is null, and
-        # last row is missing a final cell in TSV file
-        rows[-1].append("")
+    Cells containing only digits are converted to int, except for those in the str_col_idx column.
+    """
+    lines = tsv.strip().split("\n")
+    if len(lines) < 2:
+        return {}
 
+    header = lines[0].split(cell_delimiter)
+    length = len(header)
     if str_col_idx < 0:
         str_col_idx += length
 
-    for i, head in enumerate(header):
-        result[head] = list()
-        for row in rows:
-            if len(row) <= i:
-                continue
-
-            val = row[i]
-            if row[i].isdigit() and i != str_col_idx:
-                val = int(row[i])
-            result[head].append(val)
+    columns: List[List[Any]] = [[] for _ in range(length)]
+    last_row_idx = len(lines) - 1
+    for row_idx in range(1, len(lines)):
+        row = lines[row_idx].split(cell_delimiter)
+        if row_idx == last_row_idx and len(row) < length:
+            # Fixes bug that occurs when last text string in TSV is null, and
+            # last row is missing a final cell in TSV file
+            row.append("")
+        for i, (column, val) in enumerate(zip(columns, row)):
+            if i != str_col_idx and val.isdigit():
+                column.append(int(val))
+            else:
+                column.append(val)
 
-    return result
+    return dict(zip(header, columns))
 
 
 def is_valid(val, _type):
@@ -281,6 +414,14 @@ def is_valid(val, _type):
     return True
 
 
+def osd_to_dict(osd):
+    return {
+        OSD_KEYS[kv[0]][0]: OSD_KEYS[kv[0]][1](kv[1])
+        for kv in (line.split(": ") for line in osd.split("\n"))
+        if len(kv) == 2 and kv[0] in OSD_KEYS and is_valid(kv[1], OSD_KEYS[kv[0]][1])
+    }
+
+
 @run_once
 def get_languages(config=""):
     cmd_args = [tesseract_cmd, "--list-langs"]
@@ -338,15 +479,97 @@ def get_tesseract_version():
 
 
 def image_to_string(
-    image: str,
+    image: ImageInput,
     lang: Optional[str] = None,
     config: str = "",
     nice: int = 0,
     timeout=0,
 ):
     """
-    Returns the result of a Tesseract OCR run on the provided image to string
+    Returns the result of a Tesseract OCR run on the provided image to string. The image is either a path, or the
+    contents of an image file (bytes or a memoryview) which are piped to tesseract without writing them to disk
     """
     args = [image, "txt", lang, config, nice, timeout]
 
     return run_and_get_output(*args)
+
+
+async def image_to_string_async(
+    image: ImageInput,
+    lang: Optional[str] = None,
+    config: str = "",
+    nice: int = 0,
+    timeout=0,
+    env=None,
+    processes=None,
+):
+    """
+    Asyncio equivalent of image_to_string(), for running many tesseract processes concurrently from a single thread
+    """
+    return await run_and_get_output_async(image, "txt", lang, config, nice, timeout, env=env, processes=processes)
+
+
+def image_to_data(
+    image: ImageInput,
+    lang: Optional[str] = None,
+    config: str = "",
+    nice: int = 0,
+    timeout=0,
+):
+    """
+    Returns the TSV output of a Tesseract OCR run on the provided image, with a row per word including its box and
+    confidence. Use file_to_dict(result, "\t", -1) to parse it.
+    """
+    config = f"-c tessedit_create_tsv=1 {config}"
+    args = [image, "tsv", lang, config, nice, timeout]
+
+    return run_and_get_output(*args)
+
+
+async def image_to_data_async(
+    image: ImageInput,
+    lang: Optional[str] = None,
+    config: str = "",
+    nice: int = 0,
+    timeout=0,
+    env=None,
+    processes=None,
+):
+    """
+    Asyncio equivalent of image_to_data()
+    """
+    config = f"-c tessedit_create_tsv=1 {config}"
+    return await run_and_get_output_async(image, "tsv", lang, config, nice, timeout, env=env, processes=processes)
+
+
+def image_to_osd(
+    image: ImageInput,
+    lang: str = "osd",
+    config: str = "",
+    nice: int = 0,
+    timeout=0,
+):
+    """
+    Returns the orientation and script detection (OSD) of the provided image, parse it with osd_to_dict().
+    Needs osd.traineddata to be installed.
+    """
+    config = f"--psm 0 {config.strip()}"
+    args = [image, "osd", lang, config, nice, timeout]
+
+    return run_and_get_output(*args)
+
+
+async def image_to_osd_async(
+    image: ImageInput,
+    lang: str = "osd",
+    config: str = "",
+    nice: int = 0,
+    timeout=0,
+    env=None,
+    processes=None,
+):
+    """
+    Asyncio equivalent of image_to_osd()
+    """
+    config = f"--psm 0 {config.strip()}"
+    return await run_and_get_output_async(image, "osd", lang, config, nice, timeout, env=env, processes=processes)
@@ -0,0 +1,164 @@
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from anki.collection import Collection
+from anki.notes import Note, NoteId
+from anki.utils import ids2str
+
+from .api import OCR_MARKER_ATTR, OCRField, OCRNote
+from .bundle import OCR_FIELD_IMAGE_RE
+from .notetypes import OCR_MODEL_SUFFIX, NotetypeRegistry
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+FIELD_SEPARATOR = "\x1f"
+
+# Tokenizes img tags, without being tripped up by ">" inside quoted attribute values, e.g. title="a > b"
+IMG_TAG_RE = re.compile(r"""<img\b(?:[^>"']|"[^"]*"|'[^']*')*>""", re.IGNORECASE)
+ATTR_RE = re.compile(r"""(\s+)([^\s"'=<>/]+)(\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>`]+))?""")
+SRC_RE = re.compile(r"""\ssrc\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""", re.IGNORECASE)
+
+
+OCR_ATTRS = {"title", "data-ocr-words", OCR_MARKER_ATTR}
+
+
+def img_src(img_tag: str) -> Optional[str]:
+    src = SRC_RE.search(img_tag)
+    return None if src is None else next(s for s in src.groups() if s is not None)
+
+
+def is_ocr_image(src: str) -> bool:
+    """:returns: Whether the addon OCRs images of this format"""
+    return Path(src).suffix.lower() in OCRField.allowed_img_formats
+
+
+def _strip_title_attr(img_tag: re.Match) -> str:
+    tag = img_tag.group(0)
+    attrs = tag[len("<img") :]
+    if not any(attr.group(2).lower() == OCR_MARKER_ATTR for attr in ATTR_RE.finditer(attrs)):
+        return tag
+    src = img_src(tag)
+    if src is None or not is_ocr_image(src):
+        return tag
+    return tag[: len("<img")] + ATTR_RE.sub(
+        lambda attr: "" if attr.group(2).lower() in OCR_ATTRS else attr.group(0), attrs
+    )
+
+
+def remove_ocr_titles(field_text: str) -> str:
+    """Removes the title attr (where the OCR text is stored) and any word boxes from the img tags the addon OCR'd,
+    marked with OCR_MARKER_ATTR, leaving titles the user wrote and the rest of the html as-is"""
+    if OCR_MARKER_ATTR not in field_text.lower():
+        return field_text
+    return IMG_TAG_RE.sub(_strip_title_attr, field_text)
+
+
+class BulkOCRRemover:
+    """Removes OCR data from many notes at once, without parsing every field with BeautifulSoup.
+
+    Notes with OCR data are found with a single SQL query, _OCR notetypes are changed back once per notetype, and all
+    modified notes are written back in one transaction.
+    """
+
+    def __init__(self, col: Collection, ocr_field_name: Optional[str] = None):
+        """
+        :param ocr_field_name: Also clears OCR text from this field, for the existing_field text output location
+        """
+        self.col = col
+        self.registry = NotetypeRegistry(col)
+        self.ocr_field_name = ocr_field_name
+        self._ocr_field_indexes: Dict[int, Optional[int]] = {}  # Notetype id -> index of its ocr_field_name field
+
+    def ocr_model_ids(self) -> Dict[int, str]:
+        return self.registry.ocr_model_ids()
+
+    def find_notes_with_ocr(self, note_ids: Sequence[NoteId]) -> Dict[NoteId, int]:
+        """:returns: Dict of note id -> notetype id for each of note_ids which has OCR text or an _OCR notetype"""
+        assert self.col.db is not None
+        rows = self.col.db.all(
+            f"select id, mid from notes where id in {ids2str(note_ids)} "
+            f"and (flds like '%{OCR_MARKER_ATTR}=%' or mid in {ids2str(self.ocr_model_ids().keys())}"
+            + (f" or flds like '%Image: %<br/>{'-' * 20}<br/>%'" if self.ocr_field_name else "")
+            + ")"
+        )
+        return {NoteId(nid): mid for nid, mid in rows}
+
+    def _orig_model_for(self, ocr_model: Dict) -> Dict:
+        orig_model_name = ocr_model["name"][: -len(OCR_MODEL_SUFFIX)]
+        orig_mid = self.registry.orig_model_id_for(ocr_model["id"])
+        if orig_mid is not None:
+            logger.debug(f"Original Model already exists, using '{orig_model_name}'")
+            return self.registry.model(orig_mid)
+
+        logger.info(f"Creating new (original) model named '{orig_model_name}'")
+        return self.registry.model(self.registry.add(OCRNote.create_orig_notemodel(ocr_model)))
+
+    def revert_ocr_models(self, notes_by_model: Dict[int, List[NoteId]]):
+        """Changes notes with an _OCR notetype back to the original notetype, dropping the OCR field"""
+        ocr_model_ids = self.ocr_model_ids()
+        for mid, nids in notes_by_model.items():
+            if mid not in ocr_model_ids:
+                continue
+            ocr_model = self.registry.model(mid)
+            orig_model = self._orig_model_for(ocr_model)
+            logger.info(f"Changing {len(nids)} notes from '{ocr_model['name']}' to '{orig_model['name']}'")
+            self.col.models.change(
+                ocr_model,
+                nids=nids,
+                newModel=orig_model,
+                fmap={i: i for i in range(len(orig_model["flds"]))},
+                cmap={i: i for i in range(len(orig_model["tmpls"]))},
+            )
+
+    def _ocr_field_index(self, mid: int) -> Optional[int]:
+        if self.ocr_field_name is None:
+            return None
+        if mid not in self._ocr_field_indexes:
+            names = [fld["name"] for fld in self.registry.model(mid)["flds"]]
+            self._ocr_field_indexes[mid] = names.index(self.ocr_field_name) if self.ocr_field_name in names else None
+        return self._ocr_field_indexes[mid]
+
+    def strip_ocr_titles(self, note_ids: Sequence[NoteId]) -> List[Note]:
+        """Removes OCR titles, and clears ocr_field_name if it holds OCR text
+
+        :returns: Notes whose fields changed, not yet saved to the database
+        """
+        assert self.col.db is not None
+        changed = []
+        for nid, mid, flds in self.col.db.all(f"select id, mid, flds from notes where id in {ids2str(note_ids)}"):
+            fields = flds.split(FIELD_SEPARATOR)
+            new_fields = [remove_ocr_titles(field) for field in fields]
+            ocr_field_index = self._ocr_field_index(mid)
+            if ocr_field_index is not None and OCR_FIELD_IMAGE_RE.match(new_fields[ocr_field_index]):
+                new_fields[ocr_field_index] = ""
+            if new_fields == fields:
+                continue
+            note = self.col.get_note(nid)
+            note.fields = new_fields
+            changed.append(note)
+        return changed
+
+    def remove(self, note_ids: Sequence[NoteId]) -> int:
+        """Removes OCR data from note_ids
+
+        :returns: Number of notes that had OCR data removed, i.e. were changed back from an _OCR notetype or rewritten
+        """
+        notes_with_ocr = self.find_notes_with_ocr(note_ids)
+        if not notes_with_ocr:
+            return 0
+
+        notes_by_model: Dict[int, List[NoteId]] = {}
+        for nid, mid in notes_with_ocr.items():
+            notes_by_model.setdefault(mid, []).append(nid)
+        ocr_model_ids = self.ocr_model_ids()
+        reverted = {nid for nid, mid in notes_with_ocr.items() if mid in ocr_model_ids}
+        self.revert_ocr_models(notes_by_model)
+
+        changed_notes = self.strip_ocr_titles(list(notes_with_ocr))
+        if changed_notes:
+            self.col.update_notes(changed_notes)
+        num_removed = len(reverted | {note.id for note in changed_notes})
+        logger.info(f"Removed OCR data from {num_removed} notes, rewriting {len(changed_notes)}")
+        return num_removed
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from . import pytesseract
+from .governor import ResourceGovernor
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+# Called in the event loop thread as (input, ocr_text, completed, total), after each tesseract process exits.
+# Raising inside the callback (e.g. the user cancelling) cancels the run and kills every running process.
+ResultCallback = Callable[[str, str, int, int], None]
+
+# Each takes the image, then keyword arguments lang, config, nice, timeout, env and processes
+OUTPUT_FORMATS: Dict[str, Callable[..., Awaitable[str]]] = {
+    "txt": pytesseract.image_to_string_async,
+    "tsv": pytesseract.image_to_data_async,
+    "osd": pytesseract.image_to_osd_async,
+}
+
+# How often a worker held back by the governor checks whether it may start again
+GOVERNOR_POLL_SECS = 0.5
+
+
+class TesseractRunner:
+    """Runs many tesseract processes concurrently from a single thread, using asyncio subprocesses.
+
+    At most max_concurrency processes are alive at any time. Use run() from synchronous code, and cancel() from any
+    thread to tear down every running process.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        timeout: float = 0,
+        nice: int = 0,
+        governor: Optional[ResourceGovernor] = None,
+    ):
+        """
+        :param max_concurrency: Maximum number of tesseract processes running at once
+        :param timeout: Timeout in seconds for each tesseract process, 0 for no timeout
+        :param nice: Niceness of each tesseract process, ignored on Windows
+        :param governor: If given, limits concurrency below max_concurrency to stay within its resource budget, and
+            stops starting new processes once its deadline has passed. Inputs not started by then have no result
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.nice = nice
+        self.governor = governor
+        self._processes: Set[asyncio.subprocess.Process] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._main_task: Optional[asyncio.Task] = None
+        self._cancelled = threading.Event()
+
+    def _child_env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        if self.max_concurrency > 1:
+            # Each tesseract process would otherwise spawn a thread per core, oversubscribing the CPU
+            env.setdefault("OMP_THREAD_LIMIT", "1")
+        return env
+
+    async def _run_one(
+        self,
+        input_pth: str,
+        lang: Optional[str],
+        config: str,
+        output_format: str,
+        env,
+        image_data: Optional[pytesseract.ImageData] = None,
+    ) -> str:
+        ocr_func = OUTPUT_FORMATS[output_format]
+        try:
+            return await ocr_func(
+                input_pth if image_data is None else image_data,
+                lang=lang,
+                config=config,
+                nice=self.nice,
+                timeout=self.timeout,
+                env=env,
+                processes=self._processes,
+            )
+        except pytesseract.TesseractError as e:
+            if output_format != "osd":
+                raise
+            # Detection fails on images with too little text, which then just aren't routed
+            logger.debug(f"Orientation and script detection failed for {input_pth}: {e.message}")
+            return ""
+
+    async def run_async(
+        self,
+        inputs: List[str],
+        *,
+        lang: Optional[str] = None,
+        config: str = "",
+        output_format: str = "txt",
+        langs: Optional[Dict[str, str]] = None,
+        on_result: Optional[ResultCallback] = None,
+        image_data: Optional[Dict[str, pytesseract.ImageData]] = None,
+    ) -> Dict[str, str]:
+        """Runs tesseract on each input, which is either an image path, a text file listing image paths, or a name for
+        an image in image_data
+
+        Inputs are taken from a shared queue in the given order by max_concurrency workers, each starting the next
+        input as soon as its previous one finishes. Passing the most expensive inputs first keeps every worker busy
+        until the end of the run, rather than one worker finishing a large image while the rest sit idle.
+
+        :param output_format: Either "txt" for plain text, "tsv" for TSV including word boxes and confidences, or "osd"
+            for orientation and script detection. Inputs where detection fails give an empty result instead of an error
+        :param langs: Dict of input -> languages, overriding lang for those inputs
+        :param image_data: Dict of input -> contents of its image file, which are piped to tesseract's stdin instead
+            of reading the input from disk
+        :returns: Dict of input -> raw tesseract output. Missing inputs if the governor's deadline passed
+        """
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        if self._cancelled.is_set():
+            raise RuntimeError("OCR processing cancelled")
+
+        env = self._child_env()
+        langs = langs or {}
+        image_data = image_data or {}
+        pending = deque(inputs)
+        raw_results: Dict[str, str] = {}
+
+        async def may_start(worker_id: int) -> bool:
+            """Waits until the governor allows this worker to run, returns False once the deadline has passed or
+            there's nothing left to run
+            """
+            governor = self.governor
+            if governor is None:
+                return True
+            while pending and not governor.deadline_passed():
+                if worker_id < governor.allowed_workers(proc.pid for proc in self._processes):
+                    return True
+                await asyncio.sleep(GOVERNOR_POLL_SECS)
+            return False
+
+        async def worker(worker_id: int):
+            while pending and await may_start(worker_id):
+                if not pending:  # Taken by another worker while waiting
+                    break
+                input_pth = pending.popleft()
+                ocr_text = await self._run_one(
+                    input_pth, langs.get(input_pth, lang), config, output_format, env, image_data.get(input_pth)
+                )
+                raw_results[input_pth] = ocr_text
+                if on_result is not None:
+                    on_result(input_pth, ocr_text, len(raw_results), len(inputs))
+
+        workers = [asyncio.ensure_future(worker(i)) for i in range(min(self.max_concurrency, len(inputs)))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            raise RuntimeError("OCR processing cancelled")
+        finally:
+            # Kills any tesseract processes still running, e.g. after a timeout, error or cancellation
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._main_task = None
+
+        return raw_results
+
+    def run(
+        self,
+        inputs: List[str],
+        *,
+        lang: Optional[str] = None,
+        config: str = "",
+        output_format: str = "txt",
+        langs: Optional[Dict[str, str]] = None,
+        on_result: Optional[ResultCallback] = None,
+        image_data: Optional[Dict[str, pytesseract.ImageData]] = None,
+    ) -> Dict[str, str]:
+        """Synchronous facade for run_async(), runs its own event loop until all inputs have been processed. A cancelled
+        runner raises straight away, until it's reset()
+        """
+        return asyncio.run(
+            self.run_async(
+                inputs,
+                lang=lang,
+                config=config,
+                output_format=output_format,
+                langs=langs,
+                on_result=on_result,
+                image_data=image_data,
+            )
+        )
+
+    def reset(self):
+        """Allows a cancelled runner to be run again"""
+        self._cancelled.clear()
+
+    def cancel(self):
+        """Cancels the current run, killing all running tesseract processes, and any later runs until reset(). Safe to
+        call from any thread."""
+        self._cancelled.set()
+        loop, main_task = self._loop, self._main_task
+        if loop is not None and main_task is not None and not loop.is_closed():
+            logger.info("Cancelling OCR processing")
+            loop.call_soon_threadsafe(main_task.cancel)
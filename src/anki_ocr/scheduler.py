@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .api import OCRImage
+from .image_info import image_size
+from .pytesseract import ImageData
+from .utils import batch
+
+# Cost assumed for images whose size can't be read from the header, roughly a screenshot
+DEFAULT_IMAGE_PIXELS = 1_000_000
+
+SizeFunc = Callable[[Union[str, ImageData]], Optional[Tuple[int, int]]]
+
+
+def image_pixels(path: Union[str, ImageData], size_func: SizeFunc = image_size) -> int:
+    """:returns: Number of pixels in the image (a path or the contents of the image file), an estimate of the time it
+    takes to OCR
+    """
+    size = size_func(path)
+    return size[0] * size[1] if size is not None else DEFAULT_IMAGE_PIXELS
+
+
+@dataclass
+class OCRJob:
+    """One tesseract process worth of work, either a single large image or a batch of small ones"""
+
+    images: List[OCRImage]
+    cost: int  # Total pixels, so the most expensive jobs can be started first
+    lang: Optional[str] = None  # Languages for this job, if not every configured language
+
+    @property
+    def is_batch(self) -> bool:
+        return len(self.images) > 1
+
+
+def plan_jobs(
+    images: List[OCRImage],
+    batch_size: int,
+    large_image_pixels: int = 0,
+    image_langs: Optional[Dict[str, str]] = None,
+    size_func: SizeFunc = image_size,
+) -> List[OCRJob]:
+    """Groups small images into batches of up to batch_size, and gives each large image a job of its own
+
+    Batching amortises tesseract's start up time over many small images, but a large image in a batch holds up every
+    image after it. Jobs are returned most expensive first, for the runner's workers to take from in order, so the
+    longest jobs don't end up running alone at the end.
+
+    :param large_image_pixels: Images with at least this many pixels get their own job. 0 to batch every image
+    :param image_langs: Dict of image path -> languages. Images are only batched with images using the same languages
+    """
+    jobs = []
+    small_images: Dict[Optional[str], List[Tuple[OCRImage, int]]] = {}
+    for image in images:
+        path = str(image.img_pth)
+        pixels = image_pixels(path, size_func)
+        lang = image_langs.get(path) if image_langs is not None else None
+        if large_image_pixels and pixels >= large_image_pixels:
+            jobs.append(OCRJob(images=[image], cost=pixels, lang=lang))
+        else:
+            small_images.setdefault(lang, []).append((image, pixels))
+
+    for lang, lang_images in small_images.items():
+        for batched in batch(lang_images, batch_size):
+            jobs.append(OCRJob(images=[i for i, _ in batched], cost=sum(p for _, p in batched), lang=lang))
+
+    return sorted(jobs, key=lambda job: job.cost, reverse=True)
@@ -0,0 +1,261 @@
+import html
+import os
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from anki.notes import NoteId
+from anki.utils import ids2str
+
+from .api import OCRImage
+from .bundle import media_hash
+from .removal import IMG_TAG_RE, SRC_RE
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+INDEX_FILENAME = "anki_ocr_index.db"
+# Browser searches like `ocr:atrium` or `ocr:"left atrium"` are answered from the index
+OCR_SEARCH_RE = re.compile(r"""(?<![\w:])ocr:("[^"]*"|\S+)""", re.IGNORECASE)
+
+SCHEMA = """
+create table if not exists media (
+    id integer primary key,
+    hash text not null unique,
+    text text not null
+);
+create table if not exists note_media (
+    note_id integer not null,
+    name text not null,
+    media_id integer not null,
+    -- The file's modification time and size when it was indexed, if they haven't changed it isn't hashed again
+    mtime_ns integer not null,
+    size integer not null,
+    primary key (note_id, name)
+) without rowid;
+create index if not exists ix_note_media_media_id on note_media (media_id);
+"""
+
+
+class OCRSearchIndex:
+    """Sidecar SQLite full text index of OCR text. Text is stored per media file contents (their SHA-1, see
+    bundle.media_hash()), and linked to each note using it under the file name in the note. So a renamed image has no
+    text until it's OCR'd again, rather than the text of whatever image had its name.
+
+    Uses FTS5 when the sqlite library supports it, otherwise falls back to a (slower) LIKE search of the media table.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        media_columns = {row[1] for row in self.db.execute("pragma table_info(media)")}
+        note_media_columns = {row[1] for row in self.db.execute("pragma table_info(note_media)")}
+        if media_columns and ("hash" not in media_columns or "mtime_ns" not in note_media_columns):
+            logger.warning("Rebuilding the OCR search index, as it was made by an older version")
+            self.db.executescript("drop table if exists note_media; drop table if exists media;")
+            try:
+                self.db.execute("drop table if exists media_fts")
+            except sqlite3.OperationalError:  # FTS5 isn't available to drop it, the table is then never used
+                pass
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.execute(
+                "create virtual table if not exists media_fts using fts5(text, content='media', content_rowid='id')"
+            )
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            logger.warning("sqlite FTS5 is not available, OCR search will be slower")
+            self.fts_enabled = False
+        self.db.commit()
+
+    @classmethod
+    def for_collection(cls, col) -> "OCRSearchIndex":
+        """Opens the index stored alongside the collection file, in the profile folder"""
+        return cls(str(Path(col.path).parent / INDEX_FILENAME))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _delete_media_rows(self, media_ids: Sequence[int]):
+        if self.fts_enabled:
+            # External content FTS tables need the old text to delete an entry
+            self.db.executemany(
+                "insert into media_fts(media_fts, rowid, text) select 'delete', id, text from media where id = ?",
+                [(i,) for i in media_ids],
+            )
+        self.db.executemany("delete from media where id = ?", [(i,) for i in media_ids])
+
+    def _delete_orphaned_media(self):
+        orphaned = [
+            row[0]
+            for row in self.db.execute(
+                "select id from media where not exists (select 1 from note_media where media_id = media.id)"
+            )
+        ]
+        self._delete_media_rows(orphaned)
+
+    def update(self, images: Iterable[OCRImage]) -> Set[NoteId]:
+        """Adds or replaces the OCR text of each image, keyed by the hash of its contents, and links it to the image's
+        note, in one transaction. Images whose file can't be read are skipped
+
+        :returns: Ids of the notes whose OCR text in the index changed
+        """
+        changed: Set[NoteId] = set()
+        with self.db:
+            for image in images:
+                if image.text is None:
+                    continue
+                link = self.db.execute(
+                    "select media_id, mtime_ns, size, hash from note_media join media on media_id = id "
+                    "where note_id = ? and name = ?",
+                    (image.note_id, image.src),
+                ).fetchone()
+                try:
+                    stat = os.stat(image.img_pth)
+                    if link is not None and link[1:3] == (stat.st_mtime_ns, stat.st_size):
+                        content_hash = link[3]
+                    else:
+                        content_hash = media_hash(image.img_pth)
+                except OSError as e:
+                    logger.debug(f"Not indexing {image.src} of note {image.note_id}, as it can't be read: {e}")
+                    continue
+                row = self.db.execute("select id, text from media where hash = ?", (content_hash,)).fetchone()
+                if row is None:
+                    media_id = self.db.execute(
+                        "insert into media (hash, text) values (?, ?)", (content_hash, image.text)
+                    ).lastrowid
+                    if self.fts_enabled:
+                        self.db.execute("insert into media_fts(rowid, text) values (?, ?)", (media_id, image.text))
+                else:
+                    media_id, old_text = row
+                    if old_text != image.text:
+                        if self.fts_enabled:
+                            self.db.execute(
+                                "insert into media_fts(media_fts, rowid, text) values ('delete', ?, ?)",
+                                (media_id, old_text),
+                            )
+                            self.db.execute("insert into media_fts(rowid, text) values (?, ?)", (media_id, image.text))
+                        self.db.execute("update media set text = ? where id = ?", (image.text, media_id))
+                        changed.add(NoteId(image.note_id))
+                if link is None or link[0] != media_id:  # The image is new to the note, or its file was replaced
+                    changed.add(NoteId(image.note_id))
+                if link is None or link[:3] != (media_id, stat.st_mtime_ns, stat.st_size):
+                    self.db.execute(
+                        "insert or replace into note_media (note_id, name, media_id, mtime_ns, size) "
+                        "values (?, ?, ?, ?, ?)",
+                        (image.note_id, image.src, media_id, stat.st_mtime_ns, stat.st_size),
+                    )
+            self._delete_orphaned_media()
+        return changed
+
+    def texts_for_note(self, note_id: NoteId, media_dir: Optional[str] = None) -> Dict[str, str]:
+        """:param media_dir: If given, images whose file has been replaced since they were OCR'd are left out, as
+            their text is out of date. Files are only hashed to check if their modification time or size has changed
+        :returns: Dict of image src -> OCR text, for each of the note's images in the index
+        """
+        rows = self.db.execute(
+            "select name, hash, text, mtime_ns, size from media join note_media on media_id = id where note_id = ?",
+            (note_id,),
+        )
+        texts = {}
+        for name, content_hash, text, mtime_ns, size in rows.fetchall():
+            if media_dir is not None:
+                img_pth = Path(media_dir, name)
+                try:
+                    stat = os.stat(img_pth)
+                    unchanged = (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size) or media_hash(
+                        img_pth
+                    ) == content_hash
+                except OSError:
+                    continue
+                if not unchanged:
+                    logger.debug(f"Not using the OCR text of {name} in note {note_id}, as the image has changed")
+                    continue
+            texts[name] = text
+        return texts
+
+    def remove_notes(self, note_ids: Sequence[NoteId]) -> int:
+        """Unlinks notes from the index, removing any media no longer referenced by a note
+
+        :returns: Number of the notes that were in the index
+        """
+        with self.db:
+            (num_indexed,) = self.db.execute(
+                f"select count(distinct note_id) from note_media where note_id in {ids2str(note_ids)}"
+            ).fetchone()
+            self.db.executemany("delete from note_media where note_id = ?", [(nid,) for nid in note_ids])
+            self._delete_orphaned_media()
+        return num_indexed
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """Quotes each term so user input can't break the FTS5 query syntax. A trailing * is kept as a prefix search"""
+        terms = []
+        for term in query.split():
+            prefix = term.endswith("*")
+            term = term.rstrip("*").replace('"', '""')
+            if term:
+                terms.append(f'"{term}"' + ("*" if prefix else ""))
+        return " ".join(terms)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[NoteId]:
+        """:returns: Ids of notes with an image whose OCR text contains every term in query"""
+        limit_sql = f" limit {int(limit)}" if limit else ""
+        if self.fts_enabled:
+            fts_query = self._fts_query(query)
+            if not fts_query:
+                return []
+            rows = self.db.execute(
+                "select distinct note_id from note_media where media_id in "
+                f"(select rowid from media_fts where media_fts match ?){limit_sql}",
+                (fts_query,),
+            )
+        else:
+            terms = [t.rstrip("*") for t in query.split() if t.rstrip("*")]
+            if not terms:
+                return []
+            where = " and ".join("text like ?" for _ in terms)
+            rows = self.db.execute(
+                "select distinct note_id from note_media where media_id in "
+                f"(select id from media where {where}){limit_sql}",
+                [f"%{t}%" for t in terms],
+            )
+        return [NoteId(row[0]) for row in rows]
+
+    def rewrite_search(self, search: str) -> str:
+        """Replaces each `ocr:term` in an Anki search string with the ids of matching notes"""
+
+        def to_nids(match: re.Match) -> str:
+            nids = self.search(match.group(1).strip('"'))
+            return f"nid:{','.join(str(nid) for nid in nids) or 0}"
+
+        return OCR_SEARCH_RE.sub(to_nids, search)
+
+
+def add_ocr_titles(card_html: str, texts: Dict[str, str]) -> str:
+    """Adds the OCR text of each image as its title when a card is shown, for the sidecar text output location, as if
+    it had been stored in the note with the tooltip text output location
+
+    :param texts: Dict of image src -> OCR text, see OCRSearchIndex.texts_for_note()
+    """
+
+    def add_title(img_tag: re.Match) -> str:
+        tag = img_tag.group(0)
+        src_match = SRC_RE.search(tag)
+        if src_match is None or re.search(r"\stitle\s*=", tag, re.IGNORECASE):
+            return tag
+        src = html.unescape(next(group for group in src_match.groups() if group is not None))
+        if src not in texts:
+            return tag
+        return f'<img title="{html.escape(texts[src])}"{tag[len("<img"):]}'
+
+    if not texts:
+        return card_html
+    return IMG_TAG_RE.sub(add_title, card_html)
@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional, Tuple
+
+from . import pytesseract
+from .api import OCRPage, OCRWord
+
+PAGE_SEPARATOR = "\u000C"  # Tesseract separates the text of each image in a batch with a form feed
+WORD_LEVEL = 5
+PAGE_LEVEL = 1
+
+
+def text_to_pages(ocr_text: str) -> List[OCRPage]:
+    """Splits plain text tesseract output into a page per image"""
+    return [OCRPage(text=page_text) for page_text in ocr_text.split(PAGE_SEPARATOR)]
+
+
+def tsv_to_pages(tsv: str, min_confidence: float = 0) -> List[OCRPage]:
+    """Converts TSV tesseract output into a page per image, rebuilding the text from the words in reading order
+
+    :param tsv: Raw TSV output, from one image or from a batch of images
+    :param min_confidence: Words with a confidence (0 - 100) below this are dropped from the text and words
+    """
+    data = pytesseract.file_to_dict(tsv, "\t", -1)
+    if not data:
+        return []
+
+    pages: Dict[int, Tuple[List[str], List[OCRWord]]] = {}
+    prev_line: Optional[Tuple[int, int, int, int]] = None
+    rows = zip(
+        data["level"],
+        data["page_num"],
+        data["block_num"],
+        data["par_num"],
+        data["line_num"],
+        data["left"],
+        data["top"],
+        data["width"],
+        data["height"],
+        data["conf"],
+        data["text"],
+    )
+    for level, page_num, block_num, par_num, line_num, left, top, width, height, conf, text in rows:
+        if level == PAGE_LEVEL:
+            pages.setdefault(page_num, ([], []))
+            continue
+        if level != WORD_LEVEL:
+            continue
+        text = text.strip()
+        if not text or float(conf) < min_confidence:
+            continue
+
+        lines, words = pages.setdefault(page_num, ([], []))
+        line = (page_num, block_num, par_num, line_num)
+        if line != prev_line:
+            if prev_line is not None and prev_line[:3] != line[:3] and lines:
+                lines.append("")  # Blank line between paragraphs, like the plain text output
+            lines.append(text)
+            prev_line = line
+        else:
+            lines[-1] += " " + text
+        words.append(OCRWord(text=text, conf=float(conf), left=left, top=top, width=width, height=height))
+
+    return [OCRPage(text="\n".join(lines), words=words) for _, (lines, words) in sorted(pages.items())]
@@ -0,0 +1,74 @@
+from dataclasses import dataclass, field
+from dataclasses import fields as dataclass_fields
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .image_info import image_size
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+
+def _included(name: str, include: List[str], exclude: List[str]) -> bool:
+    """Matches name against glob patterns ignoring case. Excludes win over includes, and an empty include list includes
+    everything
+    """
+    name = name.lower()
+    if any(fnmatchcase(name, pattern.lower()) for pattern in exclude):
+        return False
+    return not include or any(fnmatchcase(name, pattern.lower()) for pattern in include)
+
+
+@dataclass
+class TargetingRules:
+    """Which images are OCR'd, from the ocr_targeting config option, e.g. to skip icons or fields that are never
+    searched. Names are matched with glob patterns (e.g. "Image Occlusion*" or "icon_*.png") ignoring case.
+
+    Notetypes are filtered when notes are queried, the rest as each field's images are parsed, so excluded images
+    never reach the OCR engine. Image sizes are read from the image header only.
+    """
+
+    notetypes: List[str] = field(default_factory=list)  # Empty for every notetype
+    exclude_notetypes: List[str] = field(default_factory=list)
+    fields: List[str] = field(default_factory=list)  # Empty for every field
+    exclude_fields: List[str] = field(default_factory=list)
+    filenames: List[str] = field(default_factory=list)  # Empty for every media file
+    exclude_filenames: List[str] = field(default_factory=list)
+    min_width: int = 0
+    min_height: int = 0
+    min_bytes: int = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "TargetingRules":
+        options = dict(config.get("ocr_targeting") or {})
+        unknown = options.keys() - {f.name for f in dataclass_fields(cls)}
+        if unknown:
+            logger.warning(f"Ignoring unknown ocr_targeting options: {sorted(unknown)}")
+        return cls(**{key: value for key, value in options.items() if key not in unknown})
+
+    @property
+    def filters_notetypes(self) -> bool:
+        return bool(self.notetypes or self.exclude_notetypes)
+
+    def matches_notetype(self, name: str) -> bool:
+        return _included(name, self.notetypes, self.exclude_notetypes)
+
+    def matches_field(self, name: str) -> bool:
+        return _included(name, self.fields, self.exclude_fields)
+
+    def exclusion_reason(self, img_pth: Path) -> Optional[str]:
+        """Checks the file name, then the file size and then the image size, cheapest first. Images whose size can't
+        be read from their header are kept
+
+        :returns: Why the image is excluded, or None if it should be OCR'd
+        """
+        if not _included(img_pth.name, self.filenames, self.exclude_filenames):
+            return "its file name is excluded"
+        if self.min_bytes and img_pth.stat().st_size < self.min_bytes:
+            return f"it is smaller than {self.min_bytes} bytes"
+        if self.min_width or self.min_height:
+            size = image_size(img_pth)
+            if size is not None and (size[0] < self.min_width or size[1] < self.min_height):
+                return f"it is {size[0]}x{size[1]}, smaller than {self.min_width}x{self.min_height}"
+        return None
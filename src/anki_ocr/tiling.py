@@ -0,0 +1,306 @@
+import struct
+import zlib
+from dataclasses import dataclass
+from math import ceil
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import pytesseract
+from .api import OCRPage, OCRWord
+from .structured import WORD_LEVEL
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+MIN_BAND_HEIGHT = 64
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Channels per pixel of each PNG colour type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Scanline filters which don't refer to the row above, so a band can start at a row with one of them
+PNG_NONE_FILTER = 0
+PNG_SUB_FILTER = 1
+PNG_READ_SIZE = 1024**2  # Most bytes of image data decompressed at once
+PNG_IDAT_SIZE = 64 * 1024
+
+
+@dataclass
+class Band:
+    """A horizontal band of an image, OCR'd on its own and stitched back together with the bands above and below.
+
+    Neighbouring bands overlap, and each band owns the rows from owned_top to owned_bottom (in image coordinates). A
+    line of text is kept from the band owning the centre of the line, so lines cut at the edge of one band are instead
+    taken whole from the next.
+    """
+
+    path: str
+    top: int
+    bottom: int
+    owned_top: int
+    owned_bottom: int
+
+
+def band_rows(
+    height: int, band_height: int, overlap: int, can_start: Optional[Callable[[int], bool]] = None
+) -> List[Tuple[int, int, int, int]]:
+    """Splits rows 0 - height into overlapping bands
+
+    :param can_start: Whether a band can start at a row, any row if None. Each band then starts at the lowest row it
+        can which overlaps the band above by at least overlap rows, and is at least half a band below it
+    :returns: List of (top, bottom, owned_top, owned_bottom)
+    :raises ValueError: If there's no row a band can start at
+    """
+    band_height = max(band_height, 4 * overlap, MIN_BAND_HEIGHT)  # Otherwise most of each band would be overlap
+    tops = [0]
+    while tops[-1] + band_height < height:
+        lowest = tops[-1] + band_height - overlap
+        top = next(
+            (row for row in range(lowest, tops[-1] + band_height // 2 - 1, -1) if can_start is None or can_start(row)),
+            None,
+        )
+        if top is None:
+            raise ValueError(f"No row a band can start at between rows {tops[-1] + band_height // 2} and {lowest}")
+        tops.append(top)
+    bottoms = [min(top + band_height, height) for top in tops]
+    # A line in the overlap of two bands is owned by the band whose edge it's furthest from
+    boundaries = [(top + bottom) // 2 for top, bottom in zip(tops[1:], bottoms)]
+    return [
+        (top, bottom, owned_top, owned_bottom)
+        for top, bottom, owned_top, owned_bottom in zip(tops, bottoms, [0] + boundaries, boundaries + [height])
+    ]
+
+
+def can_tile(img_pth: str) -> bool:
+    """Whether Qt can decode the image a band at a time (e.g. JPEG). Other formats would be decoded whole inside Anki
+    to cut out each band, so PNGs are split with write_png_bands() instead, and the rest are left whole for tesseract
+    """
+    from aqt.qt import QImageIOHandler, QImageReader
+
+    return QImageReader(img_pth).supportsOption(QImageIOHandler.ImageOption.ClipRect)
+
+
+def write_bands(img_pth: str, out_dir: str, size: Tuple[int, int], max_pixels: int, overlap: int) -> List[Band]:
+    """Decodes a large image one band at a time with Qt, writing each as a greyscale band of at most max_pixels, so
+    neither Anki nor any single tesseract process has to hold the whole image. See can_tile()
+    """
+    from aqt.qt import QImage, QImageReader, QRect
+
+    width, height = size
+    rows = band_rows(height, max_pixels // width, overlap)
+    # Qt 6 refuses to decode images over 256 MB by default, which is only raised as far as the largest band needs
+    allocation_limit = QImageReader.allocationLimit() if hasattr(QImageReader, "allocationLimit") else None
+    band_mb = ceil(width * max(bottom - top for top, bottom, _, _ in rows) * 4 / 1024**2)
+    if allocation_limit and allocation_limit < band_mb:
+        QImageReader.setAllocationLimit(band_mb)
+    try:
+        bands = []
+        for i, (top, bottom, owned_top, owned_bottom) in enumerate(rows):
+            reader = QImageReader(img_pth)  # A reader only reads an image once
+            reader.setClipRect(QRect(0, top, width, bottom - top))
+            image = reader.read()
+            if image.isNull():
+                raise RuntimeError(f"Could not read image {img_pth} to split into tiles: {reader.errorString()}")
+            band_pth = str(Path(out_dir, f"{Path(img_pth).stem}_band_{i}.pgm"))
+            if not image.convertToFormat(QImage.Format.Format_Grayscale8).save(band_pth, "PGM"):
+                raise RuntimeError(f"Could not write tile {band_pth}")
+            bands.append(Band(path=band_pth, top=top, bottom=bottom, owned_top=owned_top, owned_bottom=owned_bottom))
+    finally:
+        if allocation_limit is not None:
+            QImageReader.setAllocationLimit(allocation_limit)
+    logger.debug(f"Split {img_pth} ({width}x{height}) into {len(bands)} bands")
+    return bands
+
+
+@dataclass
+class PNGHeader:
+    width: int
+    height: int
+    bit_depth: int
+    color_type: int
+    interlaced: bool
+
+    @property
+    def row_bytes(self) -> int:
+        """Bytes in each scanline, excluding its filter type byte"""
+        return ceil(self.width * PNG_CHANNELS[self.color_type] * self.bit_depth / 8)
+
+
+def _read_png_chunks(f: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    """:returns: (type, data) of each chunk, up to IEND"""
+    if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG")
+    while True:
+        length_type = f.read(8)
+        if len(length_type) < 8:
+            raise ValueError("Truncated PNG")
+        length, chunk_type = struct.unpack(">I4s", length_type)
+        data = f.read(length)
+        f.seek(4, 1)  # CRC
+        if chunk_type == b"IEND":
+            return
+        yield chunk_type, data
+
+
+def _write_png_chunk(f: BinaryIO, chunk_type: bytes, data: bytes):
+    f.write(struct.pack(">I", len(data)) + chunk_type + data)
+    f.write(struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+
+def _read_png_header(img_pth: str) -> Tuple[PNGHeader, List[Tuple[bytes, bytes]]]:
+    """:returns: The header, and the (type, data) of the other chunks before the image data, e.g. the palette"""
+    with open(img_pth, "rb") as f:
+        chunks = _read_png_chunks(f)
+        chunk_type, ihdr = next(chunks, (b"", b""))
+        if chunk_type != b"IHDR":
+            raise ValueError("PNG doesn't start with IHDR")
+        width, height, bit_depth, color_type, _compression, _filter, interlace = struct.unpack(">IIBBBBB", ihdr)
+        header = PNGHeader(width, height, bit_depth, color_type, interlaced=interlace != 0)
+        ancillary = []
+        for chunk_type, data in chunks:
+            if chunk_type == b"IDAT":
+                break
+            ancillary.append((chunk_type, data))
+    return header, ancillary
+
+
+def _png_scanlines(img_pth: str, header: PNGHeader) -> Iterator[bytes]:
+    """Decompresses a PNG a few rows at a time, without unfiltering it
+
+    :returns: Each filtered scanline, the filter type byte then the row
+    """
+    row_size = header.row_bytes + 1
+    decompressor = zlib.decompressobj()
+    pending = bytearray()
+    num_rows = 0
+    with open(img_pth, "rb") as f:
+        for chunk_type, data in _read_png_chunks(f):
+            if chunk_type != b"IDAT":
+                continue
+            while data and num_rows < header.height:
+                pending += decompressor.decompress(data, PNG_READ_SIZE)
+                data = decompressor.unconsumed_tail
+                start = 0
+                while len(pending) - start >= row_size and num_rows < header.height:
+                    yield bytes(pending[start : start + row_size])
+                    start += row_size
+                    num_rows += 1
+                del pending[:start]
+    if num_rows < header.height:
+        raise ValueError(f"PNG has {num_rows} of its {header.height} rows")
+
+
+def write_png_bands(img_pth: str, out_dir: str, max_pixels: int, overlap: int) -> Optional[List[Band]]:
+    """Splits a large PNG into bands of at most max_pixels without decoding it, by copying its compressed scanlines.
+
+    Each row of a PNG is filtered, usually relative to the row above, so a band can only start at a row whose filter
+    doesn't refer to the row above. Those are common in PNGs of scans (palette and 1 bit images are stored unfiltered)
+    but rare in others.
+
+    :returns: The bands, or None if the image isn't a PNG, is interlaced, or has no rows bands can start at, so has to
+        be OCR'd whole
+    """
+    try:
+        header, ancillary = _read_png_header(img_pth)
+        if header.interlaced or header.color_type not in PNG_CHANNELS:
+            logger.debug(f"Can't split PNG {img_pth} into bands, as it's interlaced or of an unknown colour type")
+            return None
+        filters = bytes(row[0] for row in _png_scanlines(img_pth, header))
+    except (OSError, ValueError, zlib.error) as e:
+        logger.debug(f"Can't split {img_pth} into bands, as it can't be read as a PNG: {e}")
+        return None
+    try:
+        rows = band_rows(
+            header.height,
+            max_pixels // header.width,
+            overlap,
+            can_start=lambda row: filters[row] in (PNG_NONE_FILTER, PNG_SUB_FILTER),
+        )
+    except ValueError as e:
+        logger.debug(f"Can't split {img_pth} into bands: {e}")
+        return None
+
+    bands = [
+        Band(
+            path=str(Path(out_dir, f"{Path(img_pth).stem}_band_{i}.png")),
+            top=top,
+            bottom=bottom,
+            owned_top=owned_top,
+            owned_bottom=owned_bottom,
+        )
+        for i, (top, bottom, owned_top, owned_bottom) in enumerate(rows)
+    ]
+    # Only the bands overlapping the current row are open, at most two as overlaps are under half a band
+    open_bands: Dict[int, Tuple[BinaryIO, "zlib._Compress", bytearray]] = {}
+
+    def write_idat(f: BinaryIO, buffer: bytearray, final: bool = False):
+        if len(buffer) >= PNG_IDAT_SIZE or (final and buffer):
+            _write_png_chunk(f, b"IDAT", bytes(buffer))
+            buffer.clear()
+
+    try:
+        for row_num, row in enumerate(_png_scanlines(img_pth, header)):
+            for i, band in enumerate(bands):
+                if band.top == row_num:
+                    band_file = open(band.path, "wb")
+                    band_file.write(PNG_SIGNATURE)
+                    ihdr = struct.pack(
+                        ">IIBBBBB", header.width, band.bottom - band.top, header.bit_depth, header.color_type, 0, 0, 0
+                    )
+                    _write_png_chunk(band_file, b"IHDR", ihdr)
+                    for chunk_type, data in ancillary:
+                        _write_png_chunk(band_file, chunk_type, data)
+                    open_bands[i] = (band_file, zlib.compressobj(1), bytearray())
+                if i in open_bands:
+                    f, compressor, buffer = open_bands[i]
+                    buffer += compressor.compress(row)
+                    write_idat(f, buffer)
+                    if band.bottom == row_num + 1:
+                        buffer += compressor.flush()
+                        write_idat(f, buffer, final=True)
+                        _write_png_chunk(f, b"IEND", b"")
+                        f.close()
+                        del open_bands[i]
+    finally:
+        for f, _, _ in open_bands.values():
+            f.close()
+    logger.debug(f"Split {img_pth} ({header.width}x{header.height}) into {len(bands)} bands")
+    return bands
+
+
+def stitch_bands(bands: List[Band], tsvs: Dict[str, str], min_confidence: float = 0) -> OCRPage:
+    """Joins the TSV tesseract output of each band back into a single page, in reading order (top to bottom)
+
+    :param tsvs: Dict of band path -> TSV output
+    """
+    lines: List[str] = []
+    words: List[OCRWord] = []
+    for band in bands:
+        data = pytesseract.file_to_dict(tsvs.get(band.path, ""), "\t", -1)
+        if not data:
+            continue
+        band_lines: Dict[Tuple[int, int, int], List[OCRWord]] = {}
+        rows = zip(
+            data["level"],
+            data["block_num"],
+            data["par_num"],
+            data["line_num"],
+            data["left"],
+            data["top"],
+            data["width"],
+            data["height"],
+            data["conf"],
+            data["text"],
+        )
+        for level, block_num, par_num, line_num, left, top, width, height, conf, text in rows:
+            text = text.strip()
+            if level != WORD_LEVEL or not text or float(conf) < min_confidence:
+                continue
+            word = OCRWord(text=text, conf=float(conf), left=left, top=band.top + top, width=width, height=height)
+            band_lines.setdefault((block_num, par_num, line_num), []).append(word)
+
+        for line_words in band_lines.values():
+            line_top = min(w.top for w in line_words)
+            line_bottom = max(w.top + w.height for w in line_words)
+            if band.owned_top <= (line_top + line_bottom) // 2 < band.owned_bottom:
+                lines.append(" ".join(w.text for w in line_words))
+                words.extend(line_words)
+    return OCRPage(text="\n".join(lines), words=words)
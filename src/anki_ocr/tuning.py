@@ -0,0 +1,167 @@
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from anki.collection import Collection
+
+from .api import NotesQuery
+from .engines import batch_requests
+from .governor import PeakRSSSampler
+from .utils import create_logger
+
+if TYPE_CHECKING:
+    from .ocr import OCR
+
+logger = create_logger(__name__)
+
+# Images OCR'd by each trial, enough for a stable rate while keeping calibration to a minute or two
+SAMPLE_IMAGES = 24
+BATCH_SIZES = [1, 5, 10, 20]
+# A faster setting must beat the fastest by less than this to be picked with fewer workers, as it leaves more of the
+# machine free for everything else
+WORKERS_TOLERANCE = 0.05
+
+# Called as ocr_factory(num_threads, batch_size), returns an OCR instance with those settings
+OCRFactory = Callable[[int, int], "OCR"]
+
+
+def machine_stamp(engine: str, engine_version: str) -> Dict[str, Any]:
+    """What calibration results depend on, so they are redone when any of it changes"""
+    return {
+        "engine": engine,
+        "engine_version": engine_version,
+        "cpu_count": os.cpu_count() or 1,
+        "machine": platform.node(),
+    }
+
+
+@dataclass
+class Trial:
+    num_threads: int
+    batch_size: int  # 1 for unbatched
+    images_per_sec: float
+    peak_rss_mb: Optional[float] = None
+
+
+@dataclass
+class TunedSettings:
+    """The fastest batch size and number of workers found for this machine and engine, stored in the addon config"""
+
+    num_threads: int
+    batch_size: int
+    stamp: Dict[str, Any]
+    images_per_sec: float = 0
+    trials: List[Trial] = field(default_factory=list)
+
+    @property
+    def use_batching(self) -> bool:
+        return self.batch_size > 1
+
+    def is_current(self, stamp: Dict[str, Any]) -> bool:
+        return self.stamp == stamp
+
+    def apply(self, config: Dict[str, Any]):
+        """Sets the tuned settings in the config, replacing the hand set ones"""
+        config["num_threads"] = self.num_threads
+        config["use_multithreading"] = self.num_threads > 1
+        config["use_batching"] = self.use_batching
+        if self.use_batching:
+            config["batch_size"] = self.batch_size
+
+    def to_config(self, config: Dict[str, Any]):
+        config["tuned_settings"] = dict(config.get("tuned_settings") or {})
+        config["tuned_settings"][self.stamp["engine"]] = asdict(self)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], engine: str) -> Optional["TunedSettings"]:
+        data = (config.get("tuned_settings") or {}).get(engine)
+        if not data:
+            return None
+        try:
+            trials = [Trial(**t) for t in data.get("trials", [])]
+            return cls(**{**data, "trials": trials})
+        except TypeError:
+            logger.warning(f"Ignoring invalid tuned settings: {data}")
+            return None
+
+
+def tuning_grid(cpu_count: Optional[int] = None, batch_sizes: Optional[List[int]] = None) -> List[Trial]:
+    """:returns: Untimed trials of 1 worker, half the cores and all the cores, each with every batch size"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    workers = sorted({1, max(1, cpu_count // 2), cpu_count})
+    return [Trial(num_threads=w, batch_size=b, images_per_sec=0) for w in workers for b in batch_sizes or BATCH_SIZES]
+
+
+def sample_images(col: Collection, num_images: int = SAMPLE_IMAGES) -> List[str]:
+    """:returns: Paths of up to num_images different images, from randomly chosen notes in the collection"""
+    assert col.db is not None
+    note_ids = col.db.list("select id from notes where flds like '%<img%' order by random() limit ?", num_images * 2)
+    paths: Dict[str, None] = {}
+    for note in NotesQuery(col=col, note_ids=note_ids):
+        for ocr_field in note.field_images:
+            for image in ocr_field.images:
+                paths[str(image.img_pth)] = None
+    return list(paths)[:num_images]
+
+
+def run_trial(ocr: "OCR", img_pths: List[str], batch_size: int) -> Trial:
+    requests = batch_requests(img_pths, batch_size)
+    with PeakRSSSampler() as sampler:
+        start = time.perf_counter()
+        ocr._run_engine(requests, label=f"Calibrating, {ocr.num_threads} workers, batches of {batch_size}")
+        secs = time.perf_counter() - start
+    return Trial(
+        num_threads=ocr.num_threads,
+        batch_size=batch_size,
+        images_per_sec=len(img_pths) / secs if secs > 0 else float("inf"),
+        peak_rss_mb=sampler.peak_rss_mb,
+    )
+
+
+def pick_best(trials: List[Trial], max_memory_mb: int = 0) -> Trial:
+    """:returns: The fastest trial within the memory limit, preferring fewer workers when nearly as fast"""
+    within_budget = [t for t in trials if not max_memory_mb or t.peak_rss_mb is None or t.peak_rss_mb <= max_memory_mb]
+    candidates = within_budget or trials
+    fastest = max(t.images_per_sec for t in candidates)
+    nearly_fastest = [t for t in candidates if t.images_per_sec >= fastest * (1 - WORKERS_TOLERANCE)]
+    return min(nearly_fastest, key=lambda t: (t.num_threads, -t.images_per_sec))
+
+
+def calibrate(
+    ocr_factory: OCRFactory,
+    img_pths: List[str],
+    stamp: Dict[str, Any],
+    grid: Optional[List[Trial]] = None,
+    max_memory_mb: int = 0,
+) -> TunedSettings:
+    """Times OCR of the sample images with each combination of workers and batch size, picking the fastest
+
+    :param img_pths: Sample of the user's own images, see sample_images()
+    :param max_memory_mb: Settings using more memory than this are only picked if every setting does
+    """
+    if not img_pths:
+        raise ValueError("No images to calibrate with, add some notes with images first")
+    trials = []
+    for untimed in grid or tuning_grid(stamp.get("cpu_count")):
+        # Fewer images than workers or batches would time start up rather than OCR
+        if untimed.batch_size > 1 and untimed.batch_size * untimed.num_threads > len(img_pths):
+            continue
+        ocr = ocr_factory(untimed.num_threads, untimed.batch_size)
+        trial = run_trial(ocr, img_pths, untimed.batch_size)
+        logger.info(
+            f"Calibration: {trial.num_threads} workers, batches of {trial.batch_size}: "
+            f"{trial.images_per_sec:.2f} images/s, peak {trial.peak_rss_mb or 0:.0f} MB"
+        )
+        trials.append(trial)
+
+    best = pick_best(trials, max_memory_mb)
+    logger.info(f"Calibrated to {best.num_threads} workers with batches of {best.batch_size}")
+    return TunedSettings(
+        num_threads=best.num_threads,
+        batch_size=best.batch_size,
+        stamp=stamp,
+        images_per_sec=best.images_per_sec,
+        trials=trials,
+    )
@@ -28,7 +28,11 @@ class AnkiOCRLogger(MemoryHandler):
 
 def create_ocr_logger():
     ocr_logger = logging.getLogger("anki_ocr")
-    ocr_logger.addHandler(AnkiOCRLogger(capacity=2000, flushLevel=logging.CRITICAL))
+    handler = AnkiOCRLogger(capacity=2000, flushLevel=logging.CRITICAL)
+    # Records from child loggers made with create_logger propagate to this handler regardless of this logger's level,
+    # so the handler's own level keeps their routine INFO lines out of the results dialog
+    handler.setLevel(logging.WARNING)
+    ocr_logger.addHandler(handler)
     ocr_logger.setLevel(logging.WARNING)
     return ocr_logger
 
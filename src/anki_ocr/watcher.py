@@ -0,0 +1,138 @@
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from anki.notes import Note, NoteId
+from anki.utils import ids2str
+from aqt import gui_hooks
+from aqt.main import AnkiQt
+from aqt.qt import QTimer
+from aqt.utils import showWarning
+
+from .utils import create_logger
+from .work_queue import OCRWorkQueue, find_notes_needing_ocr
+
+logger = create_logger(__name__)
+
+# Main window states where the user isn't reviewing or editing, so OCR won't compete with them for the CPU
+IDLE_STATES = {"deckBrowser", "overview"}
+
+
+def background_unsupported_reason(config: Dict) -> Optional[str]:
+    """:returns: Why background OCR can't run with this config, or None if it can"""
+    if config["text_output_location"] == "new_field":
+        return (
+            'Background OCR is turned off, as the "new_field" text output location changes notetypes, which needs you '
+            'to confirm a full sync. Set text_output_location to "tooltip", "existing_field" or "sidecar" to use it.'
+        )
+    return None
+
+
+class BackgroundOCR:
+    """Opt-in background mode, which OCRs new notes without the user having to run it from the browser.
+
+    Notes with images are queued when added or after a sync, and the queue is drained in chunks while Anki is idle,
+    with low priority (niced) tesseract processes. Each chunk is saved in one transaction.
+    """
+
+    def __init__(self, mw: AnkiQt, config: Dict):
+        self.mw = mw
+        self.config = config
+        self.queue: Optional[OCRWorkQueue] = None
+        self.timer: Optional[QTimer] = None
+        self.running = False
+
+    def register(self):
+        reason = background_unsupported_reason(self.config)
+        if reason is not None:
+            logger.warning(reason)
+
+            def show_reason() -> None:
+                showWarning(reason, title="Anki OCR")
+
+            gui_hooks.profile_did_open.append(show_reason)
+            return
+        gui_hooks.profile_did_open.append(self.on_profile_did_open)
+        gui_hooks.profile_will_close.append(self.on_profile_will_close)
+        gui_hooks.add_cards_did_add_note.append(self.on_note_added)
+        gui_hooks.sync_did_finish.append(self.on_sync_finished)
+
+    def on_profile_did_open(self):
+        assert self.mw.col is not None
+        self.queue = OCRWorkQueue.for_collection(self.mw.col)
+        self.on_sync_finished()  # Picks up notes changed since Anki was last closed
+        self.timer = self.mw.progress.timer(
+            int(self.config["background_interval_secs"] * 1000), self.on_timer, repeat=True, requiresCollection=True
+        )
+
+    def on_profile_will_close(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+        if self.queue is not None:
+            self.queue.save()
+            self.queue = None
+
+    def on_note_added(self, note: Note):
+        if self.queue is None or self.mw.col is None:
+            return
+        if find_notes_needing_ocr(
+            self.mw.col,
+            text_output_location=self.config["text_output_location"],
+            ocr_field_name=self.config["ocr_field_name"],
+            note_ids=[note.id],
+        ):
+            self.queue.add([note.id])
+            self.queue.save()
+
+    def on_sync_finished(self):
+        if self.queue is None or self.mw.col is None:
+            return
+        num_added = self.queue.scan(
+            self.mw.col,
+            text_output_location=self.config["text_output_location"],
+            ocr_field_name=self.config["ocr_field_name"],
+        )
+        self.queue.save()
+        if num_added:
+            logger.info(f"Queued {num_added} changed notes for background OCR, {len(self.queue)} in total")
+
+    def is_idle(self) -> bool:
+        return self.mw.col is not None and self.mw.state in IDLE_STATES and not self.mw.progress.busy()
+
+    def on_timer(self):
+        from .gui import load_tesseract
+
+        if self.running or not self.queue or not self.is_idle():
+            return
+        load_tesseract(self.config)  # May update the cached install in the config, so done in the main thread
+        note_ids = self.queue.peek(self.config["background_batch_size"])
+        self.running = True
+        self.mw.taskman.run_in_background(
+            lambda: self._ocr_notes(note_ids), on_done=lambda future: self._on_done(note_ids, future)
+        )
+
+    def _ocr_notes(self, note_ids: List[NoteId]) -> int:
+        """Runs in a background thread, so must not touch the GUI"""
+        from .gui import ocr_from_config
+
+        col = self.mw.col
+        assert col is not None and col.db is not None
+        # Notes may have been deleted since they were queued
+        existing = [NoteId(nid) for nid in col.db.list(f"select id from notes where id in {ids2str(note_ids)}")]
+        if not existing:
+            return 0
+        ocr = ocr_from_config(self.config, col=col, nice=self.config["background_nice"])
+        ocr.run_ocr_on_query(existing)
+        return len(existing)
+
+    def _on_done(self, note_ids: List[NoteId], future: Future):
+        self.running = False
+        try:
+            num_processed = future.result()
+            logger.info(f"Background OCR processed {num_processed} notes")
+        except Exception:
+            # Dropped from the queue regardless, so a note that always fails isn't retried forever
+            logger.exception(f"Background OCR failed for notes {note_ids}")
+        if self.queue is not None:
+            self.queue.remove(note_ids)
+            self.queue.save()
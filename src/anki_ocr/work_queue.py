@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from anki.collection import Collection
+from anki.notes import NoteId
+from anki.utils import ids2str
+
+from .api import OCR_FIELD_NAME
+from .bundle import OCR_FIELD_IMAGE_RE
+from .notetypes import NotetypeRegistry
+from .removal import ATTR_RE, FIELD_SEPARATOR, IMG_TAG_RE, img_src, is_ocr_image
+from .search_index import OCRSearchIndex
+from .utils import create_logger
+
+logger = create_logger(__name__)
+
+QUEUE_FILENAME = "anki_ocr_queue.json"
+
+
+def needs_ocr(flds: str, has_text: Optional[Callable[[str], bool]] = None) -> bool:
+    """:param has_text: Whether the image with a given src already has OCR text. By default, images with a title attr
+        do, as with the "tooltip" text output location
+    :returns: True if a note's fields contain a supported image without OCR text
+    """
+    for img_tag in IMG_TAG_RE.finditer(flds):
+        tag = img_tag.group(0)
+        src = img_src(tag)
+        if src is None or not is_ocr_image(src):
+            continue
+        if has_text is not None:
+            if not has_text(src):
+                return True
+        elif not any(attr.group(2).lower() == "title" for attr in ATTR_RE.finditer(tag[len("<img") :])):
+            return True
+    return False
+
+
+def find_notes_needing_ocr(
+    col: Collection,
+    modified_since: int = 0,
+    text_output_location: str = "tooltip",
+    ocr_field_name: str = OCR_FIELD_NAME,
+    note_ids: Optional[Sequence[NoteId]] = None,
+) -> List[NoteId]:
+    """Finds notes modified since modified_since (in seconds) with an image that hasn't been OCR'd yet
+
+    Whether an image has been OCR'd is checked where text_output_location stores its text: the title of the image for
+    "tooltip", ocr_field_name for "existing_field" (notes without one are skipped, as there's nowhere to put the text)
+    and the search index for "sidecar". Notes with an _OCR notetype already have their text in the OCR field, so are
+    skipped.
+
+    :param note_ids: If given, only these notes are checked
+    """
+    assert col.db is not None
+    registry = NotetypeRegistry(col)
+    ocr_mids = registry.ocr_model_ids()
+    query = "select id, mid, flds from notes where mod >= ? and flds like '%<img%'"
+    if note_ids is not None:
+        query += f" and id in {ids2str(note_ids)}"
+    rows = [(nid, mid, flds) for nid, mid, flds in col.db.all(query, modified_since) if mid not in ocr_mids]
+
+    if text_output_location == "existing_field":
+        field_indexes = {}
+        found = []
+        for nid, mid, flds in rows:
+            if mid not in field_indexes:
+                names = [fld["name"] for fld in registry.model(mid)["flds"]]
+                field_indexes[mid] = names.index(ocr_field_name) if ocr_field_name in names else None
+            if field_indexes[mid] is None:
+                continue
+            ocr_names = {
+                name for name, _ in OCR_FIELD_IMAGE_RE.findall(flds.split(FIELD_SEPARATOR)[field_indexes[mid]])
+            }
+            if needs_ocr(flds, has_text=lambda src: Path(src).stem in ocr_names):
+                found.append(NoteId(nid))
+        return found
+
+    if text_output_location == "sidecar":
+        if not rows:
+            return []
+        with OCRSearchIndex.for_collection(col) as index:
+            return [
+                NoteId(nid)
+                for nid, _, flds in rows
+                if needs_ocr(flds, has_text=index.texts_for_note(NoteId(nid)).__contains__)
+            ]
+
+    return [NoteId(nid) for nid, _, flds in rows if needs_ocr(flds)]
+
+
+class OCRWorkQueue:
+    """Persistent queue of note ids waiting to be OCR'd in the background, saved as JSON in the profile folder.
+
+    Note ids are only removed once they have been processed, so a queue interrupted by Anki closing is resumed the next
+    time the profile is opened.
+    """
+
+    def __init__(self, path: str, now: Optional[int] = None):
+        """:param now: Time a new queue starts scanning from, so notes already in the collection aren't all queued"""
+        self.path = path
+        self.note_ids: List[NoteId] = []
+        # Notes modified after this time (in seconds) haven't been checked for new images yet
+        self.last_scan = now if now is not None else int(time.time())
+        if Path(path).exists():
+            try:
+                data = json.loads(Path(path).read_text())
+                self.note_ids = [NoteId(nid) for nid in data["note_ids"]]
+                self.last_scan = data["last_scan"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Could not read the OCR queue at {path}, starting a new one")
+
+    @classmethod
+    def for_collection(cls, col: Collection) -> "OCRWorkQueue":
+        return cls(str(Path(col.path).parent / QUEUE_FILENAME))
+
+    def __len__(self):
+        return len(self.note_ids)
+
+    def add(self, note_ids: Iterable[NoteId]) -> int:
+        """:returns: Number of note ids that weren't already queued"""
+        queued = set(self.note_ids)
+        new_ids = [nid for nid in dict.fromkeys(note_ids) if nid not in queued]
+        self.note_ids.extend(new_ids)
+        return len(new_ids)
+
+    def peek(self, num_notes: int) -> List[NoteId]:
+        return self.note_ids[:num_notes]
+
+    def remove(self, note_ids: Iterable[NoteId]):
+        done = set(note_ids)
+        self.note_ids = [nid for nid in self.note_ids if nid not in done]
+
+    def scan(
+        self,
+        col: Collection,
+        now: Optional[int] = None,
+        text_output_location: str = "tooltip",
+        ocr_field_name: str = OCR_FIELD_NAME,
+    ) -> int:
+        """Queues notes changed since the last scan, e.g. after a sync
+
+        :returns: Number of notes added to the queue
+        """
+        scan_time = now if now is not None else int(time.time())  # Taken before the query, so no edit is missed
+        num_added = self.add(
+            find_notes_needing_ocr(
+                col,
+                modified_since=self.last_scan,
+                text_output_location=text_output_location,
+                ocr_field_name=ocr_field_name,
+            )
+        )
+        self.last_scan = scan_time
+        return num_added
+
+    def save(self):
+        """Writes the queue atomically, so a crash can't leave a half written file"""
+        tmp_path = self.path + ".tmp"
+        Path(tmp_path).write_text(json.dumps({"note_ids": self.note_ids, "last_scan": self.last_scan}))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,19 @@
+"""Test collection shared by the test modules, kept apart from test_ocr so importing it doesn't need tesseract"""
+import shutil
+from pathlib import Path
+
+from anki.collection import Collection
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+TEMPLATE_COLLECTION_PTH = TESTDATA_DIR / "test_collection_template" / "collection.anki2"
+assert TEMPLATE_COLLECTION_PTH.exists()
+
+
+def gen_test_collection(new_dir) -> Collection:
+    """Generates a test collection for us in tests, by copying a template collection"""
+    shutil.copytree(TEMPLATE_COLLECTION_PTH.parent, new_dir, dirs_exist_ok=True)
+    test_col_pth = Path(new_dir, TEMPLATE_COLLECTION_PTH.name)
+    assert test_col_pth
+    test_col = Collection(path=str(test_col_pth))
+    print(f"Test collection created at {test_col_pth}")
+    return test_col
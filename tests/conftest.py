@@ -0,0 +1,15 @@
+import pytest
+
+from anki_ocr import pytesseract
+from anki_ocr.ocr import OCR
+
+
+@pytest.fixture
+def tesseract_cmd(monkeypatch) -> str:
+    """Looked up per test rather than on import, so test modules can be collected without tesseract installed"""
+    try:
+        tesseract_cmd = OCR.path_to_tesseract()
+    except FileNotFoundError:
+        pytest.skip("Tesseract isn't installed")
+    monkeypatch.setattr(pytesseract, "tesseract_cmd", tesseract_cmd)
+    return tesseract_cmd
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Deterministic stand-in for tesseract, for testing scheduling, cancellation, timeouts and scaling without the real
+tesseract. Either run as a script in place of the tesseract executable (see FAKE_TESSERACT), or use FakeEngine as an
+in-process OCR engine.
+
+The text of each image is read from a .txt file next to it if there is one (as for the annotated test images),
+otherwise it is "text of <image name>". Images passed in memory (on stdin) have the text "text of <n> bytes". Images
+with these markers in their file name misbehave:
+
+- "fail": exits with an error, as tesseract does for unreadable images
+- "hang": never finishes, for testing timeouts and cancellation
+- "crash": killed by a signal, as if tesseract segfaulted
+
+The script also waits FAKE_TESSERACT_LATENCY seconds (default 0) per image, to simulate OCR taking time.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+FAKE_TESSERACT = str(Path(__file__).absolute())
+VERSION = "tesseract 5.3.0 (fake)"
+LANGUAGES = ["eng", "osd"]
+PAGE_SEPARATOR = "\f"
+TSV_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+OSD_OUTPUT = "Page number: 0\nOrientation in degrees: 0\nRotate: 0\nScript: Latin\nScript confidence: 5.0\n"
+
+
+class FakeTesseractError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def image_text(img_pth: str) -> str:
+    annotation = Path(img_pth).with_suffix(".txt")
+    if annotation.exists():
+        return annotation.read_text(encoding="utf-8")
+    return f"text of {Path(img_pth).name}\n"
+
+
+def data_text(data) -> str:
+    return f"text of {len(data)} bytes\n"
+
+
+def list_images(input_pth: str) -> List[str]:
+    """Tesseract treats a .txt input as a list of image paths, one per line"""
+    if Path(input_pth).suffix == ".txt":
+        return [line for line in Path(input_pth).read_text(encoding="utf-8").splitlines() if line.strip()]
+    return [input_pth]
+
+
+def render(pages: Sequence[str], output_format: str) -> str:
+    """Formats the text of each page like tesseract's txt, tsv or osd output"""
+    if output_format == "osd":
+        return OSD_OUTPUT
+    if output_format == "txt":
+        return "".join(page + PAGE_SEPARATOR for page in pages)
+    rows = [TSV_HEADER]
+    for page_num, page in enumerate(pages, 1):
+        rows.append(f"1\t{page_num}\t0\t0\t0\t0\t0\t0\t1000\t1000\t-1\t")
+        for line_num, line in enumerate([line for line in page.splitlines() if line.strip()], 1):
+            for word_num, word in enumerate(line.split(), 1):
+                left, top = word_num * 50, line_num * 30
+                rows.append(f"5\t{page_num}\t1\t1\t{line_num}\t{word_num}\t{left}\t{top}\t45\t20\t95\t{word}")
+    return "\n".join(rows) + "\n"
+
+
+def check_image(img_pth: str, output_format: str):
+    """Raises FakeTesseractError for images marked to fail or crash, or returns "hang" for ones marked to hang"""
+    name = Path(img_pth).name
+    if "crash" in name:
+        raise FakeTesseractError(-signal.SIGSEGV, "Segmentation fault")
+    if "fail" in name:
+        message = "Too few characters. Skipping this page" if output_format == "osd" else f"Error reading {name}"
+        raise FakeTesseractError(1, message)
+    if "hang" in name:
+        return "hang"
+    return None
+
+
+class FakeEngine:
+    """In-process OCR engine double with the same outputs and misbehaviour as the fake tesseract script. Requests run
+    on up to max_concurrency threads, and hanging images wait until cancel() is called.
+    """
+
+    name = "fake"
+    version = "1.0"
+
+    def __init__(self, max_concurrency: int = 1, latency: float = 0, texts: Optional[Dict[str, str]] = None, **_kwargs):
+        """
+        :param latency: Seconds to wait per image
+        :param texts: Dict of image path -> text, overriding image_text()
+        """
+        from anki_ocr.engines import EngineCapabilities
+
+        self.capabilities = EngineCapabilities(supports_batching=True, output_formats=frozenset({"txt", "tsv", "osd"}))
+        self.max_concurrency = max(1, max_concurrency)
+        self.latency = latency
+        self.texts = texts or {}
+        self.requests = []
+        self._cancelled = threading.Event()
+
+    def _ocr_request(self, request, output_format: str) -> str:
+        from anki_ocr.pytesseract import TesseractError
+
+        pages = []
+        for img_pth in request.images:
+            if self._cancelled.wait(self.latency):
+                raise RuntimeError("OCR processing cancelled")
+            try:
+                if check_image(img_pth, output_format) == "hang":
+                    self._cancelled.wait()
+                    raise RuntimeError("OCR processing cancelled")
+            except FakeTesseractError as e:
+                raise TesseractError(e.status, e.message)
+            if request.data is not None:
+                pages.append(self.texts.get(img_pth) or data_text(request.data))
+            else:
+                pages.append(self.texts.get(img_pth) or image_text(img_pth))
+        return render(pages, output_format)
+
+    def ocr_many(self, requests, *, lang: str, output_format: str = "txt", on_result=None) -> Iterator:
+        from anki_ocr.engines import OCRResult
+
+        self.requests.extend(requests)
+        with ThreadPoolExecutor(self.max_concurrency) as pool:
+            pending: Dict[Future, str] = {
+                pool.submit(self._ocr_request, request, output_format): request.key for request in requests
+            }
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = OCRResult(pending.pop(future), future.result())
+                        if on_result is not None:
+                            on_result(*result)
+                        yield result
+            except BaseException:
+                self.cancel()  # Stops any requests still running, as the runner kills its processes
+                raise
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+def main(args: List[str]) -> int:
+    if args and args[0] == "--version":
+        print(VERSION)
+        return 0
+    if args and args[0] == "--list-langs":
+        print(f'List of available languages in "{Path(__file__).parent}/" ({len(LANGUAGES)}):')
+        print("\n".join(LANGUAGES))
+        return 0
+
+    input_pth, output_base, options = args[0], args[1], args[2:]
+    if "--psm" in options and options[options.index("--psm") + 1] == "0":
+        output_format = "osd"
+    elif "tessedit_create_tsv=1" in options:
+        output_format = "tsv"
+    else:
+        output_format = "txt"
+
+    latency = float(os.environ.get("FAKE_TESSERACT_LATENCY", 0))
+    if input_pth == "stdin":
+        time.sleep(latency)
+        page = data_text(sys.stdin.buffer.read())
+        Path(f"{output_base}.{output_format}").write_text(render([page], output_format), encoding="utf-8")
+        return 0
+    pages = []
+    for img_pth in list_images(input_pth):
+        time.sleep(latency)
+        try:
+            if check_image(img_pth, output_format) == "hang":
+                while True:
+                    time.sleep(60)
+        except FakeTesseractError as e:
+            if e.status < 0:
+                os.kill(os.getpid(), -e.status)
+            sys.stderr.write(e.message + "\n")
+            return e.status
+        pages.append(image_text(img_pth))
+    Path(f"{output_base}.{output_format}").write_text(render(pages, output_format), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
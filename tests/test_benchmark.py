@@ -0,0 +1,111 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+from anki_ocr.benchmark import (
+    BenchmarkResult,
+    BenchmarkSetting,
+    char_error_rate,
+    edit_distance,
+    format_table,
+    load_annotated_images,
+    main,
+    mark_pareto,
+    run_benchmark,
+    settings_grid,
+)
+from tests.fake_tesseract import FAKE_TESSERACT
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+
+
+@pytest.fixture
+def annotated_dir(tmp_path):
+    """Annotated images, which the fake tesseract OCRs perfectly as it reads their annotations"""
+    for name in ["lazy_fox", "resp_tract_anatomy"]:
+        shutil.copy(TESTDATA_DIR / "annotated_imgs" / f"{name}.png", tmp_path)
+        shutil.copy(TESTDATA_DIR / "annotated_imgs" / f"{name}.txt", tmp_path)
+    return tmp_path
+
+
+def result(cer: float, images_per_sec: float, rss: float) -> BenchmarkResult:
+    return BenchmarkResult(BenchmarkSetting(), num_images=int(images_per_sec * 10), secs=10, cer=cer, peak_rss_mb=rss)
+
+
+class TestMetrics:
+    @pytest.mark.parametrize(
+        ["a", "b", "expected"],
+        [("", "", 0), ("abc", "", 3), ("", "abc", 3), ("kitten", "sitting", 3), ("Aorta", "Aorta", 0)],
+    )
+    def test_edit_distance(self, a, b, expected):
+        assert edit_distance(a, b) == expected
+        assert edit_distance(b, a) == expected
+
+    def test_char_error_rate(self):
+        assert char_error_rate("Left atrium", "Left atrium") == 0
+        assert char_error_rate("Left atrim", "Left atrium") == pytest.approx(1 / 11)
+        assert char_error_rate("text", "") == 4
+
+    def test_pareto(self):
+        accurate, fast, dominated, lean = (
+            result(0.01, 5, 500),
+            result(0.05, 20, 500),
+            result(0.05, 4, 600),
+            result(0.05, 20, 100),
+        )
+        mark_pareto([accurate, fast, dominated, lean])
+        assert accurate.pareto and lean.pareto
+        assert not fast.pareto and not dominated.pareto
+
+    def test_table_most_accurate_first(self):
+        results = mark_pareto([result(0.2, 10, 100), result(0.01, 1, 100)])
+        table = format_table(results).splitlines()
+        assert "1.00%" in table[2] and "20.00%" in table[3]
+        assert table[2].endswith("| * |")
+
+
+class TestBenchmark:
+    def test_settings_grid(self):
+        grid = settings_grid(batch_sizes=[1, 5], threads=[1, 2], cleaners=["default", "minimal"])
+        assert len(grid) == len(set(grid)) == 8
+
+    def test_setting_from_config(self):
+        config = {
+            "ocr_engine": "tesseract",
+            "output_format": "tsv",
+            "batch_size": 5,
+            "use_batching": False,
+            "num_threads": 4,
+            "use_multithreading": True,
+            "normalize_unicode": True,
+            "join_hyphenated_words": True,
+            "collapse_whitespace": True,
+            "collapse_colons": True,
+        }
+        setting = BenchmarkSetting.from_config(config)
+        assert setting == BenchmarkSetting(output_format="tsv", batch_size=1, num_threads=4, cleaner="aggressive")
+
+    @pytest.mark.skipif(sys.platform.startswith("win32"), reason="The fake tesseract is a Python script")
+    def test_run_benchmark(self, annotated_dir):
+        samples = load_annotated_images(annotated_dir)
+        assert len(samples) == 2
+        default = BenchmarkSetting(batch_size=5, num_threads=2)
+        results = run_benchmark(
+            settings_grid(batch_sizes=[1, 5]), samples, default_setting=default, tesseract_exec_pth=FAKE_TESSERACT
+        )
+        assert [r.setting for r in results] == [BenchmarkSetting(), BenchmarkSetting(batch_size=5), default]
+        assert all(r.cer == 0 and r.num_images == 2 for r in results)
+        assert [r.is_default for r in results] == [False, False, True]
+        assert any(r.pareto for r in results)
+
+    @pytest.mark.skipif(sys.platform.startswith("win32"), reason="The fake tesseract is a Python script")
+    def test_max_cer_fails_run(self, annotated_dir, tmp_path_factory):
+        # Named differently to its image, so the fake tesseract doesn't find it and OCRs the wrong text
+        (annotated_dir / "lazy_fox.txt").rename(annotated_dir / "a_lazy_fox.txt")
+        output = tmp_path_factory.mktemp("out") / "benchmark.md"
+        args = ["--images", str(annotated_dir), "--tesseract", FAKE_TESSERACT, "--threads", "1", "--repeat", "1"]
+        assert main(args + ["--batch-sizes", "1", "--output", str(output)]) == 0
+        assert "(defaults)" in output.read_text()
+        assert main(args + ["--batch-sizes", "1", "--max-cer", "0.05"]) == 1
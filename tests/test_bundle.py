@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import pytest
+
+from anki_ocr.api import OCRImage, OCRWord
+from anki_ocr.bundle import OCRBundle, media_hash
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+IMGS_DIR = TESTDATA_DIR / "batch_imgs"
+
+
+def make_image(src: str, text=None, words=None) -> OCRImage:
+    return OCRImage(
+        name=Path(src).stem, src=src, note_id=1, field_name="Front", media_dir=str(IMGS_DIR), text=text, words=words
+    )
+
+
+class TestOCRBundle:
+    srcs = sorted(p.name for p in IMGS_DIR.glob("*.png"))[:2]
+
+    def test_media_hash_matches_contents(self, tmp_path):
+        copy = tmp_path / "renamed.png"
+        copy.write_bytes((IMGS_DIR / self.srcs[0]).read_bytes())
+        assert media_hash(copy) == media_hash(IMGS_DIR / self.srcs[0])
+        assert media_hash(IMGS_DIR / self.srcs[0]) != media_hash(IMGS_DIR / self.srcs[1])
+
+    def test_save_load_roundtrip(self, tmp_path):
+        bundle = OCRBundle(fingerprint={"engine": "tesseract", "languages": ["eng"]})
+        bundle.add(make_image(self.srcs[0], text="Ünïcode text"))
+        bundle.add(make_image(self.srcs[1], text="word", words=[OCRWord("word", 90.0, 1, 2, 3, 4)]))
+        bundle.save(tmp_path / "bundle.ocr.json.gz")
+
+        loaded = OCRBundle.load(tmp_path / "bundle.ocr.json.gz")
+        assert loaded == bundle
+        image = make_image(self.srcs[1])
+        loaded.get(image).apply(image)
+        assert image.text == "word"
+        assert [(w.text, w.left, w.top, w.width, w.height) for w in image.words] == [("word", 1, 2, 3, 4)]
+
+    def test_missing_image(self):
+        bundle = OCRBundle(fingerprint={})
+        assert bundle.get(make_image("does_not_exist.png")) is None
+
+    def test_load_invalid(self, tmp_path):
+        (tmp_path / "not_a_bundle.gz").write_text("hello")
+        with pytest.raises(ValueError, match="not an OCR bundle"):
+            OCRBundle.load(tmp_path / "not_a_bundle.gz")
+
+    def test_fingerprint_differences(self):
+        bundle = OCRBundle(fingerprint={"engine": "tesseract", "languages": ["eng"]})
+        assert bundle.fingerprint_differences({"engine": "tesseract", "languages": ["eng"]}) == {}
+        assert bundle.fingerprint_differences({"engine": "tesseract", "languages": ["deu"]}) == {
+            "languages": (["eng"], ["deu"])
+        }
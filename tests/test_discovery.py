@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from anki_ocr import discovery, pytesseract
+from anki_ocr.discovery import TesseractInstall, find_tesseract
+
+
+def fake_install(exec_path: str, tessdata_dir: str) -> TesseractInstall:
+    return TesseractInstall(
+        exec_path=exec_path,
+        version="5.0.0",
+        tessdata_dir=tessdata_dir,
+        languages=["eng"],
+        stamp=discovery.install_stamp(exec_path, tessdata_dir),
+    )
+
+
+class TestFindTesseract:
+    @pytest.fixture(autouse=True)
+    def isolate_discovery(self, monkeypatch):
+        # find_tesseract() sets the global tesseract_cmd, which other tests rely on
+        monkeypatch.setattr(pytesseract, "tesseract_cmd", pytesseract.tesseract_cmd)
+        discovery.clear_cache()
+        yield
+        discovery.clear_cache()
+
+    def test_discovered_once_per_process(self, monkeypatch, tmp_path):
+        exec_path = tmp_path / "tesseract"
+        exec_path.write_text("")
+        calls = []
+
+        def discover(tesseract_exec_pth=None):
+            calls.append(tesseract_exec_pth)
+            return fake_install(str(exec_path), str(tmp_path))
+
+        monkeypatch.setattr(discovery, "discover_tesseract", discover)
+        first = find_tesseract()
+        assert find_tesseract() is first
+        assert calls == [None]
+
+    def test_valid_cached_install_skips_discovery(self, monkeypatch, tmp_path):
+        exec_path = tmp_path / "tesseract"
+        exec_path.write_text("")
+        cached = TesseractInstall.from_config(fake_install(str(exec_path), str(tmp_path)).to_config())
+
+        def discover(tesseract_exec_pth=None):
+            raise AssertionError("Should not rediscover a valid install")
+
+        monkeypatch.setattr(discovery, "discover_tesseract", discover)
+        assert find_tesseract(cached=cached) == cached
+
+    def test_changed_executable_invalidates_cache(self, tmp_path):
+        exec_path = tmp_path / "tesseract"
+        exec_path.write_text("")
+        install = fake_install(str(exec_path), str(tmp_path))
+        assert install.is_valid()
+
+        exec_path.write_text("updated tesseract")
+        os.utime(exec_path, ns=(0, 0))
+        assert install.is_valid() is False
+
+    def test_invalid_config_ignored(self):
+        assert TesseractInstall.from_config(None) is None
+        assert TesseractInstall.from_config({"unknown_key": 1}) is None
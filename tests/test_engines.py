@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+
+from anki_ocr.engines import ENGINES, OCRRequest, TesseractCLIEngine, create_engine, register_engine
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+BATCH_IMGS = sorted(str(p.absolute()) for p in Path(TESTDATA_DIR, "batch_imgs").glob("*.png"))[:4]
+
+
+@pytest.mark.usefixtures("tesseract_cmd")
+class TestTesseractCLIEngine:
+    def test_results_keyed_by_request(self):
+        engine = TesseractCLIEngine(max_concurrency=2)
+        requests = [OCRRequest(key="batch", images=BATCH_IMGS[:2])] + [
+            OCRRequest(key=p, images=[p]) for p in BATCH_IMGS[2:]
+        ]
+        results = dict(engine.ocr_many(requests, lang="eng"))
+        assert results.keys() == {"batch", *BATCH_IMGS[2:]}
+
+    def test_same_image_in_several_requests(self):
+        engine = TesseractCLIEngine()
+        requests = [OCRRequest(key="a", images=[BATCH_IMGS[0]]), OCRRequest(key="b", images=[BATCH_IMGS[0]])]
+        results = dict(engine.ocr_many(requests, lang="eng"))
+        assert results["a"] == results["b"]
+
+    def test_on_result_called_per_request(self):
+        keys = []
+        requests = [OCRRequest(key=str(i), images=[p]) for i, p in enumerate(BATCH_IMGS)]
+        list(TesseractCLIEngine().ocr_many(requests, lang="eng", on_result=lambda key, _: keys.append(key)))
+        assert sorted(keys) == [str(i) for i in range(len(BATCH_IMGS))]
+
+
+class TestEngineRegistry:
+    def test_tesseract_registered(self):
+        assert isinstance(create_engine("tesseract"), TesseractCLIEngine)
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError, match="Unknown OCR engine 'nope'"):
+            create_engine("nope")
+
+    def test_register_engine(self):
+        class EchoEngine(TesseractCLIEngine):
+            name = "echo"
+
+        register_engine("echo", EchoEngine)
+        try:
+            assert create_engine("echo", max_concurrency=3, unused_setting=True).name == "echo"
+        finally:
+            del ENGINES["echo"]
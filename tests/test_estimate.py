@@ -0,0 +1,90 @@
+import sys
+
+import pytest
+
+from anki_ocr.api import NotesQuery
+from anki_ocr.estimate import DEFAULT_PIXELS_PER_SEC, CostEstimate, Throughput, estimate_run
+from anki_ocr.ocr import OCR
+from tests.fake_tesseract import FAKE_TESSERACT
+from tests.collection import gen_test_collection
+
+
+def estimate(**kwargs) -> CostEstimate:
+    defaults = dict(
+        num_notes=10,
+        unique_images=1240,
+        already_ocred=0,
+        shared_images=0,
+        skipped_images=0,
+        pixels=1240 * 1_000_000,
+        throughput=Throughput(pixels_per_sec=180_000, runs=3),
+    )
+    return CostEstimate(**{**defaults, **kwargs})
+
+
+class TestThroughput:
+    def test_default_until_recorded(self):
+        throughput = Throughput.from_config({}, "tesseract")
+        assert throughput == Throughput(pixels_per_sec=DEFAULT_PIXELS_PER_SEC, runs=0)
+
+    def test_record_and_store_per_engine(self):
+        config = {"ocr_throughput": {"other": {"pixels_per_sec": 1, "runs": 1}}}
+        throughput = Throughput.from_config(config, "tesseract")
+        throughput.record(pixels=8_000_000, secs=10, workers=2)
+        assert throughput == Throughput(pixels_per_sec=400_000, runs=1)
+        throughput.record(pixels=4_000_000, secs=10, workers=2)
+        assert throughput.pixels_per_sec == pytest.approx(0.3 * 200_000 + 0.7 * 400_000)
+        throughput.to_config(config, "tesseract")
+        assert Throughput.from_config(config, "tesseract").runs == 2
+        assert config["ocr_throughput"]["other"] == {"pixels_per_sec": 1, "runs": 1}
+
+    def test_short_runs_ignored(self):
+        throughput = Throughput()
+        throughput.record(pixels=1_000_000, secs=0.5, workers=1)
+        assert throughput.runs == 0
+
+    def test_invalid_config_ignored(self):
+        assert Throughput.from_config({"ocr_throughput": {"tesseract": {"runs": "x"}}}, "tesseract").runs == 0
+
+
+class TestCostEstimate:
+    def test_summary(self):
+        assert estimate().summary(workers=8) == "~1,240 new images, ~14 min 21 s on 8 workers"
+        assert estimate(already_ocred=240).summary(workers=1).startswith("~1,000 new images and 240 already OCR'd")
+
+    def test_summary_without_history(self):
+        assert "rough guess" in estimate(throughput=Throughput()).summary(workers=4)
+
+    def test_more_workers_faster(self):
+        assert estimate().secs(workers=8) == pytest.approx(estimate().secs(workers=1) / 8)
+
+
+class TestEstimateRun:
+    def test_counts_images(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        notes = NotesQuery(col=test_col, note_ids=note_ids)
+        paths = [str(i.img_pth) for note in notes for field in note.field_images for i in field.images]
+
+        result = estimate_run(notes, Throughput(), size_func=lambda _path: (1000, 500))
+        assert result.num_notes == len(note_ids)
+        assert result.unique_images == len(set(paths))
+        assert result.pixels == len(paths) * 500_000
+        # The image occlusion notes share one image, which already has OCR text in its title
+        assert result.already_ocred == 1
+        assert result.shared_images == 1
+
+        unbatched = estimate_run(notes, Throughput(), use_batching=False, size_func=lambda _path: (1000, 500))
+        assert unbatched.pixels == len(set(paths)) * 500_000
+
+    @pytest.mark.skipif(sys.platform.startswith("win32"), reason="The fake tesseract is a Python script")
+    def test_already_ocred_after_run(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        ocr = OCR(col=test_col, tesseract_exec_pth=FAKE_TESSERACT)
+        ocr.run_ocr_on_notes(note_ids=note_ids)
+        assert ocr.ocr_pixels > 0 and ocr.ocr_secs > 0
+
+        result = estimate_run(NotesQuery(col=test_col, note_ids=note_ids), Throughput())
+        assert result.already_ocred == result.unique_images > 0
+        assert result.new_images == 0
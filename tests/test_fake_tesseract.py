@@ -0,0 +1,141 @@
+"""Scheduling, failure and scaling tests, using the fake tesseract so they're fast and don't need tesseract installed"""
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from anki_ocr import pytesseract
+from anki_ocr.engines import ENGINES, OCRRequest, TesseractCLIEngine, register_engine
+from anki_ocr.ocr import OCR
+from anki_ocr.runner import TesseractRunner
+from anki_ocr.structured import text_to_pages
+from tests.fake_tesseract import FAKE_TESSERACT, FakeEngine
+from tests.collection import gen_test_collection
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+IMG = sorted((TESTDATA_DIR / "batch_imgs").glob("*.png"))[0]
+
+pytestmark = pytest.mark.skipif(sys.platform.startswith("win32"), reason="The fake tesseract is a Python script")
+
+
+@pytest.fixture
+def fake_tesseract(monkeypatch):
+    monkeypatch.setattr(pytesseract, "tesseract_cmd", FAKE_TESSERACT)
+    return FAKE_TESSERACT
+
+
+@pytest.fixture
+def fake_engine():
+    register_engine(FakeEngine.name, FakeEngine)
+    yield FakeEngine.name
+    del ENGINES[FakeEngine.name]
+
+
+def marked_image(tmp_path: Path, marker: str) -> str:
+    img_pth = tmp_path / f"img_{marker}.png"
+    shutil.copy(IMG, img_pth)
+    return str(img_pth)
+
+
+class TestFakeTesseractScript:
+    def test_canned_text(self, fake_tesseract, tmp_path):
+        img = marked_image(tmp_path, "ok")
+        Path(img).with_suffix(".txt").write_text("Left atrium\n")
+        assert TesseractRunner().run([img], lang="eng") == {img: "Left atrium\n\f"}
+
+    def test_timeout_kills_hanging_process(self, fake_tesseract, tmp_path):
+        start = time.perf_counter()
+        with pytest.raises(RuntimeError, match="timeout"):
+            TesseractRunner(max_concurrency=2, timeout=0.5).run([marked_image(tmp_path, "hang")], lang="eng")
+        assert time.perf_counter() - start < 5
+
+    @pytest.mark.parametrize("marker", ["fail", "crash"])
+    def test_errors(self, fake_tesseract, tmp_path, marker):
+        with pytest.raises(pytesseract.TesseractError):
+            TesseractRunner().run([marked_image(tmp_path, marker)], lang="eng")
+
+    def test_failed_script_detection_is_empty(self, fake_tesseract, tmp_path):
+        img = marked_image(tmp_path, "fail")
+        assert TesseractRunner().run([img], lang="osd", output_format="osd") == {img: ""}
+
+    def test_image_data_on_stdin(self, fake_tesseract):
+        data = IMG.read_bytes()
+        expected = f"text of {len(data)} bytes\n\f"
+        assert pytesseract.image_to_string(data) == expected
+        assert TesseractRunner().run(["in_memory"], lang="eng", image_data={"in_memory": memoryview(data)}) == {
+            "in_memory": expected
+        }
+        engine = TesseractCLIEngine()
+        requests = [OCRRequest(key="a", images=["a.png"], data=data), OCRRequest(key="b", images=[str(IMG)])]
+        assert dict(engine.ocr_many(requests, lang="eng")) == {"a": expected, "b": f"text of {IMG.name}\n\f"}
+
+    def test_results_stream_while_others_run(self, fake_tesseract, tmp_path):
+        images = [marked_image(tmp_path, "hang"), marked_image(tmp_path, "ok")]
+        results = TesseractCLIEngine(max_concurrency=2).ocr_many(
+            [OCRRequest(key=img, images=[img]) for img in images], lang="eng"
+        )
+        assert next(results).key == images[1]
+        start = time.perf_counter()
+        results.close()  # Cancels the hanging request
+        assert time.perf_counter() - start < 5
+
+    def test_run_ocr_on_collection(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        ocr = OCR(col=test_col, tesseract_exec_pth=FAKE_TESSERACT, num_threads=4)
+        ocr.run_ocr_on_notes(note_ids=note_ids)
+        fields = "".join(field for nid in note_ids for field in test_col.get_note(nid).fields)
+        assert 'title="text of' in fields
+
+    def test_cancelled_run_stops_before_next_chunk(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        ocr = OCR(col=test_col, tesseract_exec_pth=FAKE_TESSERACT)
+        ocr.cancel()
+        assert ocr.run_ocr_on_notes(note_ids=note_ids).processed_note_ids == []
+
+
+class TestFakeEngine:
+    def test_scales_to_many_images(self, fake_engine):
+        num_images = 20_000
+        ocr = OCR(col=None, tesseract_exec_pth=FAKE_TESSERACT, engine=fake_engine, num_threads=4)
+        images = [f"/nonexistent/img_{i}.png" for i in range(num_images)]
+        ocr.engine.texts = {img: f"word {i}" for i, img in enumerate(images)}
+        requests = [OCRRequest(key=str(i), images=images[i : i + 10]) for i in range(0, num_images, 10)]
+
+        start = time.perf_counter()
+        results = ocr._run_engine(requests)
+        assert time.perf_counter() - start < 30
+        assert len(results) == len(requests)
+        assert [p.text for p in text_to_pages(results["10"])[:10]] == [f"word {i}" for i in range(10, 20)]
+
+    def test_cancel_stops_hanging_request(self, fake_engine, tmp_path):
+        ocr = OCR(col=None, tesseract_exec_pth=FAKE_TESSERACT, engine=fake_engine, num_threads=2)
+        images = [marked_image(tmp_path, "hang"), marked_image(tmp_path, "ok")]
+        results, errors = [], []
+
+        def run():
+            try:
+                results.extend(ocr.engine.ocr_many([OCRRequest(key=img, images=[img]) for img in images], lang="eng"))
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.2)
+        ocr.cancel()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        assert len(errors) == 1 and "cancelled" in str(errors[0])
+        # Later stages of the run aren't started
+        with pytest.raises(RuntimeError, match="cancelled"):
+            ocr._run_engine([OCRRequest(key=images[1], images=[images[1]])])
+
+    def test_failure_raises(self, fake_engine, tmp_path):
+        ocr = OCR(col=None, tesseract_exec_pth=FAKE_TESSERACT, engine=fake_engine)
+        img = marked_image(tmp_path, "fail")
+        with pytest.raises(pytesseract.TesseractError):
+            ocr._run_engine([OCRRequest(key=img, images=[img])])
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import time
+
+from anki_ocr.governor import (
+    DEFAULT_TESSERACT_RSS_MB,
+    PeakRSSSampler,
+    ResourceBudget,
+    ResourceGovernor,
+    child_pids,
+    finished_children_peak_rss_mb,
+    process_rss_mb,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_governor(budget: ResourceBudget, rss=None, load=None, clock=None, finished_rss=None) -> ResourceGovernor:
+    return ResourceGovernor(
+        budget,
+        clock=clock or FakeClock(),
+        rss_func=lambda pid: rss,
+        load_func=lambda: load,
+        finished_rss_func=lambda: finished_rss,
+    )
+
+
+class TestResourceGovernor:
+    def test_no_limits_uses_max_cores(self):
+        assert make_governor(ResourceBudget(max_cores=3)).allowed_workers([]) == 3
+
+    def test_memory_ceiling(self):
+        governor = make_governor(ResourceBudget(max_cores=8, max_memory_mb=1000), rss=300)
+        assert governor.allowed_workers([]) == 1000 // DEFAULT_TESSERACT_RSS_MB  # Nothing measured yet
+        assert governor.allowed_workers([1, 2]) == 3
+        assert governor.peak_rss_mb == 300
+
+    def test_memory_ceiling_from_finished_processes(self):
+        # Running processes can't be measured off Linux without psutil, finished ones can on macOS
+        governor = make_governor(ResourceBudget(max_cores=8, max_memory_mb=1000), finished_rss=400)
+        assert governor.allowed_workers([1]) == 2
+        assert governor.peak_rss_mb == 400
+
+    def test_always_allows_one_worker(self):
+        governor = make_governor(ResourceBudget(max_cores=8, max_memory_mb=100), rss=2000)
+        assert governor.allowed_workers([1]) == 1
+
+    def test_scales_down_under_load(self):
+        cpu_count = os.cpu_count() or 1
+        busy = make_governor(ResourceBudget(max_cores=cpu_count), load=cpu_count + 1)
+        assert busy.allowed_workers([]) == 1
+        # Load from our own processes isn't held against us
+        own_load = make_governor(ResourceBudget(max_cores=cpu_count), load=2)
+        assert own_load.allowed_workers([1, 2]) == cpu_count
+
+    def test_deadline(self):
+        clock = FakeClock()
+        governor = make_governor(ResourceBudget(deadline_secs=60), clock=clock)
+        governor.start()
+        assert not governor.deadline_passed()
+        clock.now += 60
+        assert governor.deadline_passed()
+        assert governor.deadline_reached
+
+    def test_no_deadline(self):
+        clock = FakeClock()
+        governor = make_governor(ResourceBudget(), clock=clock)
+        governor.start()
+        clock.now += 1e6
+        assert not governor.deadline_passed()
+
+    def test_process_rss(self):
+        rss = process_rss_mb(os.getpid())
+        assert rss is None or rss > 0
+        assert process_rss_mb(-1) is None
+        finished_rss = finished_children_peak_rss_mb()
+        assert finished_rss is None or finished_rss > 0
+
+    def test_peak_rss_includes_child_processes(self):
+        with PeakRSSSampler(interval=0.01) as sampler:
+            child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.5)"])
+            if process_rss_mb(os.getpid()) is not None:  # Linux only
+                time.sleep(0.2)
+                assert child.pid in child_pids(os.getpid())
+            child.wait()
+        assert sampler.peak_rss_mb is None or sampler.peak_rss_mb > 0
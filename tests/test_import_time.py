@@ -0,0 +1,80 @@
+# Guards against slowing down Anki startup, by checking what importing the addon pulls in with python -X importtime
+import importlib.util
+import os
+import pkgutil
+import subprocess
+import sys
+from typing import Dict, List
+
+import pytest
+
+# Modules imported as the addon loads, to add the browser menu. Every other module of the addon is only needed once the
+# user runs an OCR action from the browser menu
+EAGER_MODULES = {"anki_ocr.gui", "anki_ocr.utils"}
+# Only counted if Anki hasn't already imported them, e.g. aqt.browser imports bs4
+LAZY_THIRD_PARTY_MODULES = ["bs4"]
+# Modules Anki has imported before it loads addons
+PRELOADED_MODULES = ["aqt", "aqt.browser", "aqt.qt", "aqt.utils"]
+# Total time spent importing the addon's own modules, excluding anki/aqt which Anki has already imported
+ADDON_IMPORT_BUDGET_US = 100_000
+MARKER = "-- importing the addon --"
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Imports module in a fresh interpreter, after what Anki has already imported, returning the self import time in
+    microseconds of each module that importing it loaded
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    preload = "; ".join(f"import {m}" for m in PRELOADED_MODULES)
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"{preload}; import sys; print({MARKER!r}, file=sys.stderr); import {module}",
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    times = {}
+    stderr = proc.stderr.split(MARKER, 1)[1]
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _cumulative_us, name = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            times[name.strip()] = int(self_us)
+    return times
+
+
+def lazy_modules() -> List[str]:
+    """:returns: Every module of the addon package that shouldn't be imported at startup, found without importing it"""
+    spec = importlib.util.find_spec("anki_ocr")
+    assert spec is not None and spec.submodule_search_locations is not None
+    addon_modules = [f"anki_ocr.{m.name}" for m in pkgutil.iter_modules(spec.submodule_search_locations)]
+    return [m for m in addon_modules if m not in EAGER_MODULES] + LAZY_THIRD_PARTY_MODULES
+
+
+@pytest.fixture(scope="module")
+def times() -> Dict[str, int]:
+    return import_times("anki_ocr")
+
+
+class TestImportTime:
+    def test_addon_imported(self, times):
+        assert "anki_ocr" in times
+        assert "anki_ocr.gui" in times
+
+    def test_lazy_modules_found(self):
+        assert {"anki_ocr.ocr", "anki_ocr.search_index", "anki_ocr.watcher", "bs4"} <= set(lazy_modules())
+
+    def test_engine_imported_lazily(self, times):
+        eagerly_imported = [m for m in lazy_modules() if m in times]
+        assert eagerly_imported == []
+
+    def test_addon_import_budget(self, times):
+        addon_us = sum(t for name, t in times.items() if name.split(".")[0] == "anki_ocr")
+        assert addon_us < ADDON_IMPORT_BUDGET_US
@@ -0,0 +1,46 @@
+from anki_ocr.languages import LanguageRouter
+from anki_ocr.pytesseract import osd_to_dict
+
+OSD_OUTPUT = """Page number: 0
+Orientation in degrees: 0
+Rotate: 0
+Orientation confidence: 7.21
+Script: Cyrillic
+Script confidence: 3.52
+"""
+
+
+def test_osd_to_dict():
+    assert osd_to_dict(OSD_OUTPUT) == {
+        "page_num": 0,
+        "orientation": 0,
+        "rotate": 0,
+        "orientation_conf": 7.21,
+        "script": "Cyrillic",
+        "script_conf": 3.52,
+    }
+
+
+class TestLanguageRouter:
+    router = LanguageRouter(["eng", "deu", "rus", "jpn"])
+
+    def test_is_useful(self):
+        assert self.router.is_useful
+        assert not LanguageRouter(["eng", "deu"]).is_useful
+        assert not LanguageRouter(["eng"]).is_useful
+
+    def test_languages_for_script(self):
+        assert self.router.languages_for_script("Latin") == ["eng", "deu"]
+        assert self.router.languages_for_script("Han") == ["jpn"]
+        # Scripts without a configured language fall back to every language
+        assert self.router.languages_for_script("Arabic") == ["eng", "deu", "rus", "jpn"]
+        assert self.router.languages_for_script(None) == ["eng", "deu", "rus", "jpn"]
+
+    def test_unknown_languages_always_used(self):
+        assert LanguageRouter(["eng", "rus", "custom"]).languages_for_script("Latin") == ["eng", "custom"]
+
+    def test_languages_for_osd(self):
+        assert self.router.languages_for_osd(OSD_OUTPUT) == ["rus"]
+        low_confidence = OSD_OUTPUT.replace("Script confidence: 3.52", "Script confidence: 0.20")
+        assert self.router.languages_for_osd(low_confidence) == ["eng", "deu", "rus", "jpn"]
+        assert self.router.languages_for_osd("") == ["eng", "deu", "rus", "jpn"]
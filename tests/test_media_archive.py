@@ -0,0 +1,86 @@
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from anki_ocr import discovery, pytesseract
+from anki_ocr.bundle import data_hash, media_hash
+from anki_ocr.engines import ENGINES, register_engine
+from anki_ocr.media_archive import MediaArchive
+from anki_ocr.ocr import OCR
+from tests.fake_tesseract import FakeEngine
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+IMGS = sorted((TESTDATA_DIR / "batch_imgs").glob("*.png"))[:2]
+
+
+def make_package(path: Path, media: dict, contents: dict) -> Path:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("collection.anki21", b"")
+        zf.writestr("media", json.dumps(media) if isinstance(media, dict) else media)
+        for member, data in contents.items():
+            zf.writestr(member, data)
+    return path
+
+
+@pytest.fixture
+def package(tmp_path) -> Path:
+    media = {"0": "first.png", "1": "second.PNG", "2": "sound.mp3", "3": "copy_of_first.png"}
+    contents = {"0": IMGS[0].read_bytes(), "1": IMGS[1].read_bytes(), "2": b"ID3", "3": IMGS[0].read_bytes()}
+    return make_package(tmp_path / "deck.apkg", media, contents)
+
+
+class TestMediaArchive:
+    def test_reads_package_images(self, package):
+        with MediaArchive(package) as archive:
+            assert archive.names == ["first.png", "second.PNG", "copy_of_first.png"]
+            assert archive.read("second.PNG") == IMGS[1].read_bytes()
+            assert [name for name, _data in archive] == archive.names
+
+    def test_reads_zip_of_images(self, tmp_path):
+        path = tmp_path / "images.zip"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.write(IMGS[0], f"folder/{IMGS[0].name}")
+            zf.writestr("notes.txt", "not an image")
+        with MediaArchive(path) as archive:
+            assert dict(archive) == {f"folder/{IMGS[0].name}": IMGS[0].read_bytes()}
+
+    def test_newer_package_format_raises(self, tmp_path):
+        path = make_package(tmp_path / "deck.apkg", b"\x28\xb5\x2f\xfd zstd", {"0": b"\x28\xb5\x2f\xfd"})
+        with pytest.raises(ValueError, match="Support older Anki versions"):
+            MediaArchive(path)
+
+    def test_not_a_zip_raises(self, tmp_path):
+        path = tmp_path / "deck.apkg"
+        path.write_bytes(b"not a zip")
+        with pytest.raises(ValueError, match="not a deck package"):
+            MediaArchive(path)
+
+    def test_data_hash_matches_media_hash(self):
+        assert data_hash(memoryview(IMGS[0].read_bytes())) == media_hash(IMGS[0])
+
+
+class TestOCRArchive:
+    @pytest.fixture
+    def fake_engine(self, monkeypatch):
+        # Tesseract installs found by earlier tests are forgotten, as the fake engine shouldn't need one
+        monkeypatch.setattr(discovery, "_INSTALLS", {})
+        monkeypatch.setattr(pytesseract, "tesseract_cmd", "/nonexistent/tesseract")
+        register_engine(FakeEngine.name, FakeEngine)
+        yield FakeEngine.name
+        del ENGINES[FakeEngine.name]
+
+    def test_ocr_archive(self, fake_engine, package):
+        ocr = OCR(col=None, engine=fake_engine, num_threads=2)
+        assert ocr.tesseract is None
+        ocr.engine.texts = {"first.png": "Left atrium"}
+        bundle = ocr.ocr_archive(package)
+        assert bundle.fingerprint == ocr.fingerprint
+        assert {key: entry.text for key, entry in bundle.results.items()} == {
+            media_hash(IMGS[0]): "Left atrium",
+            media_hash(IMGS[1]): f"text of {IMGS[1].stat().st_size} bytes",
+        }
+        # Images in the archive under more than one name are only OCR'd once, and nothing is read from disk
+        assert [request.images for request in ocr.engine.requests] == [["first.png"], ["second.PNG"]]
+        assert all(isinstance(request.data, bytes) for request in ocr.engine.requests)
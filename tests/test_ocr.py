@@ -1,42 +1,28 @@
 # Some basic tests to make sure major breaking changes dont occur
-import shutil
+from functools import partial
 from pathlib import Path
 
 import pytest
-from anki.collection import Collection
 
-from anki_ocr.api import NotesQuery
+from anki_ocr.api import NotesQuery, OCRNote
+from anki_ocr.bundle import OCRBundle
+from anki_ocr.engines import ENGINES, EngineCapabilities, OCRRequest, OCRResult, register_engine
 from anki_ocr.ocr import OCR
-from anki_ocr import pytesseract
+from anki_ocr.search_index import OCRSearchIndex
+from anki_ocr.targeting import TargetingRules
+from anki_ocr.work_queue import OCRWorkQueue, find_notes_needing_ocr
+from tests.collection import gen_test_collection
 
 TESTDATA_DIR = Path(__file__).parent / "testdata"
-TEMPLATE_COLLECTION_PTH = TESTDATA_DIR / "test_collection_template" / "collection.anki2"
-assert TEMPLATE_COLLECTION_PTH.exists()
-
-
-# TEMPLATE_COLLECTION = Collection(path=str(TEMPLATE_COLLECTION_PTH))
-
-
-def gen_test_collection(new_dir) -> Collection:
-    """Generates a test collection for us in tests, by copying a template collection"""
-    # col_dir = Path(tmp_path_factory, "Collection")
-    # col_dir.mkdir()
-    shutil.copytree(TEMPLATE_COLLECTION_PTH.parent, new_dir, dirs_exist_ok=True)
-    test_col_pth = Path(new_dir, TEMPLATE_COLLECTION_PTH.name)
-    assert test_col_pth
-    test_col = Collection(path=str(test_col_pth))
-    print(f"Test collection created at {test_col_pth}")
-    return test_col
 
 
+@pytest.mark.usefixtures("tesseract_cmd")
 class TestOCR:
     all_img_files = list(Path(TESTDATA_DIR, "annotated_imgs").glob("*"))
     img_pths = sorted([f for f in all_img_files if f.suffix in [".png", ".jpg", ".tiff", ".tif", ".jpeg"]])
     annot_pths = sorted([f for f in all_img_files if f.suffix == ".txt"])
     annot_txts = [f.read_text(encoding="utf-8") for f in annot_pths]
     assert len(img_pths) == len(annot_pths)
-    tesseract_cmd = OCR.path_to_tesseract()
-    pytesseract.tesseract_cmd = tesseract_cmd
 
     def test_collection_ok(self, tmpdir):
         col_dir = tmpdir.mkdir("collection")
@@ -46,7 +32,7 @@ class TestOCR:
     @pytest.mark.parametrize(["img_pth", "expected"], [(i, a) for i, a in zip(img_pths, annot_txts)])
     def test_ocr_img_with_lang(self, img_pth, expected):
         img = str(img_pth.absolute())
-        ocr_result = OCR._ocr_img(img, languages=["eng"], preserve_interword_spaces=False)
+        ocr_result = OCR(col=None, languages=["eng"])._run_engine([OCRRequest(key=img, images=[img])])[img]
         cleaned_result = OCR.clean_ocr_text(ocr_result).strip()
         expected = expected.strip()
         assert cleaned_result == expected
@@ -54,7 +40,7 @@ class TestOCR:
     @pytest.mark.parametrize(["img_pth", "expected"], [(i, a) for i, a in zip(img_pths, annot_txts)])
     def test_ocr_img_without_lang(self, img_pth, expected):
         img = str(img_pth.absolute())
-        ocr_result = OCR._ocr_img(img, preserve_interword_spaces=False).strip()
+        ocr_result = OCR(col=None)._run_engine([OCRRequest(key=img, images=[img])])[img].strip()
         cleaned_result = OCR.clean_ocr_text(ocr_result).strip()
         expected = expected.strip()
         assert cleaned_result == expected
@@ -77,6 +63,133 @@ class TestOCR:
         for note in q_images.notes:
             assert note.note_id in note_ids
 
+    def test_query_skips_notes_without_images(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note = test_col.new_note(test_col.models.by_name("Basic"))
+        note["Front"] = "No images here"
+        test_col.add_note(note, test_col.decks.id("Default"))
+        note_ids = test_col.db.list("select id from notes")
+        notes_query = NotesQuery(col=test_col, note_ids=note_ids)
+        assert note.id not in notes_query.image_note_ids
+        assert len(notes_query) == len(note_ids) - 1
+        assert [n.note_id for n in notes_query] == [nid for nid in note_ids if nid != note.id]
+
+    def test_query_chunks(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        chunks = list(NotesQuery(col=test_col, note_ids=note_ids, chunk_size=4).chunks())
+        assert [len(chunk) for chunk in chunks] == [4, len(note_ids) - 4]
+        assert [note.note_id for chunk in chunks for note in chunk] == note_ids
+
+    def test_run_ocr_in_chunks(self, tmpdir, monkeypatch):
+        note_ids = [1601851571572, 1601851621708]
+        whole_col = gen_test_collection(tmpdir.mkdir("whole"))
+        OCR(col=whole_col, text_output_location="tooltip").run_ocr_on_notes(note_ids=note_ids)
+
+        monkeypatch.setattr("anki_ocr.ocr.NotesQuery", partial(NotesQuery, chunk_size=1))
+        chunked_col = gen_test_collection(tmpdir.mkdir("chunked"))
+        notes_query = OCR(col=chunked_col, text_output_location="tooltip").run_ocr_on_notes(note_ids=note_ids)
+        assert notes_query.processed_note_ids == note_ids
+        for nid in note_ids:
+            assert chunked_col.get_note(nid).fields == whole_col.get_note(nid).fields
+
+    @pytest.mark.parametrize("text_output_location", ["tooltip", "new_field"])
+    def test_rerun_leaves_unchanged_notes(self, tmpdir, text_output_location):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = [1601851571572, 1601851621708]
+        ocr = OCR(col=test_col, text_output_location=text_output_location)
+        assert ocr.run_ocr_on_notes(note_ids=note_ids).changed_note_ids != []
+        mtimes = [test_col.get_note(nid).mod for nid in note_ids]
+
+        notes_query = OCR(col=test_col, text_output_location=text_output_location).run_ocr_on_notes(note_ids=note_ids)
+        assert notes_query.processed_note_ids == note_ids
+        assert notes_query.changed_note_ids == []
+        assert [test_col.get_note(nid).mod for nid in note_ids] == mtimes
+
+    def test_existing_field_keeps_notetype(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        with_field, without_field = 1601851571572, 1601851621708
+        model = test_col.models.get(test_col.get_note(with_field).mid)
+        test_col.models.add_field(model, test_col.models.new_field("OCR text"))
+        test_col.models.update_dict(model)
+        mids = [test_col.get_note(nid).mid for nid in (with_field, without_field)]
+
+        find_existing = partial(
+            find_notes_needing_ocr,
+            test_col,
+            text_output_location="existing_field",
+            ocr_field_name="OCR text",
+            note_ids=[with_field, without_field],
+        )
+        assert find_existing() == [with_field]  # Notes without the field have nowhere to put the text
+
+        ocr = OCR(col=test_col, text_output_location="existing_field", ocr_field_name="OCR text")
+        notes_query = ocr.run_ocr_on_notes(note_ids=[with_field, without_field])
+        assert notes_query.changed_note_ids == [with_field]
+        assert [test_col.get_note(nid).mid for nid in (with_field, without_field)] == mids
+        assert test_col.get_note(with_field)["OCR text"].startswith("Image: ")
+        assert len(ocr.export_bundle([with_field])) > 0
+        assert find_existing() == []  # The images have no title, but their text is in the field
+
+        assert ocr.remove_ocr_on_notes([with_field]) == 1
+        assert test_col.get_note(with_field)["OCR text"] == ""
+
+    def test_sidecar_leaves_notes_unchanged(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = [1601851571572, 1601851621708]
+        fields = [test_col.get_note(nid).fields for nid in note_ids]
+
+        find_sidecar = partial(find_notes_needing_ocr, test_col, text_output_location="sidecar", note_ids=note_ids)
+        assert find_sidecar() == note_ids[:1]  # The other note has an _OCR notetype
+
+        ocr = OCR(col=test_col, text_output_location="sidecar", use_search_index=False)
+        notes_query = ocr.run_ocr_on_notes(note_ids=note_ids)
+        assert find_sidecar() == []
+        assert notes_query.processed_note_ids == note_ids
+        assert [test_col.get_note(nid).fields for nid in note_ids] == fields
+        # Updating the index counts as a change, so the summary doesn't report nothing changed
+        assert notes_query.changed_note_ids == note_ids
+        assert ocr.run_ocr_on_notes(note_ids=note_ids).changed_note_ids == []
+        with OCRSearchIndex.for_collection(test_col) as search_index:
+            texts = search_index.texts_for_note(note_ids[0], media_dir=test_col.media.dir())
+        assert texts and all(texts.values())
+        assert len(ocr.export_bundle(note_ids[:1])) == len(texts)
+
+        assert ocr.remove_ocr_on_notes(note_ids[:1]) == 1
+        with OCRSearchIndex.for_collection(test_col) as search_index:
+            assert search_index.texts_for_note(note_ids[0]) == {}
+
+    def test_targeting_excludes_notetypes(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_ids = test_col.db.list("select id from notes")
+        targeting = TargetingRules(exclude_notetypes=["Image Occlusion*"])
+        # The _OCR copy of a notetype is targeted by the original's name
+        notes_query = NotesQuery(col=test_col, note_ids=note_ids, targeting=targeting)
+        assert notes_query.image_note_ids == [1601851571572]
+        assert notes_query.num_skipped == len(note_ids) - 1
+
+        fields = {nid: test_col.get_note(nid).fields for nid in note_ids}
+        notes_query = OCR(col=test_col, targeting=targeting).run_ocr_on_notes(note_ids=note_ids)
+        assert notes_query.processed_note_ids == [1601851571572]
+        assert [nid for nid in note_ids if test_col.get_note(nid).fields != fields[nid]] == [1601851571572]
+
+    def test_targeting_excludes_fields_and_images(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note_id = 1601851571572
+        field_images = NotesQuery(col=test_col, note_ids=[note_id]).notes[0].field_images
+        image_fields = [f.field_name for f in field_images if f.images]
+        assert image_fields
+
+        targeting = TargetingRules(exclude_fields=image_fields)
+        assert NotesQuery(col=test_col, note_ids=[note_id], targeting=targeting).notes == []
+        notes_query = OCR(col=test_col, targeting=targeting).run_ocr_on_notes(note_ids=[note_id])
+        assert notes_query.processed_note_ids == []
+
+        targeting = TargetingRules(min_width=100_000)
+        assert next(NotesQuery(col=test_col, note_ids=[note_id], targeting=targeting).chunks()) == []
+        excluded = OCRNote(note_id=note_id, col=test_col, targeting=targeting).field_images
+        assert sum(len(f.excluded_images) for f in excluded) == sum(len(f.images) for f in field_images)
+
     def test_run_ocr_on_collection(self, tmpdir):
         col_dir = tmpdir.mkdir("collection")
         test_col = gen_test_collection(col_dir)
@@ -124,6 +237,31 @@ class TestOCR:
         ocr.run_ocr_on_notes(note_ids=note_ids)
         ocr.remove_ocr_on_notes(note_ids=note_ids)
 
+    def test_remove_ocr_only_rewrites_notes_with_ocr(self, tmpdir):
+        col_dir = tmpdir.mkdir("collection")
+        test_col = gen_test_collection(col_dir)
+        ocr = OCR(col=test_col, text_output_location="tooltip")
+        note_ids = [1601851571572, 1601851621708]
+        ocr.run_ocr_on_notes(note_ids=note_ids[:1])
+        assert "title=" in "".join(test_col.get_note(note_ids[0]).fields)
+
+        # The second note already has an _OCR notetype in the template collection
+        assert ocr.remove_ocr_on_notes(note_ids=note_ids) == 2
+        assert "title=" not in "".join(test_col.get_note(note_ids[0]).fields)
+        assert not test_col.get_note(note_ids[1]).note_type()["name"].endswith("_OCR")
+        assert ocr.remove_ocr_on_notes(note_ids=note_ids) == 0
+
+    def test_remove_ocr_keeps_user_titles(self, tmpdir):
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        note = test_col.get_note(1601851571572)
+        note.fields = [field.replace("<img ", '<img title="My caption" ') for field in note.fields]
+        test_col.update_note(note)
+        fields = test_col.get_note(note.id).fields
+
+        ocr = OCR(col=test_col, text_output_location="tooltip")
+        assert ocr.remove_ocr_on_notes(note_ids=[note.id]) == 0
+        assert test_col.get_note(note.id).fields == fields
+
     def test_clean_ocr_text(self):
         input_str = (
             "this is some text: with a result\n\n\nThis is some double colon :: with result"
@@ -138,3 +276,85 @@ class TestOCR:
         )
         output = OCR.clean_ocr_text(input_str)
         assert output == expected_output
+
+    def test_work_queue_scan(self, tmpdir):
+        col_dir = tmpdir.mkdir("collection")
+        test_col = gen_test_collection(col_dir)
+        queue = OCRWorkQueue.for_collection(test_col)
+        assert queue.scan(test_col) == 0  # Only notes changed after the queue was created
+        queue.last_scan = 0
+        assert queue.scan(test_col) > 0
+        ocr = OCR(col=test_col)
+        ocr.run_ocr_on_query(note_ids=queue.peek(len(queue)))
+        # OCR'd notes are changed, but no longer need OCR
+        assert OCRWorkQueue(queue.path + ".new", now=0).scan(test_col) == 0
+
+    def test_export_then_import_bundle(self, tmpdir):
+        note_ids = [1601851571572, 1601851621708]
+        src_col = gen_test_collection(tmpdir.mkdir("src"))
+        src_ocr = OCR(col=src_col, text_output_location="tooltip")
+        src_ocr.run_ocr_on_notes(note_ids=note_ids)
+        bundle_pth = Path(tmpdir, "results.ocr.json.gz")
+        src_ocr.export_bundle(note_ids).save(bundle_pth)
+        expected = ["".join(src_col.get_note(nid).fields) for nid in note_ids]
+
+        dest_col = gen_test_collection(tmpdir.mkdir("dest"))
+        dest_ocr = OCR(col=dest_col, text_output_location="tooltip")
+        bundle = OCRBundle.load(bundle_pth)
+        assert bundle.fingerprint_differences(dest_ocr.fingerprint) == {}
+        notes_query = dest_ocr.import_bundle(bundle, note_ids)
+        assert notes_query.processed_note_ids == note_ids
+        assert ["".join(dest_col.get_note(nid).fields) for nid in note_ids] == expected
+
+    def test_notetype_registry(self, tmpdir):
+        col_dir = tmpdir.mkdir("collection")
+        test_col = gen_test_collection(col_dir)
+        note_ids = [1601851571572, 1601851621708]
+        notes_query = NotesQuery(col=test_col, note_ids=note_ids)
+        registry = notes_query.notes[0].registry
+        assert all(note.registry is registry for note in notes_query)
+
+        # The second note already has an _OCR notetype in the template collection
+        orig_note, ocr_note = notes_query.notes
+        assert not orig_note.has_OCR_field and ocr_note.has_OCR_field
+        orig_mid = registry.orig_model_id_for(ocr_note.mid)
+        assert orig_mid is not None and registry.ocr_model_id_for(orig_mid) == ocr_note.mid
+
+        calls = []
+        all_names_and_ids = test_col.models.all_names_and_ids
+        test_col.models.all_names_and_ids = lambda: calls.append(1) or all_names_and_ids()
+        for note in notes_query:
+            note.add_imgdata_to_note(method="new_field", save=False)
+        assert orig_note.has_OCR_field
+        assert len(calls) <= 1  # Only reloaded if a new _OCR notetype had to be created
+
+    def test_custom_engine(self, tmpdir):
+        class FakeEngine:
+            name = "fake"
+            version = "1.0"
+            capabilities = EngineCapabilities(supports_batching=False)
+
+            def __init__(self, **_kwargs):
+                self.requests = []
+
+            def ocr_many(self, requests, *, lang, output_format="txt", on_result=None):
+                for request in requests:
+                    assert len(request.images) == 1
+                    self.requests.append(request)
+                    yield OCRResult(request.key, f"text of {Path(request.images[0]).name}")
+
+            def cancel(self):
+                pass
+
+        register_engine("fake", FakeEngine)
+        try:
+            test_col = gen_test_collection(tmpdir.mkdir("collection"))
+            ocr = OCR(col=test_col, engine="fake", use_batching=True)
+            assert ocr.use_batching is False
+            assert ocr.tesseract is None
+            assert ocr.fingerprint["engine"] == "fake" and ocr.fingerprint["engine_version"] == "1.0"
+            ocr.run_ocr_on_notes(note_ids=[1601851571572])
+            assert ocr.engine.requests
+            assert 'title="text of' in "".join(test_col.get_note(1601851571572).fields)
+        finally:
+            del ENGINES["fake"]
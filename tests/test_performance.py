@@ -5,14 +5,14 @@ import pytest
 
 
 import os
-import tempfile
 import time
-from typing import List, Tuple
+from typing import List
 
 from rich.console import Console
 
 from anki_ocr import pytesseract
 from anki_ocr import TESTDATA_DIR
+from anki_ocr.engines import OCRRequest
 from anki_ocr.ocr import OCR
 from anki_ocr.utils import batch
 
@@ -30,37 +30,37 @@ def timeit(func, *args, **kwargs):
     return result, te - ts
 
 
-def gen_batched_txts(img_pths: List[Path], batch_size: int) -> Tuple[List[Path], tempfile.TemporaryDirectory]:
-    batched_txts_dir = tempfile.TemporaryDirectory()  # Need to return so we can cleanup later
-    batched_txts = []
-    for i, batched_img_pths in enumerate(batch(img_pths, batch_size)):
-        batch_txt_pth = Path(batched_txts_dir.name, f"batch_imgs_{i}.txt")
-        batch_txt_pth.write_text("\n".join([str(i) for i in batched_img_pths]))
-        batched_txts.append(batch_txt_pth)
-
-    return batched_txts, batched_txts_dir
+def gen_batched_requests(img_pths: List[Path], batch_size: int) -> List[OCRRequest]:
+    return [
+        OCRRequest(key=f"batch_{i}", images=[str(p) for p in batched_img_pths])
+        for i, batched_img_pths in enumerate(batch(img_pths, batch_size))
+    ]
 
 
 @pytest.mark.skip
+@pytest.mark.usefixtures("tesseract_cmd")
 class TestPerformance:
     test_img_pths = list(Path(TESTDATA_DIR, "annotated_imgs").glob("*"))
-    tesseract_cmd = OCR.path_to_tesseract()
-    pytesseract.tesseract_cmd = tesseract_cmd
     IMG_PTHS = [img_pth.absolute() for img_pth in IMGS_DIR.glob("*.png")]
     NUM_IMGS = len(IMG_PTHS)
-    TXT_PATH = Path(IMGS_DIR, "imgs.txt")
-    TXT_PATH.write_text("\n".join([str(i) for i in IMG_PTHS]))
     BATCH_SIZE = 10
     console.log(f"BATCH_SIZE : {BATCH_SIZE}")
     console.log(f"Number of images = {len(IMG_PTHS)}")
-    batched_txts, batched_txts_dir = gen_batched_txts(img_pths=IMG_PTHS, batch_size=BATCH_SIZE)
-    console.log(f"Generated {len(batched_txts)} batches of max {BATCH_SIZE} images")
+    batched_requests = gen_batched_requests(img_pths=IMG_PTHS, batch_size=BATCH_SIZE)
+    console.log(f"Generated {len(batched_requests)} batches of max {BATCH_SIZE} images")
+
+    @pytest.fixture(autouse=True)
+    def imgs_txt(self, tmp_path) -> Path:
+        """The list of images, for passing to tesseract as a single input"""
+        txt_path = tmp_path / "imgs.txt"
+        txt_path.write_text("\n".join([str(i) for i in self.IMG_PTHS]))
+        return txt_path
 
     def test_batched_single_threaded(self):
         console.print("Starting batched single threaded")
 
         ocr = OCR(col=None, progress=None, languages=["eng"], num_threads=1, use_batching=True)
-        _, time_taken = timeit(ocr._ocr_batch_process, self.batched_txts)
+        _, time_taken = timeit(ocr._ocr_batch_process, self.batched_requests)
         try:
             console.print(f"OMP_THREAD_LIMIT = {os.environ['OMP_THREAD_LIMIT']}")
         except KeyError:
@@ -71,7 +71,7 @@ class TestPerformance:
         console.print("Starting batched multi threaded")
 
         ocr = OCR(col=None, progress=None, languages=["eng"], num_threads=4, use_batching=True)
-        _, time_taken = timeit(ocr._ocr_batch_process, self.batched_txts)
+        _, time_taken = timeit(ocr._ocr_batch_process, self.batched_requests)
         try:
             console.print(f"OMP_THREAD_LIMIT = {os.environ['OMP_THREAD_LIMIT']}")
         except KeyError:
@@ -102,6 +102,7 @@ class TestPerformance:
 
 
 if __name__ == "__main__":
+    pytesseract.tesseract_cmd = OCR.path_to_tesseract()
     perf_test = TestPerformance()
 
     time_batched_single = perf_test.test_batched_single_threaded()
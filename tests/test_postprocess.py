@@ -0,0 +1,39 @@
+import re
+from pathlib import Path
+
+from anki_ocr import TESTDATA_DIR
+from anki_ocr.postprocess import DEFAULT_CLEANER, TextCleaner
+
+# Real tesseract output for the annotated images, joined into batches the way tesseract returns them
+CORPUS = [p.read_text(encoding="utf-8") for p in sorted(Path(TESTDATA_DIR, "annotated_imgs").glob("*.txt"))]
+
+
+def legacy_clean(ocr_text: str) -> str:
+    """The cleaning previously done by OCR.clean_ocr_text"""
+    cleaned_text = "\n".join([line.strip() for line in ocr_text.splitlines() if line.strip() != ""])
+    cleaned_text = re.sub(":+", ":", cleaned_text)
+    return cleaned_text
+
+
+class TestTextCleaner:
+    def test_matches_legacy_cleaning_on_corpus(self):
+        for text in CORPUS:
+            padded = "  " + text.replace("\n", " \n\n\t") + "\n\u000C"
+            assert DEFAULT_CLEANER.clean(padded) == legacy_clean(padded)
+
+    def test_ligatures_and_unicode_normalized(self):
+        assert DEFAULT_CLEANER.clean("ﬁrst ﬂow\ncafé") == "first flow\ncafé"
+        assert TextCleaner(normalize_unicode=False).clean("ﬁrst") == "ﬁrst"
+
+    def test_join_hyphenated_words(self):
+        cleaner = TextCleaner(join_hyphenated_words=True)
+        assert cleaner.clean("Respira-  \ntory bronchiole") == "Respiratory bronchiole"
+        # Only words are joined, not numbers or dashes at the end of a line
+        assert cleaner.clean("pages 10-\n12\nwait -\nwhat") == "pages 10-\n12\nwait -\nwhat"
+
+    def test_collapse_whitespace(self):
+        assert TextCleaner(collapse_whitespace=True).clean("Left   atrium \t right\n") == "Left atrium right"
+        assert DEFAULT_CLEANER.clean("Left   atrium") == "Left   atrium"
+
+    def test_colons_kept(self):
+        assert TextCleaner(collapse_colons=False).clean("a :: b") == "a :: b"
@@ -0,0 +1,103 @@
+import pytest
+
+from anki_ocr.progress_reporter import ProgressReporter, format_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeProgress:
+    def __init__(self, want_cancel=False):
+        self.updates = []
+        self.cancel = want_cancel
+
+    def update(self, value, max, label):
+        self.updates.append((value, max, label))
+
+    def want_cancel(self):
+        return self.cancel
+
+
+class FakePbar:
+    def __init__(self, total, desc):
+        self.total, self.desc, self.n, self.closed = total, desc, 0, False
+
+    def update(self, n):
+        self.n += n
+
+    def set_postfix_str(self, s, refresh=True):
+        self.postfix = s
+
+    def close(self):
+        self.closed = True
+
+
+class TestProgressReporter:
+    def test_updates_rate_limited(self):
+        clock, progress = FakeClock(), FakeProgress()
+        reporter = ProgressReporter(progress, update_interval=0.1, clock=clock)
+        reporter.start_stage("Running OCR", total_items=100)
+        for _ in range(50):
+            clock.now += 0.01
+            reporter.advance()
+        # One update when the stage started, then about one every 10 images
+        assert 5 <= len(progress.updates) <= 7
+        assert progress.updates[-1][0] < 50
+
+    def test_last_item_always_shown(self):
+        clock, progress = FakeClock(), FakeProgress()
+        reporter = ProgressReporter(progress, update_interval=10, clock=clock)
+        reporter.start_stage("Running OCR", total_items=3)
+        for _ in range(3):
+            reporter.advance()
+        assert progress.updates[-1][:2] == (3, 3)
+
+    def test_eta_from_costs(self):
+        clock, progress = FakeClock(), FakeProgress()
+        reporter = ProgressReporter(progress, update_interval=0.1, clock=clock)
+        reporter.start_stage("Running OCR", total_items=3, total_cost=400)
+        clock.now += 1
+        reporter.advance(cost=100)  # 100 pixels/s, 300 left
+        assert reporter.eta_secs == pytest.approx(3)
+        assert reporter.items_per_sec == pytest.approx(1)
+        assert progress.updates[-1][2] == "Running OCR... 1/3, 1.0 images/s, about 3 s left"
+
+    def test_rate_smoothed(self):
+        clock = FakeClock()
+        reporter = ProgressReporter(update_interval=0, clock=clock)
+        reporter.start_stage("Running OCR", total_items=10)
+        clock.now += 1
+        reporter.advance()
+        clock.now += 0.1
+        reporter.advance()  # 10 images/s, but only partly taken into account
+        assert 1 < reporter.items_per_sec < 10
+
+    def test_cancel(self):
+        clock = FakeClock()
+        reporter = ProgressReporter(FakeProgress(want_cancel=True), ask_cancel=lambda: True, clock=clock)
+        reporter.start_stage("Running OCR", total_items=2)
+        with pytest.raises(RuntimeError, match="Cancelled"):
+            clock.now += 1
+            reporter.advance()
+
+    def test_pbar(self):
+        clock = FakeClock()
+        pbars = []
+        reporter = ProgressReporter(pbar_factory=lambda **kw: pbars.append(FakePbar(**kw)) or pbars[-1], clock=clock)
+        reporter.start_stage("Running OCR", total_items=4)
+        for _ in range(4):
+            clock.now += 1
+            reporter.advance()
+        reporter.start_stage("Saving notes")
+        assert pbars[0].n == 4 and pbars[0].closed
+        assert len(pbars) == 1  # No bar for stages without items
+
+    def test_format_duration(self):
+        assert format_duration(5.4) == "5 s"
+        assert format_duration(125) == "2 min 5 s"
+        assert format_duration(7260) == "2 h 1 min"
@@ -0,0 +1,34 @@
+from anki_ocr.removal import remove_ocr_titles
+
+
+class TestRemoveOCRTitles:
+    def test_title_removed(self):
+        field = '<div>Heart <img data-ocr="" src="heart.png" title="Left atrium\nRight atrium"></div>'
+        assert remove_ocr_titles(field) == '<div>Heart <img src="heart.png"></div>'
+
+    def test_only_img_tags_modified(self):
+        field = '<a href="x" title="link" data-ocr>link</a><img title=\'ocr\' data-ocr="" src="a.png"/>'
+        assert remove_ocr_titles(field) == '<a href="x" title="link" data-ocr>link</a><img src="a.png"/>'
+
+    def test_quoted_gt_and_title_in_other_attrs(self):
+        field = '<img alt="title=kept" title="a > b" data-ocr="" src="a.png">text after'
+        assert remove_ocr_titles(field) == '<img alt="title=kept" src="a.png">text after'
+
+    def test_unquoted_and_uppercase_title(self):
+        assert remove_ocr_titles("<IMG TITLE=ocr DATA-OCR src=a.png>") == "<IMG src=a.png>"
+
+    def test_unchanged_without_marker(self):
+        field = '<img src="a.png"> some text'
+        assert remove_ocr_titles(field) is field
+
+    def test_user_titles_kept(self):
+        field = '<img src="a.png" title="My caption"><img data-ocr="" src="b.png" title="OCR">'
+        assert remove_ocr_titles(field) == '<img src="a.png" title="My caption"><img src="b.png">'
+
+    def test_unsupported_images_kept(self):
+        field = '<img src="a.gif" title="Animated" data-ocr=""><img src="b" title="No extension" data-ocr="">'
+        assert remove_ocr_titles(field) == field
+
+    def test_word_boxes_removed(self):
+        field = '<img src="a.png" title="Left" data-ocr="" data-ocr-words=\'[["Left", 1, 2, 3, 4]]\'>'
+        assert remove_ocr_titles(field) == '<img src="a.png">'
@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from anki_ocr.governor import ResourceBudget, ResourceGovernor
+from anki_ocr.runner import TesseractRunner
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+BATCH_IMGS = sorted(str(p.absolute()) for p in Path(TESTDATA_DIR, "batch_imgs").glob("*.png"))[:8]
+
+
+@pytest.mark.usefixtures("tesseract_cmd")
+class TestTesseractRunner:
+    def test_concurrent_matches_sequential(self):
+        sequential = TesseractRunner(max_concurrency=1).run(BATCH_IMGS, lang="eng")
+        concurrent = TesseractRunner(max_concurrency=4).run(BATCH_IMGS, lang="eng")
+        assert sequential.keys() == set(BATCH_IMGS)
+        assert concurrent == sequential
+
+    def test_on_result_called_per_input(self):
+        calls = []
+        TesseractRunner(max_concurrency=2).run(
+            BATCH_IMGS, lang="eng", on_result=lambda i, text, done, total: calls.append((i, done, total))
+        )
+        assert sorted(c[0] for c in calls) == BATCH_IMGS
+        assert [c[1] for c in calls] == list(range(1, len(BATCH_IMGS) + 1))
+
+    def test_raising_in_callback_cancels_run(self):
+        def on_result(*_):
+            raise RuntimeError("Cancelled processing")
+
+        with pytest.raises(RuntimeError, match="Cancelled"):
+            TesseractRunner(max_concurrency=2).run(BATCH_IMGS, lang="eng", on_result=on_result)
+
+    def test_cancelled_before_run_starts(self):
+        runner = TesseractRunner(max_concurrency=2)
+        runner.cancel()
+        with pytest.raises(RuntimeError, match="cancelled"):
+            runner.run(BATCH_IMGS[:2], lang="eng")
+        runner.reset()
+        assert sorted(runner.run(BATCH_IMGS[:2], lang="eng")) == sorted(BATCH_IMGS[:2])
+
+    def test_deadline_stops_starting_inputs(self):
+        clock = iter([0, 0, 0, 10, 10, 10, 10, 10, 10, 10])
+        governor = ResourceGovernor(ResourceBudget(deadline_secs=5), clock=lambda: next(clock, 10))
+        governor.start()
+        results = TesseractRunner(max_concurrency=1, governor=governor).run(BATCH_IMGS, lang="eng")
+        assert list(results) == BATCH_IMGS[:2]
+        assert governor.deadline_reached
+
+    def test_held_back_workers_finish_when_inputs_run_out(self):
+        # Only one worker is ever allowed to run, the others must stop waiting once it has run every input
+        governor = ResourceGovernor(ResourceBudget(max_cores=4), load_func=lambda: float(os.cpu_count() or 1))
+        results = TesseractRunner(max_concurrency=4, governor=governor).run(BATCH_IMGS[:2], lang="eng")
+        assert list(results) == BATCH_IMGS[:2]
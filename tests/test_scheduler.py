@@ -0,0 +1,35 @@
+from anki_ocr.api import OCRImage
+from anki_ocr.scheduler import DEFAULT_IMAGE_PIXELS, plan_jobs
+
+SIZES = {"big.png": (4000, 3000), "huge.png": (8000, 6000), "a.png": (100, 100), "b.png": (200, 100)}
+
+
+def make_image(src: str) -> OCRImage:
+    return OCRImage(name=src, src=src, note_id=1, field_name="Front", media_dir="")
+
+
+def size_func(path: str):
+    return next((size for src, size in SIZES.items() if path.endswith(src)), None)
+
+
+class TestPlanJobs:
+    def test_large_images_not_batched(self):
+        images = [make_image(src) for src in ["a.png", "big.png", "b.png", "huge.png"]]
+        jobs = plan_jobs(images, batch_size=5, large_image_pixels=1_000_000, size_func=size_func)
+        assert [[i.src for i in job.images] for job in jobs] == [["huge.png"], ["big.png"], ["a.png", "b.png"]]
+        assert [job.is_batch for job in jobs] == [False, False, True]
+
+    def test_most_expensive_first(self):
+        images = [make_image(src) for src in ["a.png", "b.png", "big.png", "huge.png"]]
+        jobs = plan_jobs(images, batch_size=2, size_func=size_func)
+        assert [job.cost for job in jobs] == [8000 * 6000 + 4000 * 3000, 100 * 100 + 200 * 100]
+
+    def test_unknown_size(self):
+        jobs = plan_jobs([make_image("unknown.svg")], batch_size=2, size_func=size_func)
+        assert jobs[0].cost == DEFAULT_IMAGE_PIXELS
+
+    def test_batches_split_by_language(self):
+        images = [make_image(src) for src in ["a.png", "b.png"]]
+        image_langs = {str(images[0].img_pth): "eng", str(images[1].img_pth): "rus"}
+        jobs = plan_jobs(images, batch_size=5, image_langs=image_langs, size_func=size_func)
+        assert sorted(job.lang for job in jobs) == ["eng", "rus"]
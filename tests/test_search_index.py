@@ -0,0 +1,129 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from anki_ocr import search_index
+from anki_ocr.api import OCRImage
+from anki_ocr.bundle import media_hash
+from anki_ocr.search_index import OCRSearchIndex, add_ocr_titles
+
+
+@pytest.fixture(autouse=True)
+def media_dir(tmp_path, monkeypatch):
+    """Images are indexed by the hash of their file, so each test's images are written to a media folder"""
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    monkeypatch.chdir(media_dir)
+    return media_dir
+
+
+def ocr_image(src: str, note_id: int, text: str, contents: Optional[bytes] = None) -> OCRImage:
+    img_pth = Path(src)
+    if contents is not None or not img_pth.exists():
+        img_pth.write_bytes(src.encode() if contents is None else contents)
+    return OCRImage(name=src.split(".")[0], src=src, note_id=note_id, field_name="Front", media_dir="", text=text)
+
+
+class TestOCRSearchIndex:
+    def test_search(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update(
+                [
+                    ocr_image("heart.png", 1, "Left atrium\nRight atrium"),
+                    ocr_image("heart.png", 2, "Left atrium\nRight atrium"),
+                    ocr_image("lungs.png", 3, "Primary bronchus"),
+                ]
+            )
+            assert sorted(index.search("atrium")) == [1, 2]
+            assert index.search("bronch*") == [3]
+            assert index.search("left bronchus") == []
+            assert index.search('"unbalanced') == []
+
+    def test_updated_text_replaces_old(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            index.update([ocr_image("heart.png", 1, "Aorta")])
+            assert index.search("atrium") == []
+            assert index.search("aorta") == [1]
+
+    def test_remove_notes(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium"), ocr_image("heart.png", 2, "Left atrium")])
+            assert index.remove_notes([1, 3]) == 1
+            assert index.search("atrium") == [2]
+            index.remove_notes([2])
+            assert index.search("atrium") == []
+            assert index.db.execute("select count(*) from media").fetchone()[0] == 0
+
+    def test_rewrite_search(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            assert index.rewrite_search('deck:Anatomy ocr:"left atrium"') == "deck:Anatomy nid:1"
+            assert index.rewrite_search("ocr:aorta") == "nid:0"
+            assert index.rewrite_search("front:ocr:aorta") == "front:ocr:aorta"
+
+    def test_texts_for_note(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium"), ocr_image("lungs.png", 2, "Primary bronchus")])
+            assert index.texts_for_note(1) == {"heart.png": "Left atrium"}
+            assert index.texts_for_note(3) == {}
+
+    def test_update_returns_changed_notes(self, tmp_path):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            images = [ocr_image("heart.png", 1, "Left atrium"), ocr_image("lungs.png", 2, "Bronchus")]
+            assert index.update(images) == {1, 2}
+            assert index.update(images) == set()
+            assert index.update([ocr_image("lungs.png", 2, "Primary bronchus")]) == {2}
+
+    def test_replaced_image_has_no_stale_text(self, tmp_path, media_dir):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            (media_dir / "heart.png").write_bytes(b"a different image")
+            assert index.texts_for_note(1, media_dir=str(media_dir)) == {}
+            # Once OCR'd again, only the new image's text is kept
+            assert index.update([ocr_image("heart.png", 1, "Aorta")]) == {1}
+            assert index.texts_for_note(1, media_dir=str(media_dir)) == {"heart.png": "Aorta"}
+            assert index.search("atrium") == []
+
+    def test_renamed_image_has_no_text(self, tmp_path, media_dir):
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            (media_dir / "heart.png").rename(media_dir / "heart2.png")
+            ocr_image("heart.png", 2, "", contents=b"another image")
+            assert index.texts_for_note(1, media_dir=str(media_dir)) == {}
+
+    def test_unchanged_files_not_hashed_again(self, tmp_path, media_dir, monkeypatch):
+        hashed = []
+        monkeypatch.setattr(search_index, "media_hash", lambda path: hashed.append(path) or media_hash(path))
+        with OCRSearchIndex(str(tmp_path / "index.db")) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            assert len(hashed) == 1
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            assert index.texts_for_note(1, media_dir=str(media_dir)) == {"heart.png": "Left atrium"}
+            assert len(hashed) == 1
+            # Touched but with the same contents, so only hashed to check
+            os.utime(media_dir / "heart.png", ns=(0, 0))
+            assert index.texts_for_note(1, media_dir=str(media_dir)) == {"heart.png": "Left atrium"}
+            assert len(hashed) == 2
+
+    def test_rebuilds_index_keyed_by_name(self, tmp_path):
+        db_path = str(tmp_path / "index.db")
+        with sqlite3.connect(db_path) as db:
+            db.execute("create table media (id integer primary key, name text not null unique, text text not null)")
+        with OCRSearchIndex(db_path) as index:
+            index.update([ocr_image("heart.png", 1, "Left atrium")])
+            assert index.search("atrium") == [1]
+
+
+def test_add_ocr_titles():
+    texts = {"heart.png": 'Left "atrium" & aorta', "a b.png": "Lungs"}
+    card_html = '<div><img src="heart.png"><img src="a b.png" class="x"><img src=\'other.png\'></div>'
+    assert add_ocr_titles(card_html, texts) == (
+        '<div><img title="Left &quot;atrium&quot; &amp; aorta" src="heart.png">'
+        '<img title="Lungs" src="a b.png" class="x"><img src=\'other.png\'></div>'
+    )
+    titled = '<img src="heart.png" title="Already OCR\'d">'
+    assert add_ocr_titles(titled, texts) == titled
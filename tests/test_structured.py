@@ -0,0 +1,57 @@
+from anki_ocr.pytesseract import file_to_dict
+from anki_ocr.structured import text_to_pages, tsv_to_pages
+
+HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+# Two images from one batch, the second has two paragraphs and a low confidence word
+BATCH_TSV = "\n".join(
+    [
+        HEADER,
+        "1\t1\t0\t0\t0\t0\t0\t0\t200\t100\t-1\t",
+        "2\t1\t1\t0\t0\t0\t10\t10\t150\t20\t-1\t",
+        "5\t1\t1\t1\t1\t1\t10\t10\t60\t20\t96.5\tLeft",
+        "5\t1\t1\t1\t1\t2\t80\t10\t80\t20\t91.0\tatrium",
+        "1\t2\t0\t0\t0\t0\t0\t0\t200\t100\t-1\t",
+        "5\t2\t1\t1\t1\t1\t10\t10\t60\t20\t95\tRight",
+        "5\t2\t1\t1\t2\t1\t10\t40\t60\t20\t12\t~|",
+        "5\t2\t2\t1\t1\t1\t10\t70\t60\t20\t90\tventricle",
+    ]
+)
+
+
+class TestFileToDict:
+    def test_columns(self):
+        data = file_to_dict(BATCH_TSV, "\t", -1)
+        assert data["level"][:3] == [1, 2, 5]
+        assert data["text"][2:4] == ["Left", "atrium"]
+        assert data["conf"][2] == "96.5"
+
+    def test_missing_trailing_text_padded(self):
+        data = file_to_dict(HEADER + "\n1\t1\t0\t0\t0\t0\t0\t0\t200\t100\t-1", "\t", -1)
+        assert data["text"] == [""]
+
+
+class TestTextToPages:
+    def test_split_on_form_feed(self):
+        assert [p.text for p in text_to_pages("a\n\u000Cb\n")] == ["a\n", "b\n"]
+
+
+class TestTsvToPages:
+    def test_pages_and_lines(self):
+        pages = tsv_to_pages(BATCH_TSV)
+        assert [p.text for p in pages] == ["Left atrium", "Right\n~|\n\nventricle"]
+
+    def test_min_confidence(self):
+        pages = tsv_to_pages(BATCH_TSV, min_confidence=50)
+        assert pages[1].text == "Right\n\nventricle"
+        assert [w.text for w in pages[1].words] == ["Right", "ventricle"]
+
+    def test_word_boxes(self):
+        word = tsv_to_pages(BATCH_TSV)[0].words[1]
+        assert (word.text, word.conf, word.left, word.top, word.width, word.height) == ("atrium", 91.0, 80, 10, 80, 20)
+
+    def test_empty_page_kept(self):
+        pages = tsv_to_pages(HEADER + "\n1\t1\t0\t0\t0\t0\t0\t0\t200\t100\t-1\t")
+        assert len(pages) == 1 and pages[0].text == "" and pages[0].words == []
+
+    def test_empty_output(self):
+        assert tsv_to_pages("") == []
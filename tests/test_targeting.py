@@ -0,0 +1,62 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from anki_ocr.targeting import TargetingRules, _included
+
+TESTDATA_DIR = Path(__file__).parent / "testdata"
+LAZY_FOX = TESTDATA_DIR / "annotated_imgs" / "lazy_fox.png"  # 640x480
+
+
+@pytest.mark.parametrize(
+    "name, include, exclude, expected",
+    [
+        ("Basic", [], [], True),
+        ("Basic", ["basic"], [], True),
+        ("Image Occlusion Enhanced", ["Image Occlusion*"], [], True),
+        ("Cloze", ["Image Occlusion*"], [], False),
+        ("icon_arrow.png", [], ["icon_*"], False),
+        ("icon_arrow.png", ["*.png"], ["ICON_*"], False),
+    ],
+)
+def test_included(name, include, exclude, expected):
+    assert _included(name, include, exclude) is expected
+
+
+def test_from_config():
+    assert TargetingRules.from_config({}) == TargetingRules()
+    rules = TargetingRules.from_config({"ocr_targeting": {"fields": ["Image"], "min_width": 50, "min_size": 1}})
+    assert rules == TargetingRules(fields=["Image"], min_width=50)
+    assert not rules.filters_notetypes
+    assert TargetingRules(exclude_notetypes=["Cloze"]).filters_notetypes
+
+
+def test_matches():
+    rules = TargetingRules(notetypes=["Image Occlusion*"], exclude_fields=["Back Extra"])
+    assert rules.matches_notetype("image occlusion enhanced")
+    assert not rules.matches_notetype("Cloze")
+    assert rules.matches_field("Header")
+    assert not rules.matches_field("Back Extra")
+
+
+@pytest.fixture
+def img_pth(tmp_path) -> Path:
+    return Path(shutil.copy(LAZY_FOX, tmp_path / "icon_fox.png"))
+
+
+def test_exclusion_reason(img_pth):
+    assert TargetingRules().exclusion_reason(img_pth) is None
+    assert TargetingRules(exclude_filenames=["icon_*"]).exclusion_reason(img_pth) is not None
+    assert TargetingRules(filenames=["diagram_*"]).exclusion_reason(img_pth) is not None
+    assert TargetingRules(min_bytes=img_pth.stat().st_size).exclusion_reason(img_pth) is None
+    assert TargetingRules(min_bytes=img_pth.stat().st_size + 1).exclusion_reason(img_pth) is not None
+    assert TargetingRules(min_width=640, min_height=480).exclusion_reason(img_pth) is None
+    assert "640x480" in TargetingRules(min_width=641).exclusion_reason(img_pth)
+    assert TargetingRules(min_height=481).exclusion_reason(img_pth) is not None
+
+
+def test_unreadable_size_is_kept(tmp_path):
+    not_an_image = tmp_path / "broken.png"
+    not_an_image.write_bytes(b"not an image")
+    assert TargetingRules(min_width=100, min_height=100).exclusion_reason(not_an_image) is None
@@ -0,0 +1,113 @@
+import struct
+import zlib
+from pathlib import Path
+
+import pytest
+
+from anki_ocr import TESTDATA_DIR
+from anki_ocr.image_info import image_size
+from anki_ocr.tiling import Band, band_rows, can_tile, stitch_bands, write_bands, write_png_bands
+
+HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+def word_row(line_num: int, top: int, text: str) -> str:
+    return f"5\t1\t1\t1\t{line_num}\t1\t10\t{top}\t50\t20\t95\t{text}"
+
+
+def test_image_size():
+    img_pth = Path(TESTDATA_DIR, "annotated_imgs", "lazy_fox.png")
+    assert image_size(img_pth) == (640, 480)
+    assert image_size(memoryview(img_pth.read_bytes())) == (640, 480)
+    assert image_size(Path(TESTDATA_DIR, "annotated_imgs", "lazy_fox.txt")) is None
+
+
+class TestBandRows:
+    def test_owned_rows_cover_image_once(self):
+        bands = band_rows(height=1000, band_height=400, overlap=100)
+        assert bands[0][0] == 0 and bands[-1][1] == 1000
+        owned = [(owned_top, owned_bottom) for _, _, owned_top, owned_bottom in bands]
+        assert owned[0][0] == 0 and owned[-1][1] == 1000
+        assert all(prev[1] == nxt[0] for prev, nxt in zip(owned, owned[1:]))
+        # Each band overlaps the next
+        assert all(prev[1] - nxt[0] == 100 for prev, nxt in zip(bands, bands[1:]))
+
+    def test_small_image_single_band(self):
+        assert band_rows(height=300, band_height=400, overlap=100) == [(0, 300, 0, 300)]
+
+    def test_bands_start_where_they_can(self):
+        bands = band_rows(height=1000, band_height=400, overlap=100, can_start=lambda row: row % 50 == 0)
+        assert [top for top, _, _, _ in bands] == [0, 300, 600]
+        bands = band_rows(height=900, band_height=400, overlap=100, can_start=lambda row: row in (280, 510))
+        assert bands == [(0, 400, 0, 340), (280, 680, 340, 595), (510, 900, 595, 900)]
+        with pytest.raises(ValueError):
+            band_rows(height=1000, band_height=400, overlap=100, can_start=lambda row: False)
+
+
+def test_stitch_bands_keeps_each_line_once():
+    # The second line is 280 - 300 in the image, inside the overlap of both bands
+    bands = [Band("a", 0, 350, 0, 300), Band("b", 250, 600, 300, 600)]
+    tsvs = {
+        "a": "\n".join([HEADER, word_row(1, 10, "First"), word_row(2, 270, "Second"), word_row(3, 330, "Cut")]),
+        "b": "\n".join([HEADER, word_row(1, 20, "Second"), word_row(2, 80, "Third")]),
+    }
+    page = stitch_bands(bands, tsvs)
+    assert page.text == "First\nSecond\nThird"
+    assert [w.top for w in page.words] == [10, 270, 330]
+
+
+def write_png(path: Path, rows: list, width: int, row_filter: int):
+    """Writes a greyscale PNG, storing each row with the given filter type but unchanged, which is valid for all-zero
+    rows with any filter"""
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    data = b"".join(bytes([row_filter]) + row for row in rows)
+    ihdr = struct.pack(">IIBBBBB", width, len(rows), 8, 0, 0, 0, 0)
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(data)) + chunk(b"IEND", b"")
+    )
+
+
+class TestWritePNGBands:
+    def test_bands_match_image(self, tmp_path):
+        from aqt.qt import QImage
+
+        # Palette images are stored unfiltered, so bands can start at any row
+        img_pth = tmp_path / "lazy_fox.png"
+        png = QImage(str(Path(TESTDATA_DIR, "annotated_imgs", "lazy_fox.png")))
+        assert png.convertToFormat(QImage.Format.Format_Indexed8).save(str(img_pth))
+        bands = write_png_bands(str(img_pth), str(tmp_path), max_pixels=640 * 200, overlap=50)
+        assert [(b.top, b.bottom) for b in bands] == [(0, 200), (150, 350), (300, 480)]
+        image = QImage(str(img_pth)).convertToFormat(QImage.Format.Format_ARGB32)
+        for band in bands:
+            band_image = QImage(band.path).convertToFormat(QImage.Format.Format_ARGB32)
+            assert band_image == image.copy(0, band.top, 640, band.bottom - band.top)
+
+    def test_rows_relative_to_the_row_above_not_split(self, tmp_path):
+        img_pth = tmp_path / "up.png"
+        write_png(img_pth, [bytes(100)] * 500, width=100, row_filter=2)  # Up
+        assert write_png_bands(str(img_pth), str(tmp_path), max_pixels=100 * 200, overlap=50) is None
+        write_png(img_pth, [bytes(100)] * 500, width=100, row_filter=1)  # Sub
+        assert len(write_png_bands(str(img_pth), str(tmp_path), max_pixels=100 * 200, overlap=50)) == 3
+
+    def test_not_png(self, tmp_path):
+        img_pth = tmp_path / "lazy_fox.jpg"
+        img_pth.write_bytes(b"\xff\xd8\xff")
+        assert write_png_bands(str(img_pth), str(tmp_path), max_pixels=100, overlap=10) is None
+
+
+def test_write_bands(tmp_path):
+    from aqt.qt import QImage, QImageReader
+
+    png_pth = str(Path(TESTDATA_DIR, "annotated_imgs", "lazy_fox.png"))
+    img_pth = str(tmp_path / "lazy_fox.jpg")
+    assert QImage(png_pth).save(img_pth)
+    assert can_tile(img_pth) and not can_tile(png_pth)
+
+    allocation_limit = QImageReader.allocationLimit()
+    bands = write_bands(img_pth, str(tmp_path), size=(640, 480), max_pixels=640 * 200, overlap=50)
+    assert len(bands) == 3
+    assert [image_size(b.path) for b in bands] == [(640, b.bottom - b.top) for b in bands]
+    assert QImageReader.allocationLimit() == allocation_limit
@@ -0,0 +1,84 @@
+import sys
+
+import pytest
+
+from anki_ocr.ocr import OCR
+from anki_ocr.tuning import (
+    TunedSettings,
+    Trial,
+    calibrate,
+    machine_stamp,
+    pick_best,
+    sample_images,
+    tuning_grid,
+)
+from tests.fake_tesseract import FAKE_TESSERACT
+from tests.collection import gen_test_collection
+
+STAMP = {"engine": "tesseract", "engine_version": "5.3.0", "cpu_count": 8, "machine": "laptop"}
+
+
+class TestTunedSettings:
+    def test_config_round_trip(self):
+        config = {}
+        tuned = TunedSettings(num_threads=4, batch_size=10, stamp=STAMP, images_per_sec=3.5, trials=[Trial(4, 10, 3.5)])
+        tuned.to_config(config)
+        assert TunedSettings.from_config(config, "tesseract") == tuned
+        assert TunedSettings.from_config(config, "other") is None
+
+    def test_apply(self):
+        config = {"num_threads": 2, "use_multithreading": False, "batch_size": 5, "use_batching": True}
+        TunedSettings(num_threads=4, batch_size=1, stamp=STAMP).apply(config)
+        assert config == {"num_threads": 4, "use_multithreading": True, "batch_size": 5, "use_batching": False}
+
+    @pytest.mark.parametrize("changed", [{"engine_version": "5.4.0"}, {"cpu_count": 16}, {"machine": "desktop"}])
+    def test_stale_when_machine_changes(self, changed):
+        tuned = TunedSettings(num_threads=4, batch_size=10, stamp=STAMP)
+        assert tuned.is_current(dict(STAMP))
+        assert not tuned.is_current({**STAMP, **changed})
+
+    def test_machine_stamp(self):
+        stamp = machine_stamp("tesseract", "5.3.0")
+        assert stamp["cpu_count"] >= 1 and stamp["engine_version"] == "5.3.0"
+
+
+class TestCalibration:
+    def test_grid(self):
+        grid = tuning_grid(cpu_count=8, batch_sizes=[1, 10])
+        assert [(t.num_threads, t.batch_size) for t in grid] == [(1, 1), (1, 10), (4, 1), (4, 10), (8, 1), (8, 10)]
+        assert len(tuning_grid(cpu_count=1, batch_sizes=[1])) == 1
+
+    def test_pick_best(self):
+        trials = [Trial(1, 10, 2.0, 200), Trial(4, 10, 6.0, 700), Trial(8, 10, 6.2, 1300), Trial(8, 1, 5.0, 1200)]
+        # 8 workers are barely faster than 4, so 4 is picked
+        assert pick_best(trials) == trials[1]
+        assert pick_best(trials, max_memory_mb=500) == trials[0]
+        assert pick_best(trials, max_memory_mb=100) == trials[1]  # Nothing fits, so the fastest
+
+    @pytest.mark.skipif(sys.platform.startswith("win32"), reason="The fake tesseract is a Python script")
+    def test_calibrate_with_collection_images(self, tmpdir, monkeypatch):
+        monkeypatch.setenv("FAKE_TESSERACT_LATENCY", "0.01")
+        test_col = gen_test_collection(tmpdir.mkdir("collection"))
+        img_pths = sample_images(test_col, num_images=4)
+        assert 0 < len(img_pths) == len(set(img_pths)) <= 4
+
+        def ocr_factory(num_threads: int, batch_size: int) -> OCR:
+            return OCR(
+                col=test_col,
+                tesseract_exec_pth=FAKE_TESSERACT,
+                num_threads=num_threads,
+                use_multithreading=True,
+                batch_size=batch_size,
+                use_batching=batch_size > 1,
+            )
+
+        grid = tuning_grid(cpu_count=2, batch_sizes=[1, 2])
+        tuned = calibrate(ocr_factory, img_pths, STAMP, grid=grid)
+        assert {(t.num_threads, t.batch_size) for t in tuned.trials} <= {(t.num_threads, t.batch_size) for t in grid}
+        assert all(t.images_per_sec > 0 for t in tuned.trials)
+        assert (tuned.num_threads, tuned.batch_size) in {(t.num_threads, t.batch_size) for t in tuned.trials}
+        assert tuned.stamp == STAMP
+
+    def test_calibrate_without_images(self):
+        with pytest.raises(ValueError, match="No images"):
+            calibrate(lambda *_: None, [], STAMP)
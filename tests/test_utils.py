@@ -0,0 +1,16 @@
+from anki_ocr.utils import AnkiOCRLogger, create_logger, create_ocr_logger
+
+
+def test_ocr_logger_only_shows_warnings():
+    ocr_logger = create_ocr_logger()
+    handler = ocr_logger.handlers[-1]
+    assert isinstance(handler, AnkiOCRLogger)
+    try:
+        child_logger = create_logger("anki_ocr.test_utils")
+        child_logger.info("Processed 3 images")
+        child_logger.warning("Could not read image.png")
+        log_messages = handler.flush()
+        assert "Could not read image.png" in log_messages
+        assert "Processed 3 images" not in log_messages
+    finally:
+        ocr_logger.removeHandler(handler)
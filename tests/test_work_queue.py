@@ -0,0 +1,46 @@
+from anki_ocr.work_queue import OCRWorkQueue, needs_ocr
+
+
+class TestNeedsOCR:
+    def test_untitled_image(self):
+        assert needs_ocr('Heart<img src="heart.png">')
+
+    def test_already_ocrd(self):
+        assert not needs_ocr('<img src="heart.png" title="Left atrium">\x1f<img title="" src=\'lungs.jpg\'>')
+
+    def test_one_of_many_untitled(self):
+        assert needs_ocr('<img src="heart.png" title="Left atrium"><img src=lungs.JPG>')
+
+    def test_unsupported_formats_ignored(self):
+        assert not needs_ocr('<img src="diagram.svg"><img alt="no src">')
+
+    def test_text_stored_elsewhere(self):
+        flds = '<img src="heart.png">\x1f<img src="lungs.jpg" title="User caption">'
+        assert not needs_ocr(flds, has_text={"heart.png", "lungs.jpg"}.__contains__)
+        assert needs_ocr(flds, has_text={"heart.png"}.__contains__)
+
+
+class TestOCRWorkQueue:
+    def test_add_dedupes(self, tmp_path):
+        queue = OCRWorkQueue(str(tmp_path / "queue.json"))
+        assert queue.add([3, 1, 3]) == 2
+        assert queue.add([1, 2]) == 1
+        assert queue.peek(10) == [3, 1, 2]
+        assert queue.peek(2) == [3, 1]
+
+    def test_persisted(self, tmp_path):
+        path = str(tmp_path / "queue.json")
+        queue = OCRWorkQueue(path)
+        queue.add([1, 2, 3])
+        queue.remove([2])
+        queue.last_scan = 1234
+        queue.save()
+
+        reloaded = OCRWorkQueue(path)
+        assert reloaded.note_ids == [1, 3]
+        assert reloaded.last_scan == 1234
+
+    def test_corrupt_file_ignored(self, tmp_path):
+        path = tmp_path / "queue.json"
+        path.write_text("{not json")
+        assert len(OCRWorkQueue(str(path))) == 0